@@ -0,0 +1,102 @@
+# Copyright (c) 2026 Tulir Asokan
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+"""
+Compare the bulk device and Olm session lookups used when sharing a group session against the
+old one-query-per-user/device lookups (the default CryptoStore implementations), using the
+SQLite crypto store.
+
+Usage: python -m benchmarks.crypto_store_lookups [--iterations N] [--users N] [--devices N]
+"""
+
+from __future__ import annotations
+
+from typing import Awaitable, Callable
+import argparse
+import asyncio
+import tempfile
+import time
+
+from mautrix.crypto import OlmAccount
+from mautrix.crypto.store import CryptoStore, PgCryptoStore
+from mautrix.types import DeviceID, DeviceIdentity, IdentityKey, TrustState, UserID
+from mautrix.util.async_db import Database
+
+
+async def fill_store(
+    store: PgCryptoStore, users: int, devices: int
+) -> tuple[list[UserID], list[IdentityKey]]:
+    own_account = OlmAccount()
+    user_ids = []
+    keys = []
+    for i in range(users):
+        user_id = UserID(f"@user{i}:example.com")
+        user_devices = {}
+        for j in range(devices):
+            account = OlmAccount()
+            account.generate_one_time_keys(1)
+            otk = next(iter(account.one_time_keys["curve25519"].values()))
+            session = own_account.new_outbound_session(account.identity_key, otk)
+            await store.add_session(account.identity_key, session)
+            device_id = DeviceID(f"DEVICE{j}")
+            user_devices[device_id] = DeviceIdentity(
+                user_id=user_id,
+                device_id=device_id,
+                identity_key=account.identity_key,
+                signing_key=account.signing_key,
+                trust=TrustState.UNVERIFIED,
+                deleted=False,
+                name="",
+            )
+            keys.append(account.identity_key)
+        await store.put_devices(user_id, user_devices)
+        user_ids.append(user_id)
+    return user_ids, keys
+
+
+async def run(name: str, iterations: int, fn: Callable[[], Awaitable[None]]) -> None:
+    start = time.perf_counter()
+    for _ in range(iterations):
+        await fn()
+    duration = time.perf_counter() - start
+    print(f"{name}: {duration / iterations * 1000:.2f} ms per lookup")
+
+
+async def main(iterations: int, users: int, devices: int) -> None:
+    with tempfile.TemporaryDirectory() as tmpdir:
+        db = Database.create(
+            f"sqlite:{tmpdir}/bench.db", upgrade_table=PgCryptoStore.upgrade_table
+        )
+        store = PgCryptoStore("", "bench", db)
+        await db.start()
+        print(f"Creating {users} users with {devices} devices each...")
+        user_ids, keys = await fill_store(store, users, devices)
+
+        async def old_devices() -> None:
+            await CryptoStore.get_devices_many(store, user_ids)
+
+        async def new_devices() -> None:
+            await store.get_devices_many(user_ids)
+
+        async def old_sessions() -> None:
+            await CryptoStore.get_latest_sessions(store, keys)
+
+        async def new_sessions() -> None:
+            await store.get_latest_sessions(keys)
+
+        await run("devices, one query per user", iterations, old_devices)
+        await run("devices, bulk query", iterations, new_devices)
+        await run("sessions, one query per device", iterations, old_sessions)
+        await run("sessions, bulk query", iterations, new_sessions)
+        await db.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=20)
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--devices", type=int, default=2)
+    args = parser.parse_args()
+    asyncio.run(main(args.iterations, args.users, args.devices))
@@ -0,0 +1,60 @@
+# Copyright (c) 2026 Tulir Asokan
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+"""
+Measure the time and memory it takes to create and keep IntentAPI instances for many ghost users.
+The script only uses the public API, so it can be run against older versions to compare, e.g. one
+from before the ensure_registered/ensure_joined wrappers were applied at class level:
+
+    git checkout <old revision> -- mautrix/appservice/api/intent.py
+    python -m benchmarks.intent_creation
+    git checkout HEAD -- mautrix/appservice/api/intent.py
+
+Usage: python -m benchmarks.intent_creation [--iterations N]
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import logging
+import time
+import tracemalloc
+
+from mautrix.appservice import AppServiceAPI, IntentAPI
+from mautrix.types import UserID
+
+
+async def main(iterations: int) -> None:
+    api = AppServiceAPI(
+        "https://example.com",
+        bot_mxid=UserID("@bot:example.com"),
+        token="token",
+        log=logging.getLogger("mau.bench"),
+    )
+    bot = api.bot_intent()
+    child_apis = [api.user(UserID(f"@ghost{i}:example.com")) for i in range(100)]
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    intents = [
+        IntentAPI(UserID(f"@ghost{i}:example.com"), child_apis[i % len(child_apis)], bot)
+        for i in range(iterations)
+    ]
+    duration = time.perf_counter() - start
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(
+        f"Created {len(intents):,} intents in {duration:.2f} seconds "
+        f"({duration / len(intents) * 1_000_000:.1f} µs each), "
+        f"using {current / 1024 / 1024:.1f} MiB (peak {peak / 1024 / 1024:.1f} MiB)"
+    )
+    await api.session.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=100_000)
+    asyncio.run(main(parser.parse_args().iterations))
@@ -0,0 +1,128 @@
+# Copyright (c) 2026 Tulir Asokan
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+"""
+Compare Megolm decryption throughput with the per-room decryption locks against a single global
+lock (the old behavior), when events from many rooms arrive at once. The crypto store adds a
+small delay to each group session lookup to simulate a database round trip.
+
+Usage: python -m benchmarks.megolm_decrypt [--iterations N] [--rooms N] [--store-delay SEC]
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import time
+import warnings
+
+from mautrix.client import Client
+from mautrix.client.state_store import MemoryStateStore
+from mautrix.crypto import InboundGroupSession, OlmAccount, OlmMachine, OutboundGroupSession
+from mautrix.crypto.store import MemoryCryptoStore
+from mautrix.types import (
+    DeviceID,
+    EncryptedEvent,
+    EncryptedMegolmEventContent,
+    EventID,
+    EventType,
+    RoomID,
+    SessionID,
+    UserID,
+)
+
+USER_ID = UserID("@user:example.com")
+DEVICE_ID = DeviceID("DEVICE")
+
+
+class DelayedCryptoStore(MemoryCryptoStore):
+    def __init__(self, delay: float) -> None:
+        super().__init__(USER_ID, "pickle key")
+        self.delay = delay
+
+    async def get_group_session(
+        self, room_id: RoomID, session_id: SessionID
+    ) -> InboundGroupSession:
+        await asyncio.sleep(self.delay)
+        return await super().get_group_session(room_id, session_id)
+
+
+class GlobalLock:
+    """Hands out the same lock for every room, like the old single decryption lock."""
+
+    def __init__(self) -> None:
+        self.lock = asyncio.Lock()
+
+    def __getitem__(self, _: RoomID) -> asyncio.Lock:
+        return self.lock
+
+
+async def make_events(
+    machine: OlmMachine, rooms: int, per_room: int, prefix: str
+) -> list[EncryptedEvent]:
+    events = []
+    for i in range(rooms):
+        room_id = RoomID(f"!{prefix}{i}:example.com")
+        outbound = OutboundGroupSession(room_id)
+        outbound.shared = True
+        inbound = InboundGroupSession(
+            session_key=outbound.session_key,
+            signing_key=machine.account.signing_key,
+            sender_key=machine.account.identity_key,
+            room_id=room_id,
+        )
+        await machine.crypto_store.put_group_session(
+            room_id, inbound.sender_key, SessionID(inbound.id), inbound
+        )
+        for j in range(per_room):
+            payload = {"room_id": room_id, "type": "m.room.message", "content": {"body": f"{j}"}}
+            events.append(
+                EncryptedEvent(
+                    room_id=room_id,
+                    event_id=EventID(f"${prefix}{i}_{j}"),
+                    sender=USER_ID,
+                    timestamp=j,
+                    type=EventType.ROOM_ENCRYPTED,
+                    content=EncryptedMegolmEventContent(
+                        ciphertext=outbound.encrypt(json.dumps(payload)),
+                        session_id=SessionID(outbound.id),
+                        sender_key=machine.account.identity_key,
+                        device_id=DEVICE_ID,
+                    ),
+                )
+            )
+    return events
+
+
+async def run(name: str, machine: OlmMachine, events: list[EncryptedEvent]) -> None:
+    start = time.perf_counter()
+    await asyncio.gather(*(machine.decrypt_megolm_event(evt) for evt in events))
+    duration = time.perf_counter() - start
+    print(f"{name}: {len(events) / duration:,.0f} events/second")
+
+
+async def main(iterations: int, rooms: int, store_delay: float) -> None:
+    warnings.simplefilter("ignore", DeprecationWarning)
+    client = Client(USER_ID, DEVICE_ID, base_url="https://example.com", token="token")
+    machine = OlmMachine(client, DelayedCryptoStore(store_delay), MemoryStateStore())
+    machine.account = OlmAccount()
+    per_room = max(iterations // rooms, 1)
+
+    per_room_locks = machine._megolm_decrypt_locks
+    machine._megolm_decrypt_locks = GlobalLock()
+    await run("global lock", machine, await make_events(machine, rooms, per_room, "old"))
+    machine._megolm_decrypt_locks = per_room_locks
+    await run("per-room locks", machine, await make_events(machine, rooms, per_room, "new"))
+    await client.api.session.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=2000)
+    parser.add_argument("--rooms", type=int, default=50)
+    parser.add_argument("--store-delay", type=float, default=0.001)
+    args = parser.parse_args()
+    asyncio.run(main(args.iterations, args.rooms, args.store_delay))
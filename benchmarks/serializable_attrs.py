@@ -0,0 +1,89 @@
+# Copyright (c) 2026 Tulir Asokan
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+"""
+Measure event (de)serialization throughput of SerializableAttrs. The script only uses the public
+API, so it can be run against older versions to compare, e.g. one from before the per-class
+field info and per-type (de)serializer caches were added:
+
+    git checkout <old revision> -- mautrix/types/util/serializable_attrs.py
+    python -m benchmarks.serializable_attrs
+    git checkout HEAD -- mautrix/types/util/serializable_attrs.py
+
+Usage: python -m benchmarks.serializable_attrs [--iterations N]
+"""
+
+from __future__ import annotations
+
+from typing import Any
+import argparse
+import time
+
+from mautrix.types import Event
+
+EVENTS: list[dict[str, Any]] = [
+    {
+        "type": "m.room.message",
+        "room_id": "!room:example.com",
+        "event_id": "$message",
+        "sender": "@user:example.com",
+        "origin_server_ts": 1700000000000,
+        "unsigned": {"age": 1234, "transaction_id": "txn"},
+        "content": {
+            "msgtype": "m.text",
+            "body": "> <@other:example.com> hello\n\nworld",
+            "format": "org.matrix.custom.html",
+            "formatted_body": "<mx-reply>...</mx-reply><b>world</b>",
+            "m.relates_to": {"m.in_reply_to": {"event_id": "$parent"}},
+            "m.mentions": {"user_ids": ["@other:example.com"]},
+        },
+    },
+    {
+        "type": "m.room.member",
+        "room_id": "!room:example.com",
+        "event_id": "$member",
+        "sender": "@user:example.com",
+        "state_key": "@user:example.com",
+        "origin_server_ts": 1700000000000,
+        "content": {"membership": "join", "displayname": "User", "avatar_url": "mxc://a/b"},
+        "unsigned": {"prev_content": {"membership": "invite"}},
+    },
+    {
+        "type": "m.reaction",
+        "room_id": "!room:example.com",
+        "event_id": "$reaction",
+        "sender": "@user:example.com",
+        "origin_server_ts": 1700000000000,
+        "content": {
+            "m.relates_to": {"rel_type": "m.annotation", "event_id": "$message", "key": "👍"}
+        },
+    },
+]
+
+
+def main(iterations: int) -> None:
+    # Warm up any caches before measuring
+    for data in EVENTS:
+        Event.deserialize(data).serialize()
+    deserialize_time = serialize_time = 0.0
+    for _ in range(iterations):
+        for data in EVENTS:
+            start = time.perf_counter()
+            evt = Event.deserialize(data)
+            mid = time.perf_counter()
+            evt.serialize()
+            serialize_time += time.perf_counter() - mid
+            deserialize_time += mid - start
+    count = iterations * len(EVENTS)
+    print(
+        f"deserialize {count / deserialize_time:,.0f} events/second, "
+        f"serialize {count / serialize_time:,.0f} events/second"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=5000)
+    main(parser.parse_args().iterations)
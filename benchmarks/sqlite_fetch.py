@@ -0,0 +1,87 @@
+# Copyright (c) 2026 Tulir Asokan
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+"""
+Compare the SQLite fetch methods against the old implementation, which translated the query
+placeholders on every call and always went through a cursor (separate worker thread calls for
+executing, fetching and closing).
+
+Usage: python -m benchmarks.sqlite_fetch [--iterations N]
+"""
+
+from __future__ import annotations
+
+from typing import Any, Awaitable, Callable
+import argparse
+import asyncio
+import tempfile
+import time
+
+import aiosqlite
+
+from mautrix.util.async_db import Database
+from mautrix.util.async_db.aiosqlite import POSITIONAL_PARAM_PATTERN, TxnConnection
+
+QUERY_ROW = "SELECT key, value FROM test WHERE key=$1"
+QUERY_ROWS = "SELECT key, value FROM test WHERE value>=$1 AND value<$2"
+
+
+async def old_fetch(conn: TxnConnection, query: str, *args: Any) -> list:
+    query = POSITIONAL_PARAM_PATTERN.sub(r"?\1", query)
+    async with aiosqlite.Connection.execute(conn, query, args) as cursor:
+        return list(await cursor.fetchall())
+
+
+async def old_fetchrow(conn: TxnConnection, query: str, *args: Any) -> Any:
+    query = POSITIONAL_PARAM_PATTERN.sub(r"?\1", query)
+    async with aiosqlite.Connection.execute(conn, query, args) as cursor:
+        return await cursor.fetchone()
+
+
+async def new_fetch(conn: TxnConnection, query: str, *args: Any) -> list:
+    return await conn.fetch(query, *args)
+
+
+async def new_fetchrow(conn: TxnConnection, query: str, *args: Any) -> Any:
+    return await conn.fetchrow(query, *args)
+
+
+async def run(
+    name: str,
+    conn: TxnConnection,
+    fetch: Callable[..., Awaitable[list]],
+    fetchrow: Callable[..., Awaitable[Any]],
+    iterations: int,
+) -> None:
+    start = time.perf_counter()
+    for i in range(iterations):
+        await fetchrow(conn, QUERY_ROW, f"key{i % 1000}")
+        await fetch(conn, QUERY_ROWS, i % 1000, i % 1000 + 10)
+    duration = time.perf_counter() - start
+    print(f"{name}: {iterations * 2 / duration:,.0f} queries/second")
+
+
+async def main(iterations: int) -> None:
+    with tempfile.TemporaryDirectory() as tmpdir:
+        db = Database.create(f"sqlite:{tmpdir}/bench.db")
+        await db.start()
+        await db.execute("CREATE TABLE test (key TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+        await db.execute("CREATE INDEX test_value_idx ON test (value)")
+        await db.executemany(
+            "INSERT INTO test (key, value) VALUES ($1, $2)", [(f"key{i}", i) for i in range(1000)]
+        )
+        async with db.acquire() as conn:
+            raw_conn: TxnConnection = conn.wrapped
+            # Warm up the statement cache before measuring
+            await run("warmup", raw_conn, new_fetch, new_fetchrow, 100)
+            await run("old", raw_conn, old_fetch, old_fetchrow, iterations)
+            await run("new", raw_conn, new_fetch, new_fetchrow, iterations)
+        await db.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=20000)
+    asyncio.run(main(parser.parse_args().iterations))
@@ -5,13 +5,14 @@
 # file, You can obtain one at http://mozilla.org/MPL/2.0/.
 from __future__ import annotations
 
-from typing import ClassVar, Literal, Mapping
-from enum import Enum
+from typing import Any, AsyncIterator, Awaitable, Callable, ClassVar, Literal, Mapping, NamedTuple
+from collections import deque
+from contextlib import asynccontextmanager, nullcontext
+from enum import Enum, IntEnum
 from json.decoder import JSONDecodeError
 from urllib.parse import quote as urllib_quote, urljoin as urllib_join
 import asyncio
 import inspect
-import json
 import logging
 import platform
 import time
@@ -21,10 +22,16 @@ from aiohttp.client_exceptions import ClientError, ContentTypeError
 from yarl import URL
 
 from mautrix import __optional_imports__, __version__ as mautrix_version
-from mautrix.errors import MatrixConnectionError, MatrixRequestError, make_request_error
+from mautrix.errors import (
+    MatrixConnectionError,
+    MatrixRequestError,
+    MLimitExceeded,
+    make_request_error,
+)
+from mautrix.util import json_codec
 from mautrix.util.async_body import AsyncBody, async_iter_bytes
 from mautrix.util.logging import TraceLogger
-from mautrix.util.opt_prometheus import Counter
+from mautrix.util.opt_prometheus import Counter, Gauge, Histogram
 
 if __optional_imports__:
     # Safe to import, but it's not actually needed, so don't force-import the whole types module.
@@ -40,6 +47,26 @@ API_CALLS_FAILED = Counter(
     documentation="The number of Matrix client API calls which failed",
     labelnames=("method",),
 )
+API_CALLS_RATE_LIMITED = Counter(
+    name="bridge_matrix_api_calls_rate_limited",
+    documentation="The number of Matrix client API calls rejected with M_LIMIT_EXCEEDED",
+    labelnames=("endpoint",),
+)
+API_CALLS_DELAYED = Counter(
+    name="bridge_matrix_api_calls_delayed",
+    documentation="The number of Matrix client API calls delayed by the local rate limiter",
+    labelnames=("endpoint",),
+)
+REQUEST_QUEUE_DEPTH = Gauge(
+    name="bridge_matrix_api_queue_depth",
+    documentation="The number of Matrix client API calls waiting for a free request slot",
+    labelnames=("lane",),
+)
+REQUEST_QUEUE_WAIT = Histogram(
+    name="bridge_matrix_api_queue_wait_seconds",
+    documentation="Time Matrix client API calls spent waiting for a free request slot",
+    labelnames=("lane",),
+)
 
 
 class APIPath(Enum):
@@ -155,6 +182,358 @@ Examples:
     "_synapse/admin/v1/users/%40user%3Aexample.com/login"
 """
 
+
+class RateLimit(NamedTuple):
+    """A token bucket rate limit, using the same terms as Synapse's ``rc_*`` config options."""
+
+    per_second: float
+    burst_count: int
+
+
+class _TokenBucket:
+    __slots__ = ("rate", "burst", "tokens", "updated", "generation", "expires")
+
+    rate: float
+    burst: int
+    tokens: float
+    updated: float
+    generation: int
+    expires: float | None
+
+    def __init__(self, limit: RateLimit, now: float, expires: float | None = None) -> None:
+        self.rate = limit.per_second
+        self.burst = limit.burst_count
+        self.tokens = limit.burst_count
+        self.updated = now
+        self.generation = 0
+        self.expires = expires
+
+    def _refill(self, now: float) -> None:
+        if now > self.updated:
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+
+    def reserve(self, now: float) -> float:
+        self._refill(now)
+        self.tokens -= 1
+        ready_at = self.updated
+        if self.tokens < 0:
+            ready_at -= self.tokens / self.rate
+        return ready_at - now
+
+    def block(self, now: float, duration: float) -> None:
+        self._refill(now)
+        self.updated = max(self.updated, now + duration)
+        # Allow exactly one request when the block expires. Any reservations made before this
+        # are invalidated by bumping the generation, so waiters will reserve again.
+        self.tokens = 1
+        self.generation += 1
+
+    def is_idle(self, now: float) -> bool:
+        if self.expires is not None:
+            return now > self.expires and now > self.updated
+        self._refill(now)
+        return self.tokens >= self.burst
+
+
+class RateLimiter:
+    """
+    RateLimiter delays outgoing requests per user and endpoint class, so that a user who is being
+    rate limited on one type of endpoint doesn't stall requests from other users or to other
+    endpoints.
+
+    When the homeserver responds with ``M_LIMIT_EXCEEDED``, further requests from the same user
+    to the same class of endpoints are held until the ``retry_after_ms`` has passed, and then
+    let through at the rate implied by it for :attr:`learned_limit_duration` seconds. Limits can
+    also be configured up front with :attr:`limits`, which makes users slow down before the
+    homeserver starts rejecting their requests.
+    """
+
+    limits: dict[str, RateLimit]
+    """Token bucket limits to apply per user, keyed by endpoint class."""
+    learned_limit_duration: float
+    """How long to keep applying a rate limit learned from ``M_LIMIT_EXCEEDED`` errors."""
+    default_retry_after: float
+    """The delay to use if ``M_LIMIT_EXCEEDED`` errors don't say how long to wait."""
+
+    endpoint_classes: ClassVar[tuple[str, ...]] = (
+        "message",
+        "join",
+        "invite",
+        "media",
+        "register",
+        "login",
+        "other",
+    )
+    """The endpoint classes that :meth:`get_endpoint_class` can return."""
+
+    _buckets: dict[tuple[str, str], _TokenBucket]
+    _next_prune: float
+
+    def __init__(
+        self,
+        limits: dict[str, RateLimit] | None = None,
+        learned_limit_duration: float = 60,
+        default_retry_after: float = 5,
+    ) -> None:
+        self.limits = limits or {}
+        self.learned_limit_duration = learned_limit_duration
+        self.default_retry_after = default_retry_after
+        self._buckets = {}
+        self._next_prune = 0
+
+    @classmethod
+    def from_config(cls, limits: Mapping[str, Any]) -> RateLimiter:
+        """
+        Create a rate limiter from a config section that maps endpoint classes to objects with
+        ``per_second`` and ``burst_count`` fields.
+
+        Args:
+            limits: The config section.
+
+        Returns:
+            A rate limiter with the given limits.
+
+        Raises:
+            ValueError: If an endpoint class is unknown or its limit is invalid.
+        """
+        if not isinstance(limits, Mapping):
+            raise ValueError("expected a mapping from endpoint class to limit")
+        parsed = {}
+        for endpoint_class, limit in limits.items():
+            if endpoint_class not in cls.endpoint_classes:
+                raise ValueError(f"unknown endpoint class {endpoint_class!r}")
+            try:
+                if set(limit.keys()) != {"per_second", "burst_count"}:
+                    raise ValueError("expected exactly per_second and burst_count")
+                per_second = float(limit["per_second"])
+                burst_count = int(limit["burst_count"])
+            except (AttributeError, TypeError, ValueError) as e:
+                raise ValueError(f"invalid limit for {endpoint_class}: {e}") from e
+            if not per_second > 0 or burst_count < 1:
+                raise ValueError(
+                    f"invalid limit for {endpoint_class}: per_second must be positive "
+                    "and burst_count must be at least 1"
+                )
+            parsed[endpoint_class] = RateLimit(per_second=per_second, burst_count=burst_count)
+        return cls(parsed)
+
+    @staticmethod
+    def get_endpoint_class(method: Method, path: PathBuilder | str) -> str:
+        """
+        Get the class of an endpoint, i.e. the name of the rate limit that applies to it.
+
+        Args:
+            method: The HTTP method of the request.
+            path: The path of the request.
+
+        Returns:
+            One of ``message``, ``join``, ``invite``, ``media``, ``register``, ``login``
+            or ``other``.
+        """
+        path = str(path)
+        if path.startswith("_matrix/media/") or "/v1/media/" in path:
+            return "media"
+        parts = path.split("/")
+        if method != Method.GET and ("send" in parts or "state" in parts or "redact" in parts):
+            return "message"
+        elif "join" in parts:
+            return "join"
+        elif parts[-1] == "invite":
+            return "invite"
+        elif parts[-1] == "register":
+            return "register"
+        elif parts[-1] == "login":
+            return "login"
+        return "other"
+
+    def _prune(self, now: float) -> None:
+        self._next_prune = now + 60
+        for key, bucket in list(self._buckets.items()):
+            if bucket.is_idle(now):
+                del self._buckets[key]
+
+    async def wait(self, identity: str, endpoint_class: str) -> None:
+        """
+        Wait until a request can be sent.
+
+        Args:
+            identity: The user ID or other identifier of the user making the request.
+            endpoint_class: The endpoint class from :meth:`get_endpoint_class`.
+        """
+        while True:
+            now = time.monotonic()
+            if now > self._next_prune:
+                self._prune(now)
+            key = (identity, endpoint_class)
+            bucket = self._buckets.get(key)
+            if bucket is not None and bucket.is_idle(now) and bucket.expires is not None:
+                del self._buckets[key]
+                bucket = None
+            if bucket is None:
+                try:
+                    limit = self.limits[endpoint_class]
+                except KeyError:
+                    return
+                bucket = self._buckets[key] = _TokenBucket(limit, now)
+            delay = bucket.reserve(now)
+            if delay <= 0:
+                return
+            API_CALLS_DELAYED.labels(endpoint=endpoint_class).inc()
+            generation = bucket.generation
+            await asyncio.sleep(delay)
+            if bucket.generation == generation:
+                return
+            # The limit was exceeded again while waiting, so the reservation isn't valid anymore
+
+    def limit_exceeded(
+        self, identity: str, endpoint_class: str, retry_after_ms: int | None
+    ) -> float:
+        """
+        Mark a user as rate limited after the homeserver returned ``M_LIMIT_EXCEEDED``.
+
+        Args:
+            identity: The user ID or other identifier of the user making the request.
+            endpoint_class: The endpoint class from :meth:`get_endpoint_class`.
+            retry_after_ms: The ``retry_after_ms`` value from the error, if there was one.
+
+        Returns:
+            The number of seconds until the next request can be sent.
+        """
+        API_CALLS_RATE_LIMITED.labels(endpoint=endpoint_class).inc()
+        retry_after = retry_after_ms / 1000 if retry_after_ms else self.default_retry_after
+        now = time.monotonic()
+        key = (identity, endpoint_class)
+        bucket = self._buckets.get(key)
+        if bucket is None or bucket.expires is not None:
+            # Assume the homeserver lets one request through every retry_after seconds.
+            limit = self.limits.get(endpoint_class) or RateLimit(1 / retry_after, 1)
+            expires = None
+            if endpoint_class not in self.limits:
+                expires = now + retry_after + self.learned_limit_duration
+            if bucket is None:
+                bucket = self._buckets[key] = _TokenBucket(limit, now, expires)
+            else:
+                bucket.rate, bucket.burst, bucket.expires = limit.per_second, 1, expires
+        bucket.block(now, retry_after)
+        return bucket.updated - now
+
+
+class RequestPriority(IntEnum):
+    """The priority lanes for outgoing requests. Lanes with lower values are served first."""
+
+    HIGH = 0
+    """Interactive requests that a user is waiting for, like sending live messages."""
+    NORMAL = 1
+    """The default priority."""
+    LOW = 2
+    """Requests that can wait, like typing notifications, receipts, presence and backfill."""
+
+    def __str__(self) -> str:
+        return self.name.lower()
+
+
+class RequestScheduler:
+    """
+    RequestScheduler limits the number of concurrent requests and decides which queued request
+    gets the next free slot. Queued requests are started in priority order (and in FIFO order
+    within a lane). Lanes can also be limited to a part of the slots with :attr:`lane_limits`,
+    so that low priority requests can't occupy every slot and make high priority ones wait for
+    them to finish.
+    """
+
+    max_concurrent: int
+    """The maximum number of requests to run at the same time."""
+    lane_limits: dict[RequestPriority, int]
+    """The maximum number of concurrent requests per lane."""
+
+    _active: int
+    _active_per_lane: dict[RequestPriority, int]
+    _queues: dict[RequestPriority, deque[asyncio.Future]]
+
+    def __init__(
+        self, max_concurrent: int = 100, lane_limits: dict[RequestPriority, int] | None = None
+    ) -> None:
+        self.max_concurrent = max_concurrent
+        self.lane_limits = lane_limits or {}
+        self._active = 0
+        self._active_per_lane = {lane: 0 for lane in RequestPriority}
+        self._queues = {lane: deque() for lane in RequestPriority}
+
+    def _can_start(self, lane: RequestPriority) -> bool:
+        lane_limit = self.lane_limits.get(lane, self.max_concurrent)
+        return self._active < self.max_concurrent and self._active_per_lane[lane] < lane_limit
+
+    def _start(self, lane: RequestPriority) -> None:
+        self._active += 1
+        self._active_per_lane[lane] += 1
+
+    def _release(self, lane: RequestPriority) -> None:
+        self._active -= 1
+        self._active_per_lane[lane] -= 1
+        for queued_lane, queue in self._queues.items():
+            while queue and self._can_start(queued_lane):
+                fut = queue.popleft()
+                REQUEST_QUEUE_DEPTH.labels(lane=str(queued_lane)).dec()
+                if not fut.done():
+                    self._start(queued_lane)
+                    fut.set_result(None)
+
+    async def _acquire(self, lane: RequestPriority) -> None:
+        # Don't skip the queue if there are requests with the same or higher priority waiting
+        queued = any(queue for queued_lane, queue in self._queues.items() if queued_lane <= lane)
+        if not queued and self._can_start(lane):
+            self._start(lane)
+            REQUEST_QUEUE_WAIT.labels(lane=str(lane)).observe(0)
+            return
+        fut = asyncio.get_running_loop().create_future()
+        self._queues[lane].append(fut)
+        REQUEST_QUEUE_DEPTH.labels(lane=str(lane)).inc()
+        start = time.monotonic()
+        try:
+            await fut
+        except asyncio.CancelledError:
+            if not fut.cancelled():
+                # The slot was already given to this request, so pass it on
+                self._release(lane)
+            else:
+                try:
+                    self._queues[lane].remove(fut)
+                except ValueError:
+                    # Already removed by _release
+                    pass
+                else:
+                    REQUEST_QUEUE_DEPTH.labels(lane=str(lane)).dec()
+            raise
+        REQUEST_QUEUE_WAIT.labels(lane=str(lane)).observe(time.monotonic() - start)
+
+    @asynccontextmanager
+    async def slot(self, priority: RequestPriority) -> AsyncIterator[None]:
+        """
+        Wait for a free request slot and hold it until the context manager exits.
+
+        Args:
+            priority: The lane to queue the request in.
+        """
+        await self._acquire(priority)
+        try:
+            yield
+        finally:
+            self._release(priority)
+
+
+def _get_retry_after_ms(data: Any, headers: Mapping[str, str]) -> int | None:
+    try:
+        return int(data["retry_after_ms"])
+    except (KeyError, TypeError, ValueError):
+        pass
+    try:
+        return int(headers["Retry-After"]) * 1000
+    except (KeyError, ValueError):
+        # Retry-After can also be a HTTP date, but homeservers don't use that
+        return None
+
+
 _req_id = 0
 
 
@@ -199,6 +578,13 @@ class HTTPAPI:
     """
     An optional device ID to set as the user_id query parameter for appservice requests (MSC3202).
     """
+    rate_limiter: RateLimiter | None
+    """
+    An optional rate limiter to delay requests of users who are being rate limited. If set,
+    requests that fail with ``M_LIMIT_EXCEEDED`` are also retried (up to the retry count).
+    """
+    request_scheduler: RequestScheduler | None
+    """An optional scheduler to limit concurrent requests and prioritize them."""
 
     def __init__(
         self,
@@ -212,6 +598,8 @@ class HTTPAPI:
         loop: asyncio.AbstractEventLoop | None = None,
         as_user_id: UserID | None = None,
         as_device_id: UserID | None = None,
+        rate_limiter: RateLimiter | None = None,
+        request_scheduler: RequestScheduler | None = None,
     ) -> None:
         """
         Args:
@@ -225,6 +613,10 @@ class HTTPAPI:
                 appservice requests.
             as_device_id: An optional device ID to set as the user_id query parameter for
                 appservice requests (MSC3202).
+            rate_limiter: An optional rate limiter to delay requests of rate limited users.
+                Can be shared between multiple HTTPAPI instances.
+            request_scheduler: An optional scheduler to limit and prioritize concurrent requests.
+                Can be shared between multiple HTTPAPI instances.
         """
         self.base_url = URL(base_url)
         self.token = token
@@ -234,6 +626,8 @@ class HTTPAPI:
         )
         self.as_user_id = as_user_id
         self.as_device_id = as_device_id
+        self.rate_limiter = rate_limiter
+        self.request_scheduler = request_scheduler
         if txn_id is not None:
             self.txn_id = txn_id
         if default_retry_count is not None:
@@ -248,28 +642,34 @@ class HTTPAPI:
         content: bytes | bytearray | str | AsyncBody,
         query_params: dict[str, str],
         headers: dict[str, str],
+        response_handler: Callable[[ClientResponse], Awaitable[Any]] | None = None,
     ) -> tuple[JSON, ClientResponse]:
         request = self.session.request(
             str(method), url, data=content, params=query_params, headers=headers
         )
         async with request as response:
             if response.status < 200 or response.status >= 300:
-                errcode = unstable_errcode = message = None
+                errcode = unstable_errcode = message = response_data = None
                 try:
-                    response_data = await response.json()
+                    response_data = await response.json(loads=json_codec.loads)
                     errcode = response_data["errcode"]
                     message = response_data["error"]
                     unstable_errcode = response_data.get("org.matrix.msc3848.unstable.errcode")
                 except (JSONDecodeError, ContentTypeError, KeyError):
                     pass
-                raise make_request_error(
+                err = make_request_error(
                     http_status=response.status,
                     text=await response.text(),
                     errcode=errcode,
                     message=message,
                     unstable_errcode=unstable_errcode,
                 )
-            return await response.json(), response
+                if isinstance(err, MLimitExceeded):
+                    err.retry_after_ms = _get_retry_after_ms(response_data, response.headers)
+                raise err
+            if response_handler:
+                return await response_handler(response), response
+            return await response.json(loads=json_codec.loads), response
 
     def _log_request(
         self,
@@ -355,6 +755,8 @@ class HTTPAPI:
         metrics_method: str = "",
         min_iter_size: int = 25 * 1024 * 1024,
         sensitive: bool = False,
+        response_handler: Callable[[ClientResponse], Awaitable[Any]] | None = None,
+        priority: RequestPriority = RequestPriority.NORMAL,
     ) -> JSON:
         """
         Make a raw Matrix API request.
@@ -368,13 +770,18 @@ class HTTPAPI:
                      it'll be set to ``application/json``. The ``Authorization`` header is always
                      overridden if :attr:`token` is set.
             query_params: A dict of query parameters to send.
-            retry_count: Number of times to retry if the homeserver isn't reachable.
+            retry_count: Number of times to retry if the homeserver isn't reachable
+                         (or if the request is rate limited and :attr:`rate_limiter` is set).
                          Defaults to :attr:`default_retry_count`.
             metrics_method: Name of the method to include in Prometheus timing metrics.
             min_iter_size: If the request body is larger than this value, it will be passed to
                            aiohttp as an async iterable to stop it from copying the whole thing
                            in memory.
             sensitive: If True, the request content will not be logged.
+            response_handler: A function to read the body of successful responses instead of
+                              parsing it as JSON. The return value of the function is returned
+                              from this method.
+            priority: The lane to queue the request in if :attr:`request_scheduler` is set.
 
         Returns:
             The parsed response JSON.
@@ -398,7 +805,7 @@ class HTTPAPI:
             orig_content = content
             is_json = headers.get("Content-Type", None) == "application/json"
             if is_json and isinstance(content, (dict, list)):
-                content = json.dumps(content)
+                content = json_codec.dumps(content)
         else:
             orig_content = content = None
         full_url = self.base_url.with_path(self._full_path(path), encoded=True)
@@ -412,24 +819,53 @@ class HTTPAPI:
         do_fake_iter = content and hasattr(content, "__len__") and len(content) > min_iter_size
         if do_fake_iter:
             headers["Content-Length"] = str(len(content))
+        if self.rate_limiter:
+            rate_limit_key = (
+                query_params.get("user_id") or self.token,
+                self.rate_limiter.get_endpoint_class(method, path),
+            )
+        else:
+            rate_limit_key = None
         backoff = 4
         log_url = full_url.with_query(query_params)
         while True:
+            if rate_limit_key:
+                await self.rate_limiter.wait(*rate_limit_key)
             self._log_request(
                 method, log_url, content, orig_content, query_params, headers, req_id, sensitive
             )
             API_CALLS.labels(method=metrics_method).inc()
             req_content = async_iter_bytes(content) if do_fake_iter else content
             start = time.monotonic()
+            slot = (
+                self.request_scheduler.slot(priority) if self.request_scheduler else nullcontext()
+            )
             try:
-                resp_data, resp = await self._send(
-                    method, full_url, req_content, query_params, headers or {}
-                )
+                async with slot:
+                    resp_data, resp = await self._send(
+                        method,
+                        full_url,
+                        req_content,
+                        query_params,
+                        headers or {},
+                        response_handler,
+                    )
                 self._log_request_done(path, req_id, time.monotonic() - start, resp.status)
                 return resp_data
             except MatrixRequestError as e:
                 API_CALLS_FAILED.labels(method=metrics_method).inc()
-                if retry_count > 0 and e.http_status in (502, 503, 504):
+                if rate_limit_key and isinstance(e, MLimitExceeded):
+                    delay = self.rate_limiter.limit_exceeded(*rate_limit_key, e.retry_after_ms)
+                    if retry_count > 0:
+                        self.log.warning(
+                            f"Request #{req_id} was rate limited, retrying in {delay:.3f} seconds"
+                        )
+                        retry_count -= 1
+                        # The rate limiter will delay the retry
+                        continue
+                    self._log_request_done(path, req_id, time.monotonic() - start, e.http_status)
+                    raise
+                elif retry_count > 0 and e.http_status in (502, 503, 504):
                     self.log.warning(
                         f"Request #{req_id} failed with HTTP {e.http_status}, "
                         f"retrying in {backoff} seconds"
@@ -0,0 +1,188 @@
+# Copyright (c) 2026 Tulir Asokan
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+from typing import Any
+import asyncio
+
+import pytest
+
+from .api import Method, Path, RateLimit, RateLimiter, RequestPriority, RequestScheduler
+
+
+@pytest.mark.parametrize(
+    "method,path,expected",
+    [
+        (Method.PUT, Path.v3.rooms["!foo:bar"].send["m.room.message"]["txn"], "message"),
+        (Method.PUT, Path.v3.rooms["!foo:bar"].state["m.room.name"][""], "message"),
+        (Method.GET, Path.v3.rooms["!foo:bar"].state["m.room.name"][""], "other"),
+        (Method.POST, Path.v3.rooms["!foo:bar"].join, "join"),
+        (Method.POST, Path.v3.join["#foo:bar"], "join"),
+        (Method.POST, Path.v3.rooms["!foo:bar"].invite, "invite"),
+        (Method.GET, Path.v3.rooms["!foo:bar"].joined_members, "other"),
+        (Method.POST, Path.v3.register, "register"),
+        (Method.POST, "_matrix/media/v3/upload", "media"),
+    ],
+)
+def test_endpoint_class(method: Method, path: str, expected: str) -> None:
+    assert RateLimiter.get_endpoint_class(method, path) == expected
+
+
+_real_sleep = asyncio.sleep
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 1000.0
+        self.sleeps: list[float] = []
+
+    def monotonic(self) -> float:
+        return self.now
+
+    async def sleep(self, delay: float) -> None:
+        self.sleeps.append(delay)
+        await _real_sleep(0)
+        self.now += delay
+
+
+@pytest.fixture
+def clock(monkeypatch: pytest.MonkeyPatch) -> FakeClock:
+    clock = FakeClock()
+    monkeypatch.setattr("mautrix.api.time.monotonic", clock.monotonic)
+    monkeypatch.setattr("mautrix.api.asyncio.sleep", clock.sleep)
+    return clock
+
+
+async def test_limit_exceeded(clock: FakeClock) -> None:
+    limiter = RateLimiter(learned_limit_duration=0.2)
+    start = clock.now
+    await limiter.wait("@user:example.com", "message")
+    assert clock.sleeps == []
+
+    assert limiter.limit_exceeded("@user:example.com", "message", 100) == pytest.approx(0.1)
+    # Other users and endpoints aren't affected
+    await limiter.wait("@other:example.com", "message")
+    await limiter.wait("@user:example.com", "join")
+    assert clock.sleeps == []
+
+    # The user is held until the block expires, then limited to the learned rate
+    await limiter.wait("@user:example.com", "message")
+    assert clock.now - start == pytest.approx(0.1)
+    await limiter.wait("@user:example.com", "message")
+    assert clock.now - start == pytest.approx(0.2)
+
+    # The learned limit expires after a while
+    clock.now += 1
+    clock.sleeps.clear()
+    await limiter.wait("@user:example.com", "message")
+    await limiter.wait("@user:example.com", "message")
+    assert clock.sleeps == []
+
+
+async def test_limit_exceeded_while_waiting(clock: FakeClock) -> None:
+    limiter = RateLimiter({"message": RateLimit(per_second=10, burst_count=1)})
+    start = clock.now
+    await limiter.wait("@user:example.com", "message")
+    waiter = asyncio.create_task(limiter.wait("@user:example.com", "message"))
+    await _real_sleep(0)
+    assert clock.sleeps == [pytest.approx(0.1)]
+    # The reservation is invalidated, so the waiter waits again for the new block to expire
+    limiter.limit_exceeded("@user:example.com", "message", 500)
+    await waiter
+    assert clock.now - start == pytest.approx(0.5)
+
+
+async def test_configured_limit(clock: FakeClock) -> None:
+    limiter = RateLimiter({"message": RateLimit(per_second=20, burst_count=2)})
+    start = clock.now
+    for _ in range(4):
+        await limiter.wait("@user:example.com", "message")
+    assert clock.sleeps == [pytest.approx(0.05), pytest.approx(0.05)]
+    assert clock.now - start == pytest.approx(0.1)
+
+
+def test_from_config() -> None:
+    limiter = RateLimiter.from_config(
+        {
+            "message": {"per_second": 0.5, "burst_count": 10},
+            "join": {"per_second": 1, "burst_count": "3"},
+        }
+    )
+    assert limiter.limits == {
+        "message": RateLimit(per_second=0.5, burst_count=10),
+        "join": RateLimit(per_second=1, burst_count=3),
+    }
+    assert RateLimiter.from_config({}).limits == {}
+
+
+@pytest.mark.parametrize(
+    "config,error",
+    [
+        ([], "expected a mapping"),
+        ({"messages": {"per_second": 1, "burst_count": 1}}, "unknown endpoint class 'messages'"),
+        ({"message": 5}, "invalid limit for message"),
+        ({"message": {"per_second": 1}}, "invalid limit for message"),
+        ({"join": {"per_second": 1, "burst": 1}}, "invalid limit for join"),
+        ({"join": {"per_second": "fast", "burst_count": 1}}, "invalid limit for join"),
+        ({"join": {"per_second": 0, "burst_count": 1}}, "invalid limit for join"),
+        ({"join": {"per_second": 1, "burst_count": 0}}, "invalid limit for join"),
+    ],
+)
+def test_from_config_invalid(config: Any, error: str) -> None:
+    with pytest.raises(ValueError, match=error):
+        RateLimiter.from_config(config)
+
+
+async def test_scheduler_priority() -> None:
+    scheduler = RequestScheduler(max_concurrent=1)
+    order = []
+    release = asyncio.Event()
+
+    async def request(name: str, priority: RequestPriority) -> None:
+        async with scheduler.slot(priority):
+            order.append(name)
+            await release.wait()
+
+    first = asyncio.create_task(request("first", RequestPriority.LOW))
+    await asyncio.sleep(0)
+    tasks = [
+        asyncio.create_task(request(name, priority))
+        for name, priority in (
+            ("low", RequestPriority.LOW),
+            ("normal", RequestPriority.NORMAL),
+            ("cancelled", RequestPriority.HIGH),
+            ("high", RequestPriority.HIGH),
+        )
+    ]
+    await asyncio.sleep(0)
+    tasks.pop(2).cancel()
+    release.set()
+    await asyncio.gather(first, *tasks)
+    assert order == ["first", "high", "normal", "low"]
+    assert scheduler._active == 0
+
+
+async def test_scheduler_lane_limit() -> None:
+    scheduler = RequestScheduler(max_concurrent=2, lane_limits={RequestPriority.LOW: 1})
+    release = asyncio.Event()
+    started = []
+
+    async def request(name: str, priority: RequestPriority) -> None:
+        async with scheduler.slot(priority):
+            started.append(name)
+            await release.wait()
+
+    tasks = [
+        asyncio.create_task(request("low1", RequestPriority.LOW)),
+        asyncio.create_task(request("low2", RequestPriority.LOW)),
+    ]
+    await asyncio.sleep(0)
+    # The second low priority request is queued even though there's a free slot
+    assert started == ["low1"]
+    tasks.append(asyncio.create_task(request("high", RequestPriority.HIGH)))
+    await asyncio.sleep(0)
+    assert started == ["low1", "high"]
+    release.set()
+    await asyncio.gather(*tasks)
+    assert started == ["low1", "high", "low2"]
@@ -5,19 +5,43 @@
 # file, You can obtain one at http://mozilla.org/MPL/2.0/.
 from __future__ import annotations
 
-from typing import Any, Awaitable
+from typing import Any, Awaitable, Hashable
 from datetime import datetime, timezone
 import asyncio
+import weakref
 
 from aiohttp import ClientSession
 from yarl import URL
 
-from mautrix.api import HTTPAPI, Method, PathBuilder
+from mautrix.api import (
+    HTTPAPI,
+    Method,
+    PathBuilder,
+    RateLimiter,
+    RequestPriority,
+    RequestScheduler,
+)
 from mautrix.types import UserID
 from mautrix.util.logging import TraceLogger
+from mautrix.util.lru import LRUCache
+from mautrix.util.opt_prometheus import Gauge
 
 from .. import api as as_api, state_store as ss
 
+CACHE_SIZE = Gauge(
+    name="bridge_appservice_api_cache_size",
+    documentation="The number of cached child and real user AppServiceAPI instances",
+    labelnames=("cache",),
+)
+# The gauges are summed over all live root instances, without keeping the instances alive.
+_root_instances: weakref.WeakSet[AppServiceAPI] = weakref.WeakSet()
+CACHE_SIZE.labels(cache="children").set_function(
+    lambda: sum(len(api.children) for api in _root_instances)
+)
+CACHE_SIZE.labels(cache="real_users").set_function(
+    lambda: sum(len(api.real_users) for api in _root_instances)
+)
+
 
 class AppServiceAPI(HTTPAPI):
     """
@@ -32,12 +56,26 @@ class AppServiceAPI(HTTPAPI):
 
     state_store: ss.ASStateStore
     txn_id: int
-    children: dict[str, ChildAppServiceAPI]
-    real_users: dict[str, AppServiceAPI]
+    children: LRUCache[str, ChildAppServiceAPI]
+    real_users: LRUCache[str, AppServiceAPI]
+
+    cache_max_children: int | None = 10000
+    """The maximum number of child instances to keep in :attr:`children`."""
+    cache_max_real_users: int | None = 1000
+    """The maximum number of real user instances to keep in :attr:`real_users`."""
 
     is_real_user: bool
     bridge_name: str | None
 
+    joins_in_flight: dict[Hashable, asyncio.Task[bool]]
+    """
+    Joins in progress, keyed by user ID, room ID and bot, used to coalesce concurrent
+    ensure_joined calls. Child and real user instances share the dict of the root instance,
+    so it's not lost when they're evicted from :attr:`children` or :attr:`real_users`.
+    """
+    registrations_in_flight: dict[UserID, asyncio.Task[None]]
+    """Registrations in progress keyed by user ID, see :attr:`joins_in_flight`."""
+
     _bot_intent: as_api.IntentAPI | None
 
     def __init__(
@@ -55,6 +93,8 @@ class AppServiceAPI(HTTPAPI):
         bridge_name: str | None = None,
         default_retry_count: int = None,
         loop: asyncio.AbstractEventLoop | None = None,
+        rate_limiter: RateLimiter | None = None,
+        request_scheduler: RequestScheduler | None = None,
     ) -> None:
         """
         Args:
@@ -70,6 +110,9 @@ class AppServiceAPI(HTTPAPI):
             real_user_as_token: Whether this real user is actually using another ``as_token``.
             bridge_name: The name of the bridge to put in the ``fi.mau.double_puppet_source`` field
                 in outgoing message events sent through real users.
+            rate_limiter: The rate limiter to share with all child and real user instances.
+            request_scheduler: The request scheduler to share with all child and real user
+                instances.
         """
         self.base_log = log
         api_log = self.base_log.getChild("api").getChild(identity or "bot")
@@ -81,6 +124,8 @@ class AppServiceAPI(HTTPAPI):
             client_session=client_session,
             txn_id=0 if not child else None,
             default_retry_count=default_retry_count,
+            rate_limiter=rate_limiter,
+            request_scheduler=request_scheduler,
         )
         self.identity = identity
         self.bot_mxid = bot_mxid
@@ -89,12 +134,15 @@ class AppServiceAPI(HTTPAPI):
         self.is_real_user = real_user
         self.is_real_user_as_token = real_user_as_token
         self.bridge_name = bridge_name
+        self.joins_in_flight = {}
+        self.registrations_in_flight = {}
 
         if not child:
             self.txn_id = 0
             if not real_user:
-                self.children = {}
-                self.real_users = {}
+                self.children = LRUCache(self.cache_max_children)
+                self.real_users = LRUCache(self.cache_max_real_users)
+                _root_instances.add(self)
 
     def user(self, user: UserID) -> ChildAppServiceAPI:
         """
@@ -156,7 +204,11 @@ class AppServiceAPI(HTTPAPI):
                 real_user_as_token=as_token,
                 bridge_name=self.bridge_name,
                 default_retry_count=self.default_retry_count,
+                rate_limiter=self.rate_limiter,
+                request_scheduler=self.request_scheduler,
             )
+            child.joins_in_flight = self.joins_in_flight
+            child.registrations_in_flight = self.registrations_in_flight
             self.real_users[mxid] = child
         return child
 
@@ -217,6 +269,7 @@ class AppServiceAPI(HTTPAPI):
         retry_count: int | None = None,
         metrics_method: str | None = "",
         min_iter_size: int = 25 * 1024 * 1024,
+        priority: RequestPriority = RequestPriority.NORMAL,
     ) -> Awaitable[dict]:
         """
         Make a raw Matrix API request, acting as the appservice user assigned to this AppServiceAPI
@@ -238,6 +291,7 @@ class AppServiceAPI(HTTPAPI):
             min_iter_size: If the request body is larger than this value, it will be passed to
                            aiohttp as an async iterable to stop it from copying the whole thing
                            in memory.
+            priority: The lane to queue the request in if :attr:`request_scheduler` is set.
 
         Returns:
             The parsed response JSON.
@@ -251,7 +305,14 @@ class AppServiceAPI(HTTPAPI):
             query_params["user_id"] = self.identity or self.bot_mxid
 
         return super().request(
-            method, path, content, headers, query_params, retry_count, metrics_method
+            method,
+            path,
+            content,
+            headers,
+            query_params,
+            retry_count,
+            metrics_method,
+            priority=priority,
         )
 
 
@@ -279,8 +340,12 @@ class ChildAppServiceAPI(AppServiceAPI):
             child=True,
             bridge_name=parent.bridge_name,
             default_retry_count=parent.default_retry_count,
+            rate_limiter=parent.rate_limiter,
+            request_scheduler=parent.request_scheduler,
         )
         self.parent = parent
+        self.joins_in_flight = parent.joins_in_flight
+        self.registrations_in_flight = parent.registrations_in_flight
 
     @property
     def txn_id(self) -> int:
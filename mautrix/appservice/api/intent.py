@@ -5,10 +5,13 @@
 # file, You can obtain one at http://mozilla.org/MPL/2.0/.
 from __future__ import annotations
 
-from typing import Any, Awaitable, Iterable, TypeVar
+from typing import Any, Awaitable, Callable, Hashable, Iterable, TypeVar
+from contextvars import ContextVar
 from urllib.parse import quote as urllib_quote
+import asyncio
+import functools
 
-from mautrix.api import Method, Path
+from mautrix.api import Method, Path, RequestPriority
 from mautrix.client import ClientAPI, StoreUpdatingAPI
 from mautrix.errors import (
     IntentError,
@@ -97,6 +100,78 @@ DOUBLE_PUPPET_SOURCE_KEY = "fi.mau.double_puppet_source"
 T = TypeVar("T")
 
 
+# The innermost ensure_* wrapper that is currently running. When a subclass override calls the
+# overridden method with super(), both methods are wrapped, so the inner wrapper checks this to
+# avoid ensuring twice (and to respect the outer call's ensure_joined=False).
+_current_wrapper: ContextVar[tuple | None] = ContextVar("intent_ensure_wrapper", default=None)
+
+
+def _ensure_registered_wrapper(method: Callable[..., Awaitable[T]]) -> Callable[..., Awaitable[T]]:
+    @functools.wraps(method)
+    async def wrapper(self: IntentAPI, *args, **kwargs) -> T:
+        key = (self, method.__name__)
+        if _current_wrapper.get() == key:
+            return await method(self, *args, **kwargs)
+        await self.ensure_registered()
+        token = _current_wrapper.set(key)
+        try:
+            return await method(self, *args, **kwargs)
+        finally:
+            _current_wrapper.reset(token)
+
+    return wrapper
+
+
+def _ensure_joined_wrapper(method: Callable[..., Awaitable[T]]) -> Callable[..., Awaitable[T]]:
+    @functools.wraps(method)
+    async def wrapper(self: IntentAPI, *args, **kwargs) -> T:
+        room_id = kwargs.get("room_id", None)
+        if not room_id:
+            room_id = args[0]
+        ensure_joined = kwargs.pop("ensure_joined", True)
+        key = (self, method.__name__, room_id)
+        if _current_wrapper.get() == key:
+            return await method(self, *args, **kwargs)
+        if ensure_joined:
+            await self.ensure_joined(room_id)
+        token = _current_wrapper.set(key)
+        try:
+            return await method(self, *args, **kwargs)
+        finally:
+            _current_wrapper.reset(token)
+
+    return wrapper
+
+
+def _single_flight(
+    in_flight: dict[Hashable, asyncio.Task[T]], key: Hashable, fn: Callable[[], Awaitable[T]]
+) -> Awaitable[T]:
+    try:
+        task = in_flight[key]
+    except KeyError:
+        task = in_flight[key] = asyncio.create_task(fn())
+
+        def remove(_: asyncio.Task) -> None:
+            if in_flight.get(key) is task:
+                del in_flight[key]
+
+        task.add_done_callback(remove)
+    # Shield the shared task, so that one caller being cancelled doesn't cancel it for others
+    return asyncio.shield(task)
+
+
+def _add_ensure_wrappers(cls: type[IntentAPI], only_overridden: bool = False) -> None:
+    for methods, make_wrapper in (
+        (ENSURE_REGISTERED_METHODS, _ensure_registered_wrapper),
+        (ENSURE_JOINED_METHODS, _ensure_joined_wrapper),
+    ):
+        for method in methods:
+            name = method.__name__
+            if only_overridden and name not in cls.__dict__:
+                continue
+            setattr(cls, name, make_wrapper(getattr(cls, name)))
+
+
 class IntentAPI(StoreUpdatingAPI):
     """
     IntentAPI is a high-level wrapper around the AppServiceAPI that provides many easy-to-use
@@ -122,28 +197,11 @@ class IntentAPI(StoreUpdatingAPI):
             self.versions_cache = bot.versions_cache
         self.log = api.base_log.getChild("intent")
 
-        for method in ENSURE_REGISTERED_METHODS:
-            method = getattr(self, method.__name__)
-
-            async def wrapper(*args, __self=self, __method=method, **kwargs):
-                await __self.ensure_registered()
-                return await __method(*args, **kwargs)
-
-            setattr(self, method.__name__, wrapper)
-
-        for method in ENSURE_JOINED_METHODS:
-            method = getattr(self, method.__name__)
-
-            async def wrapper(*args, __self=self, __method=method, **kwargs):
-                room_id = kwargs.get("room_id", None)
-                if not room_id:
-                    room_id = args[0]
-                ensure_joined = kwargs.pop("ensure_joined", True)
-                if ensure_joined:
-                    await __self.ensure_joined(room_id)
-                return await __method(*args, **kwargs)
-
-            setattr(self, method.__name__, wrapper)
+    def __init_subclass__(cls, **kwargs) -> None:
+        super().__init_subclass__(**kwargs)
+        # Subclasses inherit the wrapped methods from IntentAPI,
+        # so only methods that are overridden need to be wrapped again.
+        _add_ensure_wrappers(cls, only_overridden=True)
 
     def user(
         self,
@@ -433,6 +491,9 @@ class IntentAPI(StoreUpdatingAPI):
     ) -> EventID:
         await self._ensure_has_power_level_for(room_id, event_type)
         content = self._add_source_key(content)
+        if kwargs.get("timestamp") is not None:
+            # Messages with a custom timestamp are usually backfill, so don't prioritize them
+            kwargs.setdefault("priority", RequestPriority.LOW)
         return await super().send_message_event(room_id, event_type, content, **kwargs)
 
     async def redact(
@@ -445,6 +506,8 @@ class IntentAPI(StoreUpdatingAPI):
     ) -> EventID:
         await self._ensure_has_power_level_for(room_id, EventType.ROOM_REDACTION)
         extra_content = self._add_source_key(extra_content)
+        if kwargs.get("timestamp") is not None:
+            kwargs.setdefault("priority", RequestPriority.LOW)
         return await super().redact(
             room_id, event_id, reason, extra_content=extra_content, **kwargs
         )
@@ -558,6 +621,7 @@ class IntentAPI(StoreUpdatingAPI):
                 "events": [evt.serialize() for evt in events],
                 "state_events_at_start": [evt.serialize() for evt in state_events_at_start],
             },
+            priority=RequestPriority.LOW,
         )
         return BatchSendResponse.deserialize(resp)
 
@@ -604,6 +668,7 @@ class IntentAPI(StoreUpdatingAPI):
             Method.POST,
             Path.unstable["com.beeper.backfill"].rooms[room_id].batch_send,
             content=body,
+            priority=RequestPriority.LOW,
         )
         return BeeperBatchSendResponse.deserialize(resp)
 
@@ -632,6 +697,10 @@ class IntentAPI(StoreUpdatingAPI):
             bot: An optional override account to use as the bridge bot. This is useful if you know
                 the bridge bot is not an admin in the room, but some other ghost user is.
 
+        If there's already a join in progress for the same user and room (e.g. when multiple
+        messages are bridged to a new room at once), this will wait for that join instead of
+        starting another one.
+
         Returns:
             ``False`` if the cache said the user is already in the room,
             ``True`` if the user was successfully added to the room just now.
@@ -640,6 +709,15 @@ class IntentAPI(StoreUpdatingAPI):
             raise ValueError("Room ID not given")
         if not ignore_cache and await self.state_store.is_joined(room_id, self.mxid):
             return False
+        # Calls with a different bot may handle failures differently, so they're not coalesced
+        bot_key = bot.mxid if isinstance(bot, IntentAPI) else bot
+        return await _single_flight(
+            self.api.joins_in_flight,
+            (self.mxid, room_id, bot_key),
+            functools.partial(self._ensure_joined, room_id, bot),
+        )
+
+    async def _ensure_joined(self, room_id: RoomID, bot: IntentAPI | None) -> bool:
         if bot is _bridgebot:
             bot = self.bot
         if bot is self:
@@ -690,12 +768,53 @@ class IntentAPI(StoreUpdatingAPI):
         """
         if await self.state_store.is_registered(self.mxid):
             return
+        await _single_flight(self.api.registrations_in_flight, self.mxid, self._ensure_registered)
+
+    async def _ensure_registered(self) -> None:
         try:
             await self._register()
         except MUserInUse:
             pass
         await self.state_store.registered(self.mxid)
 
+    async def ensure_joined_many(
+        self,
+        room_id: RoomID,
+        intents: Iterable[IntentAPI],
+        max_concurrent: int = 10,
+        ignore_cache: bool = False,
+    ) -> list[bool]:
+        """
+        Ensure multiple users are joined to the given room, with at most ``max_concurrent``
+        joins in progress at once. This intent is used as the bot account for inviting or
+        unbanning users if necessary (see :meth:`ensure_joined`).
+
+        Args:
+            room_id: The room to join.
+            intents: The intents of the users to join.
+            max_concurrent: The maximum number of users to join in parallel.
+            ignore_cache: Should the Matrix state store be checked first?
+
+        Returns:
+            The return value of :meth:`ensure_joined` for each intent, in the same order.
+
+        Raises:
+            IntentError: If joining any of the users fails. The other joins will still be finished.
+        """
+        sema = asyncio.Semaphore(max_concurrent)
+
+        async def join(intent: IntentAPI) -> bool:
+            async with sema:
+                return await intent.ensure_joined(room_id, ignore_cache=ignore_cache, bot=self)
+
+        results = await asyncio.gather(
+            *(join(intent) for intent in intents), return_exceptions=True
+        )
+        for result in results:
+            if isinstance(result, BaseException):
+                raise result
+        return results
+
     async def _ensure_has_power_level_for(
         self, room_id: RoomID, event_type: EventType, state_key: str = ""
     ) -> None:
@@ -721,3 +840,6 @@ class IntentAPI(StoreUpdatingAPI):
             #     f"Power level of {self.mxid} is not enough for {event_type} in {room_id}")
 
     # endregion
+
+
+_add_ensure_wrappers(IntentAPI)
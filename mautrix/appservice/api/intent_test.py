@@ -0,0 +1,255 @@
+# Copyright (c) 2026 Tulir Asokan
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+from __future__ import annotations
+
+from typing import AsyncIterator, cast
+import asyncio
+import gc
+import logging
+import weakref
+
+from aiohttp import ClientSession
+import pytest
+
+from mautrix.client.state_store import MemoryStateStore
+from mautrix.errors import IntentError, MNotFound
+from mautrix.types import (
+    EventID,
+    EventType,
+    PowerLevelStateEventContent,
+    RoomID,
+    StateEvent,
+    TextMessageEventContent,
+    UserID,
+)
+from mautrix.util.lru import LRUCache
+
+from ..state_store import ASStateStore
+from . import appservice
+from .appservice import AppServiceAPI
+from .intent import IntentAPI
+
+
+class MemoryASStateStore(MemoryStateStore, ASStateStore):
+    def __init__(self) -> None:
+        MemoryStateStore.__init__(self)
+        ASStateStore.__init__(self)
+
+
+room_id = RoomID("!foo:example.com")
+
+
+class OverridingIntentAPI(IntentAPI):
+    ensured_rooms: list[RoomID]
+
+    async def ensure_joined(self, room_id: RoomID, *args, **kwargs) -> bool:
+        self.ensured_rooms.append(room_id)
+        return False
+
+    async def send_message_event(self, room_id: RoomID, *args, **kwargs) -> EventID:
+        return await super().send_message_event(room_id, *args, **kwargs)
+
+
+@pytest.fixture
+async def intent() -> AsyncIterator[OverridingIntentAPI]:
+    api = AppServiceAPI(
+        "https://example.com",
+        bot_mxid=UserID("@bot:example.com"),
+        token="token",
+        log=logging.getLogger("mau.test"),
+        state_store=MemoryASStateStore(),
+    )
+
+    api.requests = []
+
+    async def request(*args, **kwargs):
+        api.requests.append(args)
+        await asyncio.sleep(0)
+        return {"event_id": "$event"}
+
+    api.request = request
+    intent = OverridingIntentAPI(UserID("@bot:example.com"), api, state_store=api.state_store)
+    intent.ensured_rooms = []
+    await api.state_store.set_power_levels(room_id, PowerLevelStateEventContent())
+    await api.state_store.set_create(
+        StateEvent.deserialize(
+            {
+                "type": "m.room.create",
+                "room_id": room_id,
+                "event_id": "$create",
+                "sender": "@bot:example.com",
+                "state_key": "",
+                "origin_server_ts": 0,
+                "content": {},
+            }
+        )
+    )
+    yield intent
+    await api.session.close()
+
+
+async def test_subclass_override_ensures_once(intent: OverridingIntentAPI) -> None:
+    content = TextMessageEventContent(body="hi")
+    await intent.send_message_event(room_id, EventType.ROOM_MESSAGE, content)
+    assert intent.ensured_rooms == [room_id]
+
+
+async def test_subclass_override_ensure_joined_false(intent: OverridingIntentAPI) -> None:
+    content = TextMessageEventContent(body="hi")
+    await intent.send_message_event(room_id, EventType.ROOM_MESSAGE, content, ensure_joined=False)
+    assert intent.ensured_rooms == []
+
+
+async def test_concurrent_registrations_coalesced(intent: OverridingIntentAPI) -> None:
+    ghost_id = UserID("@ghost:example.com")
+    ghost_api = intent.api.user(ghost_id)
+    ghost_api.request = intent.api.request
+    ghost = IntentAPI(ghost_id, ghost_api, state_store=intent.state_store)
+    await asyncio.gather(ghost.ensure_registered(), ghost.ensure_registered())
+    assert len(intent.api.requests) == 1
+    assert not ghost.api.registrations_in_flight
+    assert await intent.state_store.is_registered(ghost.mxid)
+
+
+class FakeJoins:
+    """Records join requests and holds them until :attr:`unblock` is set."""
+
+    def __init__(self, fail: set[UserID] | None = None) -> None:
+        self.joins: list[tuple[UserID, str]] = []
+        self.active = 0
+        self.max_active = 0
+        self.fail = fail or set()
+        self.unblock = asyncio.Event()
+        self.unblock.set()
+
+    def make_ghost(self, intent: IntentAPI, localpart: str) -> IntentAPI:
+        ghost_id = UserID(f"@{localpart}:example.com")
+        ghost_api = intent.api.user(ghost_id)
+
+        async def request(method, path, content=None, **kwargs):
+            assert "/join/" in str(path)
+            self.joins.append((ghost_id, str(path)))
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+            try:
+                await self.unblock.wait()
+            finally:
+                self.active -= 1
+            if ghost_id in self.fail:
+                raise MNotFound(404, "Room not found")
+            return {"room_id": room_id}
+
+        ghost_api.request = request
+        return IntentAPI(ghost_id, ghost_api, state_store=intent.state_store)
+
+
+@pytest.fixture
+async def joins(intent: OverridingIntentAPI) -> FakeJoins:
+    joins = FakeJoins()
+    # The ghosts are pretended to be registered already, so only join requests are made
+    for i in range(10):
+        await intent.state_store.registered(UserID(f"@ghost{i}:example.com"))
+    return joins
+
+
+async def test_concurrent_joins_coalesced(intent: OverridingIntentAPI, joins: FakeJoins) -> None:
+    ghost = joins.make_ghost(intent, "ghost0")
+    joins.unblock.clear()
+    tasks = [asyncio.create_task(ghost.ensure_joined(room_id)) for _ in range(5)]
+    await asyncio.sleep(0.01)
+    assert len(joins.joins) == 1
+    joins.unblock.set()
+    assert await asyncio.wait_for(asyncio.gather(*tasks), 5) == [True] * 5
+    assert len(joins.joins) == 1
+    assert not intent.api.joins_in_flight
+    # The next call hits the state store and doesn't make any requests
+    assert await ghost.ensure_joined(room_id) is False
+    assert len(joins.joins) == 1
+
+
+async def test_cancelled_caller_doesnt_cancel_join(
+    intent: OverridingIntentAPI, joins: FakeJoins
+) -> None:
+    ghost = joins.make_ghost(intent, "ghost0")
+    joins.unblock.clear()
+    cancelled = asyncio.create_task(ghost.ensure_joined(room_id))
+    waiting = asyncio.create_task(ghost.ensure_joined(room_id))
+    await asyncio.sleep(0.01)
+    cancelled.cancel()
+    await asyncio.sleep(0.01)
+    assert cancelled.cancelled()
+    assert not waiting.done()
+
+    joins.unblock.set()
+    assert await asyncio.wait_for(waiting, 5) is True
+    assert len(joins.joins) == 1
+    assert await intent.state_store.is_joined(room_id, ghost.mxid)
+
+
+async def test_ensure_joined_many_max_concurrent(
+    intent: OverridingIntentAPI, joins: FakeJoins
+) -> None:
+    ghosts = [joins.make_ghost(intent, f"ghost{i}") for i in range(10)]
+    joins.unblock.clear()
+    task = asyncio.create_task(intent.ensure_joined_many(room_id, ghosts, max_concurrent=3))
+    await asyncio.sleep(0.01)
+    assert joins.active == 3
+    joins.unblock.set()
+    assert await asyncio.wait_for(task, 5) == [True] * 10
+    assert joins.max_active == 3
+    assert sorted(user_id for user_id, _ in joins.joins) == sorted(ghost.mxid for ghost in ghosts)
+
+
+async def test_ensure_joined_many_raises_first_error(
+    intent: OverridingIntentAPI, joins: FakeJoins
+) -> None:
+    ghosts = [joins.make_ghost(intent, f"ghost{i}") for i in range(5)]
+    joins.fail = {ghosts[1].mxid, ghosts[3].mxid}
+    with pytest.raises(IntentError) as exc_info:
+        await intent.ensure_joined_many(room_id, ghosts, max_concurrent=2)
+    assert ghosts[1].mxid in str(exc_info.value)
+    assert isinstance(exc_info.value.__cause__, MNotFound)
+    # The other joins still finished
+    assert len(joins.joins) == 5
+    for i in (0, 2, 4):
+        assert await intent.state_store.is_joined(room_id, ghosts[i].mxid)
+
+
+async def test_join_coalesced_after_child_evicted(
+    intent: OverridingIntentAPI, joins: FakeJoins
+) -> None:
+    intent.api.children = LRUCache(1)
+    joins.unblock.clear()
+    ghost = joins.make_ghost(intent, "ghost0")
+    first = asyncio.create_task(ghost.ensure_joined(room_id))
+    await asyncio.sleep(0.01)
+    # Creating another child evicts the first one while its join is still in progress
+    joins.make_ghost(intent, "ghost1")
+    assert UserID("@ghost0:example.com") not in intent.api.children
+    ghost_again = joins.make_ghost(intent, "ghost0")
+    assert ghost_again.api is not ghost.api
+    second = asyncio.create_task(ghost_again.ensure_joined(room_id))
+    await asyncio.sleep(0.01)
+    joins.unblock.set()
+    assert await asyncio.wait_for(asyncio.gather(first, second), 5) == [True, True]
+    assert len(joins.joins) == 1
+
+
+def test_cache_gauges_dont_keep_instances_alive() -> None:
+    api = AppServiceAPI(
+        "https://example.com",
+        bot_mxid=UserID("@bot:example.com"),
+        token="token",
+        log=logging.getLogger("mau.test"),
+        state_store=MemoryASStateStore(),
+        client_session=cast(ClientSession, object()),
+    )
+    api_ref, store_ref = weakref.ref(api), weakref.ref(api.state_store)
+    assert api in appservice._root_instances
+    del api
+    gc.collect()
+    assert api_ref() is None
+    assert store_ref() is None
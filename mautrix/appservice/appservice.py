@@ -6,7 +6,8 @@
 # Partly based on github.com/Cadair/python-appservice-framework (MIT license)
 from __future__ import annotations
 
-from typing import Awaitable, Callable, Optional
+from typing import TYPE_CHECKING, Awaitable, Callable, Optional
+from collections import OrderedDict
 import asyncio
 import logging
 
@@ -16,11 +17,14 @@ import aiohttp
 from mautrix.types import JSON, RoomAlias, UserID, VersionsResponse
 from mautrix.util.logging import TraceLogger
 
-from ..api import HTTPAPI
+from ..api import HTTPAPI, RateLimiter, RequestPriority, RequestScheduler
 from .api import AppServiceAPI, IntentAPI
 from .as_handler import AppServiceServerMixin
 from .state_store import ASStateStore, FileASStateStore
 
+if TYPE_CHECKING:
+    from .transaction_store import PgTransactionStore
+
 try:
     import ssl
 except ImportError:
@@ -46,7 +50,7 @@ class AppService(AppServiceServerMixin):
     bridge_name: str | None
     state_store: ASStateStore
 
-    transactions: set[str]
+    transactions: OrderedDict[str, float]
 
     query_user: Callable[[UserID], JSON]
     query_alias: Callable[[RoomAlias], JSON]
@@ -84,8 +88,17 @@ class AppService(AppServiceServerMixin):
         default_ua: str = HTTPAPI.default_ua,
         default_http_retry_count: int = 0,
         connection_limit: int | None = None,
+        rate_limiter: RateLimiter | None = None,
+        request_scheduler: RequestScheduler | None = None,
+        room_concurrency_limit: int = 0,
+        transaction_store: PgTransactionStore | None = None,
     ) -> None:
-        super().__init__(ephemeral_events=ephemeral_events, encryption_events=encryption_events)
+        super().__init__(
+            ephemeral_events=ephemeral_events,
+            encryption_events=encryption_events,
+            room_concurrency_limit=room_concurrency_limit,
+            transaction_store=transaction_store,
+        )
         self.server = server
         self.domain = domain
         self.id = id
@@ -93,6 +106,13 @@ class AppService(AppServiceServerMixin):
         self.tls_cert = tls_cert
         self.tls_key = tls_key
         self.connection_limit = connection_limit or 100
+        self.rate_limiter = rate_limiter
+        # By default, low priority requests can use up to half of the connections,
+        # so that live messages don't have to wait for e.g. backfill requests.
+        self.request_scheduler = request_scheduler or RequestScheduler(
+            self.connection_limit,
+            lane_limits={RequestPriority.LOW: max(self.connection_limit // 2, 1)},
+        )
         self.as_token = as_token
         self.hs_token = hs_token
         self.bot_mxid = UserID(f"@{bot_localpart}:{domain}")
@@ -169,6 +189,8 @@ class AppService(AppServiceServerMixin):
             bridge_name=self.bridge_name,
             client_session=self._http_session,
             default_retry_count=self.default_http_retry_count,
+            rate_limiter=self.rate_limiter,
+            request_scheduler=self.request_scheduler,
         ).bot_intent()
         ssl_ctx = None
         if self.tls_cert and self.tls_key:
@@ -6,10 +6,11 @@
 # Partly based on github.com/Cadair/python-appservice-framework (MIT license)
 from __future__ import annotations
 
-from typing import Any, Awaitable, Callable
-from json import JSONDecodeError
-import json
+from typing import TYPE_CHECKING, Any, Awaitable, Callable
+from collections import OrderedDict, defaultdict
+import asyncio
 import logging
+import time
 
 from aiohttp import web
 
@@ -23,10 +24,14 @@ from mautrix.types import (
     Event,
     EventType,
     RoomAlias,
+    RoomID,
     SerializerError,
     UserID,
 )
-from mautrix.util import background_task
+from mautrix.util import background_task, json_codec
+
+if TYPE_CHECKING:
+    from .transaction_store import PgTransactionStore
 
 HandlerFunc = Callable[[Event], Awaitable]
 
@@ -38,11 +43,36 @@ class AppServiceServerMixin:
     ephemeral_events: bool
     encryption_events: bool
     synchronous_handlers: bool
+    room_concurrency_limit: int
 
     query_user: Callable[[UserID], JSON]
     query_alias: Callable[[RoomAlias], JSON]
 
-    transactions: set[str]
+    transactions: OrderedDict[str, float]
+    """
+    The IDs of recently handled transactions, mapped to the time they were handled, used to
+    ignore transactions that the homeserver retries. This is only a window, not a complete record:
+    it's kept in memory (so it's empty after a restart unless :attr:`transaction_store` is set),
+    and it's bounded by :attr:`max_transactions` and :attr:`transaction_ttl`. A retry of
+    a transaction that has already been evicted from the window will be handled again.
+    """
+    transaction_store: PgTransactionStore | None
+    """
+    An optional database-backed copy of the handled transaction window, which is checked when
+    a transaction isn't in :attr:`transactions`. Setting this makes retries idempotent across
+    restarts.
+    """
+    _transactions_in_progress: dict[str, asyncio.Future]
+    max_transactions: int
+    """
+    The maximum number of handled transaction IDs to remember. Once there are more, the oldest
+    ones are forgotten, and retries of them are no longer detected as duplicates.
+    """
+    transaction_ttl: float
+    """
+    The number of seconds to remember handled transaction IDs for. Retries that arrive later
+    than this are no longer detected as duplicates.
+    """
     event_handlers: list[HandlerFunc]
     to_device_handler: HandlerFunc | None
     otk_handler: Callable[[dict[UserID, dict[DeviceID, DeviceOTKCount]]], Awaitable] | None
@@ -54,12 +84,20 @@ class AppServiceServerMixin:
         encryption_events: bool = False,
         log: logging.Logger | None = None,
         hs_token: str | None = None,
+        max_transactions: int = 10000,
+        transaction_ttl: float = 24 * 60 * 60,
+        room_concurrency_limit: int = 0,
+        transaction_store: PgTransactionStore | None = None,
     ) -> None:
         if log is not None:
             self.log = log
         if hs_token is not None:
             self.hs_token = hs_token
-        self.transactions = set()
+        self.transactions = OrderedDict()
+        self._transactions_in_progress = {}
+        self.max_transactions = max_transactions
+        self.transaction_ttl = transaction_ttl
+        self.transaction_store = transaction_store
         self.event_handlers = []
         self.to_device_handler = None
         self.otk_handler = None
@@ -67,6 +105,9 @@ class AppServiceServerMixin:
         self.ephemeral_events = ephemeral_events
         self.encryption_events = encryption_events
         self.synchronous_handlers = False
+        # If set, events in a transaction are handled in order within each room,
+        # with at most this many rooms being handled concurrently.
+        self.room_concurrency_limit = room_concurrency_limit
 
         async def default_query_handler(_):
             return None
@@ -105,58 +146,72 @@ class AppServiceServerMixin:
 
     async def _http_query_user(self, request: web.Request) -> web.Response:
         if not self._check_token(request):
-            return web.json_response({"error": "Invalid auth token"}, status=401)
+            return web.json_response(
+                {"error": "Invalid auth token"}, status=401, dumps=json_codec.dumps
+            )
 
         try:
             user_id = request.match_info["user_id"]
         except KeyError:
-            return web.json_response({"error": "Missing user_id parameter"}, status=400)
+            return web.json_response(
+                {"error": "Missing user_id parameter"}, status=400, dumps=json_codec.dumps
+            )
 
         try:
             response = await self.query_user(user_id)
         except Exception:
             self.log.exception("Exception in user query handler")
-            return web.json_response({"error": "Internal appservice error"}, status=500)
+            return web.json_response(
+                {"error": "Internal appservice error"}, status=500, dumps=json_codec.dumps
+            )
 
         if not response:
-            return web.json_response({}, status=404)
-        return web.json_response(response)
+            return web.json_response({}, status=404, dumps=json_codec.dumps)
+        return web.json_response(response, dumps=json_codec.dumps)
 
     async def _http_query_alias(self, request: web.Request) -> web.Response:
         if not self._check_token(request):
-            return web.json_response({"error": "Invalid auth token"}, status=401)
+            return web.json_response(
+                {"error": "Invalid auth token"}, status=401, dumps=json_codec.dumps
+            )
 
         try:
             alias = request.match_info["alias"]
         except KeyError:
-            return web.json_response({"error": "Missing alias parameter"}, status=400)
+            return web.json_response(
+                {"error": "Missing alias parameter"}, status=400, dumps=json_codec.dumps
+            )
 
         try:
             response = await self.query_alias(alias)
         except Exception:
             self.log.exception("Exception in alias query handler")
-            return web.json_response({"error": "Internal appservice error"}, status=500)
+            return web.json_response(
+                {"error": "Internal appservice error"}, status=500, dumps=json_codec.dumps
+            )
 
         if not response:
-            return web.json_response({}, status=404)
-        return web.json_response(response)
+            return web.json_response({}, status=404, dumps=json_codec.dumps)
+        return web.json_response(response, dumps=json_codec.dumps)
 
     async def _http_ping(self, request: web.Request) -> web.Response:
         if not self._check_token(request):
             raise web.HTTPUnauthorized(
                 content_type="application/json",
-                text=json.dumps({"error": "Invalid auth token", "errcode": "M_UNKNOWN_TOKEN"}),
+                text=json_codec.dumps(
+                    {"error": "Invalid auth token", "errcode": "M_UNKNOWN_TOKEN"}
+                ),
             )
         try:
-            body = await request.json()
-        except JSONDecodeError:
+            body = await request.json(loads=json_codec.loads)
+        except json_codec.JSONDecodeError:
             raise web.HTTPBadRequest(
                 content_type="application/json",
-                text=json.dumps({"error": "Body is not JSON", "errcode": "M_NOT_JSON"}),
+                text=json_codec.dumps({"error": "Body is not JSON", "errcode": "M_NOT_JSON"}),
             )
         txn_id = body.get("transaction_id")
         self.log.info(f"Received ping from homeserver with transaction ID {txn_id}")
-        return web.json_response({})
+        return web.json_response({}, dumps=json_codec.dumps)
 
     @staticmethod
     def _get_with_fallback(
@@ -174,19 +229,33 @@ class AppServiceServerMixin:
         if not self._check_token(request):
             raise web.HTTPUnauthorized(
                 content_type="application/json",
-                text=json.dumps({"error": "Invalid auth token", "errcode": "M_UNKNOWN_TOKEN"}),
+                text=json_codec.dumps(
+                    {"error": "Invalid auth token", "errcode": "M_UNKNOWN_TOKEN"}
+                ),
             )
 
         transaction_id = request.match_info["transaction_id"]
         if transaction_id in self.transactions:
             raise web.HTTPOk(content_type="application/json", text="{}")
+        try:
+            in_progress = self._transactions_in_progress[transaction_id]
+        except KeyError:
+            pass
+        else:
+            # The homeserver timed out and retried a transaction that is still being handled,
+            # so wait for the original attempt instead of dispatching the events again.
+            # If the original attempt was cancelled, this one handles the transaction instead.
+            if await asyncio.shield(in_progress):
+                raise web.HTTPOk(content_type="application/json", text="{}")
+        if self.transaction_store and await self._is_transaction_stored(transaction_id):
+            raise web.HTTPOk(content_type="application/json", text="{}")
 
         try:
-            return transaction_id, await request.json()
-        except JSONDecodeError:
+            return transaction_id, await request.json(loads=json_codec.loads)
+        except json_codec.JSONDecodeError:
             raise web.HTTPBadRequest(
                 content_type="application/json",
-                text=json.dumps({"error": "Body is not JSON", "errcode": "M_NOT_JSON"}),
+                text=json_codec.dumps({"error": "Body is not JSON", "errcode": "M_NOT_JSON"}),
             )
 
     async def _http_handle_transaction(self, request: web.Request) -> web.Response:
@@ -200,7 +269,7 @@ class AppServiceServerMixin:
         except KeyError:
             raise web.HTTPBadRequest(
                 content_type="application/json",
-                text=json.dumps(
+                text=json_codec.dumps(
                     {"error": "Missing events object in body", "errcode": "M_BAD_JSON"}
                 ),
             )
@@ -246,25 +315,64 @@ class AppServiceServerMixin:
             txn_description = " and ".join(txn_content_log)
         self.log.debug(f"Handling transaction {transaction_id} with {txn_description}")
 
+        in_progress = asyncio.get_running_loop().create_future()
+        self._transactions_in_progress[transaction_id] = in_progress
+        handled = False
         try:
-            output = await self.handle_transaction(
-                transaction_id,
-                events=events,
-                extra_data=data,
-                ephemeral=ephemeral,
-                to_device=to_device,
-                device_lists=device_lists,
-                otk_counts=otk_counts,
-            )
-        except Exception:
-            self.log.exception("Exception in transaction handler")
-            output = None
+            try:
+                output = await self.handle_transaction(
+                    transaction_id,
+                    events=events,
+                    extra_data=data,
+                    ephemeral=ephemeral,
+                    to_device=to_device,
+                    device_lists=device_lists,
+                    otk_counts=otk_counts,
+                )
+            except Exception:
+                self.log.exception("Exception in transaction handler")
+                output = None
+            finally:
+                self.log.debug(f"Finished handling transaction {transaction_id}")
+            self._mark_transaction_handled(transaction_id)
+            if self.transaction_store:
+                await self._store_transaction(transaction_id)
+            handled = True
         finally:
-            self.log.debug(f"Finished handling transaction {transaction_id}")
-
-        self.transactions.add(transaction_id)
+            del self._transactions_in_progress[transaction_id]
+            in_progress.set_result(handled)
+
+        return web.json_response(output or {}, dumps=json_codec.dumps)
+
+    def _mark_transaction_handled(self, transaction_id: str) -> None:
+        now = time.monotonic()
+        self.transactions[transaction_id] = now
+        self.transactions.move_to_end(transaction_id)
+        # Homeservers only retry recent transactions, so old IDs can be forgotten
+        expiry = now - self.transaction_ttl
+        while self.transactions and (
+            len(self.transactions) > self.max_transactions
+            or next(iter(self.transactions.values())) < expiry
+        ):
+            self.transactions.popitem(last=False)
+
+    async def _is_transaction_stored(self, transaction_id: str) -> bool:
+        try:
+            return await self.transaction_store.is_handled(transaction_id)
+        except Exception:
+            self.log.warning(
+                f"Failed to check if transaction {transaction_id} was already handled",
+                exc_info=True,
+            )
+            return False
 
-        return web.json_response(output or {})
+    async def _store_transaction(self, transaction_id: str) -> None:
+        try:
+            await self.transaction_store.mark_handled(transaction_id)
+        except Exception:
+            self.log.warning(
+                f"Failed to store handled transaction {transaction_id}", exc_info=True
+            )
 
     @staticmethod
     def _fix_prev_content(raw_event: JSON) -> None:
@@ -319,6 +427,9 @@ class AppServiceServerMixin:
                 self.log.exception("Failed to deserialize ephemeral event %s", raw_edu)
             else:
                 await self.handle_matrix_event(edu, ephemeral=True)
+        if self.room_concurrency_limit > 0:
+            await self._handle_events_per_room(events)
+            return {}
         for raw_event in events:
             try:
                 self._fix_prev_content(raw_event)
@@ -329,7 +440,30 @@ class AppServiceServerMixin:
                 await self.handle_matrix_event(event)
         return {}
 
-    async def handle_matrix_event(self, event: Event, ephemeral: bool = False) -> None:
+    async def _handle_events_per_room(self, raw_events: list[JSON]) -> None:
+        rooms: dict[RoomID | None, list[Event]] = defaultdict(list)
+        for raw_event in raw_events:
+            try:
+                self._fix_prev_content(raw_event)
+                event = Event.deserialize(raw_event)
+            except SerializerError:
+                self.log.exception("Failed to deserialize event %s", raw_event)
+            else:
+                rooms[getattr(event, "room_id", None)].append(event)
+        room_queues = iter(rooms.values())
+
+        async def worker() -> None:
+            # The iterator is shared, so each worker picks up the next room when it's done
+            for room_events in room_queues:
+                for evt in room_events:
+                    await self.handle_matrix_event(evt, wait=True)
+
+        worker_count = min(self.room_concurrency_limit, len(rooms))
+        await asyncio.gather(*(worker() for _ in range(worker_count)))
+
+    async def handle_matrix_event(
+        self, event: Event, ephemeral: bool = False, wait: bool = False
+    ) -> None:
         if ephemeral:
             event.type = event.type.with_class(EventType.Class.EPHEMERAL)
         elif getattr(event, "state_key", None) is not None:
@@ -343,7 +477,10 @@ class AppServiceServerMixin:
             except Exception:
                 self.log.exception("Exception in Matrix event handler")
 
-        if self.synchronous_handlers:
+        if wait:
+            for handler in self.event_handlers:
+                await try_handle(handler)
+        elif self.synchronous_handlers:
             for handler in self.event_handlers:
                 await handler(event)
         else:
@@ -0,0 +1,179 @@
+# Copyright (c) 2026 Tulir Asokan
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+from __future__ import annotations
+
+from typing import AsyncIterator
+from contextlib import asynccontextmanager
+import asyncio
+import logging
+
+from aiohttp import web
+from aiohttp.test_utils import TestClient, TestServer
+
+from mautrix.types import Event
+from mautrix.util.async_db import Database
+
+from .as_handler import AppServiceServerMixin
+from .transaction_store import PgTransactionStore
+
+HS_TOKEN = "hs_token"
+
+
+def make_handler(**kwargs) -> tuple[AppServiceServerMixin, list[Event]]:
+    handler = AppServiceServerMixin(
+        log=logging.getLogger("mau.as.test"), hs_token=HS_TOKEN, **kwargs
+    )
+    handled = []
+
+    @handler.matrix_event_handler
+    async def record(evt: Event) -> None:
+        handled.append(evt)
+
+    handler.synchronous_handlers = True
+    return handler, handled
+
+
+@asynccontextmanager
+async def serve(handler: AppServiceServerMixin) -> AsyncIterator[TestClient]:
+    app = web.Application()
+    handler.register_routes(app)
+    async with TestClient(TestServer(app)) as client:
+        yield client
+
+
+def make_event(room_id: str, event_id: str) -> dict:
+    return {
+        "type": "m.room.message",
+        "room_id": room_id,
+        "event_id": event_id,
+        "sender": "@user:example.com",
+        "origin_server_ts": 1,
+        "content": {"msgtype": "m.text", "body": event_id},
+    }
+
+
+async def send_transaction(client: TestClient, txn_id: str, events: list[dict]) -> None:
+    resp = await client.put(
+        f"/_matrix/app/v1/transactions/{txn_id}",
+        json={"events": events},
+        headers={"Authorization": f"Bearer {HS_TOKEN}"},
+    )
+    assert resp.status == 200
+
+
+def test_transaction_window_evicts_by_count() -> None:
+    handler, _ = make_handler(max_transactions=3)
+    for i in range(5):
+        handler._mark_transaction_handled(f"txn{i}")
+    assert list(handler.transactions) == ["txn2", "txn3", "txn4"]
+
+
+def test_transaction_window_evicts_by_ttl() -> None:
+    handler, _ = make_handler(transaction_ttl=60)
+    handler._mark_transaction_handled("old")
+    handler._mark_transaction_handled("new")
+    # Pretend the first transaction was handled over a minute ago
+    handler.transactions["old"] -= 61
+    handler._mark_transaction_handled("newer")
+    assert list(handler.transactions) == ["new", "newer"]
+
+
+async def test_retried_transaction_ignored() -> None:
+    handler, handled = make_handler()
+    async with serve(handler) as client:
+        await send_transaction(client, "txn1", [make_event("!room:example.com", "$a")])
+        await send_transaction(client, "txn1", [make_event("!room:example.com", "$a")])
+    assert [evt.event_id for evt in handled] == ["$a"]
+
+
+async def test_transaction_store_survives_restart() -> None:
+    db = Database.create(
+        "sqlite::memory:", upgrade_table=PgTransactionStore.upgrade_table, db_args={"min_size": 1}
+    )
+    await db.start()
+    try:
+        handler, handled = make_handler(transaction_store=PgTransactionStore(db))
+        async with serve(handler) as client:
+            await send_transaction(client, "txn1", [make_event("!room:example.com", "$a")])
+        assert [evt.event_id for evt in handled] == ["$a"]
+
+        # A new handler has an empty in-memory window, but the retry is still detected
+        restarted, restarted_handled = make_handler(transaction_store=PgTransactionStore(db))
+        async with serve(restarted) as client:
+            await send_transaction(client, "txn1", [make_event("!room:example.com", "$a")])
+            await send_transaction(client, "txn2", [make_event("!room:example.com", "$b")])
+        assert [evt.event_id for evt in restarted_handled] == ["$b"]
+    finally:
+        await db.stop()
+
+
+class RecordingHandler:
+    def __init__(self, delay: float = 0.01) -> None:
+        self.delay = delay
+        self.order: dict[str, list[str]] = {}
+        self.active_rooms: set[str] = set()
+        self.max_active_rooms = 0
+        self.overlapped = False
+
+    async def __call__(self, evt: Event) -> None:
+        # Errors in handlers are only logged, so record overlaps instead of asserting here
+        self.overlapped = self.overlapped or evt.room_id in self.active_rooms
+        self.active_rooms.add(evt.room_id)
+        self.max_active_rooms = max(self.max_active_rooms, len(self.active_rooms))
+        try:
+            await asyncio.sleep(self.delay)
+            self.order.setdefault(evt.room_id, []).append(evt.event_id)
+        finally:
+            self.active_rooms.remove(evt.room_id)
+
+
+async def test_events_handled_in_order_per_room() -> None:
+    handler, _ = make_handler(room_concurrency_limit=2)
+    handler.event_handlers = [recorder := RecordingHandler()]
+    events = [
+        make_event(f"!room{room}:example.com", f"$room{room}_{i}")
+        for i in range(5)
+        for room in range(4)
+    ]
+    await handler.handle_transaction("txn1", events=events, extra_data={})
+    assert recorder.order == {
+        f"!room{room}:example.com": [f"$room{room}_{i}" for i in range(5)] for room in range(4)
+    }
+    assert not recorder.overlapped
+    assert recorder.max_active_rooms == 2
+
+
+async def test_room_concurrency_limit_caps_rooms() -> None:
+    handler, _ = make_handler(room_concurrency_limit=3)
+    handler.event_handlers = [recorder := RecordingHandler()]
+    events = [make_event(f"!room{i}:example.com", f"$event{i}") for i in range(10)]
+    await handler.handle_transaction("txn1", events=events, extra_data={})
+    assert recorder.max_active_rooms == 3
+    assert len(recorder.order) == 10
+
+
+async def test_retried_in_progress_transaction_waits() -> None:
+    handler, _ = make_handler()
+    unblock = asyncio.Event()
+    calls = []
+
+    async def slow_handler(evt: Event) -> None:
+        calls.append(evt.event_id)
+        await unblock.wait()
+
+    handler.event_handlers = [slow_handler]
+    events = [make_event("!room:example.com", "$a")]
+    async with serve(handler) as client:
+        first = asyncio.create_task(send_transaction(client, "txn1", events))
+        while not calls:
+            await asyncio.sleep(0.01)
+        # The homeserver timed out and retried while the first attempt is still running
+        retry = asyncio.create_task(send_transaction(client, "txn1", events))
+        await asyncio.sleep(0.05)
+        assert not retry.done()
+        unblock.set()
+        await asyncio.wait_for(asyncio.gather(first, retry), 5)
+    assert calls == ["$a"]
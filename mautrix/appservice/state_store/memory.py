@@ -6,21 +6,42 @@
 from typing import Dict, Optional, Tuple
 from abc import ABC
 import time
+import weakref
 
 from mautrix.client.state_store import StateStore as ClientStateStore
 from mautrix.types import EventID, RoomID, UserID
+from mautrix.util.lru import LRUCache
+from mautrix.util.opt_prometheus import Gauge
+
+CACHE_SIZE = Gauge(
+    name="bridge_as_state_store_cache_size",
+    documentation="The number of entries in the non-persistent appservice state store caches",
+    labelnames=("cache",),
+)
+# The gauges are summed over all live state stores, without keeping the stores alive.
+_instances: "weakref.WeakSet[ASStateStore]" = weakref.WeakSet()
+CACHE_SIZE.labels(cache="presence").set_function(
+    lambda: sum(len(store._presence) for store in _instances)
+)
+CACHE_SIZE.labels(cache="read").set_function(lambda: sum(len(store._read) for store in _instances))
 
 
 class ASStateStore(ClientStateStore, ABC):
-    _presence: Dict[UserID, str]
-    _read: Dict[Tuple[RoomID, UserID], EventID]
+    _presence: LRUCache[UserID, str]
+    _read: LRUCache[Tuple[RoomID, UserID], EventID]
     _registered: Dict[UserID, bool]
 
+    cache_max_presence: Optional[int] = 10000
+    """The maximum number of users whose presence to remember."""
+    cache_max_read: Optional[int] = 10000
+    """The maximum number of read receipts to remember."""
+
     def __init__(self) -> None:
         self._registered = {}
         # Non-persistent storage
-        self._presence = {}
-        self._read = {}
+        self._presence = LRUCache(self.cache_max_presence)
+        self._read = LRUCache(self.cache_max_read)
+        _instances.add(self)
 
     async def is_registered(self, user_id: UserID) -> bool:
         """
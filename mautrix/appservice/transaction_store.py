@@ -0,0 +1,90 @@
+# Copyright (c) 2026 Tulir Asokan
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+from __future__ import annotations
+
+import logging
+import time
+
+from mautrix.util.async_db import Connection, Database, UpgradeTable
+
+upgrade_table = UpgradeTable(
+    version_table_name="mx_appservice_txn_version",
+    database_name="appservice transaction log",
+    log=logging.getLogger("mau.as.db.upgrade"),
+)
+
+
+@upgrade_table.register(description="Latest revision", upgrades_to=1)
+async def upgrade_blank_to_v1(conn: Connection) -> None:
+    await conn.execute("""
+        CREATE TABLE mx_appservice_transaction (
+            txn_id     TEXT PRIMARY KEY,
+            handled_at BIGINT NOT NULL
+        )
+    """)
+    await conn.execute(
+        "CREATE INDEX mx_appservice_transaction_handled_at_idx "
+        "ON mx_appservice_transaction (handled_at)"
+    )
+
+
+class PgTransactionStore:
+    """
+    A database-backed record of handled appservice transactions, which lets
+    :class:`AppServiceServerMixin` ignore transactions that the homeserver retries after the
+    appservice has been restarted. Like the in-memory window, it's bounded by a maximum number
+    of transactions and a TTL, and older entries are pruned every time a transaction is marked
+    as handled.
+    """
+
+    upgrade_table = upgrade_table
+
+    db: Database
+    max_transactions: int
+    transaction_ttl: float
+
+    _is_handled_q = (
+        "SELECT EXISTS(SELECT 1 FROM mx_appservice_transaction WHERE txn_id=$1 AND handled_at>=$2)"
+    )
+    _mark_handled_q = (
+        "INSERT INTO mx_appservice_transaction (txn_id, handled_at) VALUES ($1, $2) "
+        "ON CONFLICT (txn_id) DO UPDATE SET handled_at=excluded.handled_at"
+    )
+    _prune_expired_q = "DELETE FROM mx_appservice_transaction WHERE handled_at<$1"
+    _prune_oldest_q = """
+    DELETE FROM mx_appservice_transaction WHERE handled_at<=(
+        SELECT handled_at FROM mx_appservice_transaction
+        ORDER BY handled_at DESC LIMIT 1 OFFSET $1
+    )
+    """
+
+    def __init__(
+        self, db: Database, max_transactions: int = 10000, transaction_ttl: float = 24 * 60 * 60
+    ) -> None:
+        """
+        Args:
+            db: The database to store transaction IDs in.
+            max_transactions: The maximum number of transaction IDs to keep.
+            transaction_ttl: The number of seconds to keep transaction IDs for.
+        """
+        self.db = db
+        self.max_transactions = max_transactions
+        self.transaction_ttl = transaction_ttl
+
+    @staticmethod
+    def _now() -> int:
+        return int(time.time() * 1000)
+
+    async def is_handled(self, txn_id: str) -> bool:
+        expiry = self._now() - int(self.transaction_ttl * 1000)
+        return bool(await self.db.fetchval(self._is_handled_q, txn_id, expiry))
+
+    async def mark_handled(self, txn_id: str) -> None:
+        now = self._now()
+        async with self.db.acquire() as conn, conn.transaction():
+            await conn.execute(self._mark_handled_q, txn_id, now)
+            await conn.execute(self._prune_expired_q, now - int(self.transaction_ttl * 1000))
+            await conn.execute(self._prune_oldest_q, self.max_transactions)
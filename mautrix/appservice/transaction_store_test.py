@@ -0,0 +1,112 @@
+# Copyright (c) 2026 Tulir Asokan
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+from __future__ import annotations
+
+from typing import AsyncContextManager, AsyncIterator, Callable
+from contextlib import asynccontextmanager
+import os
+import random
+import string
+import time
+
+import asyncpg
+import pytest
+
+from mautrix.util.async_db import Database
+
+from .transaction_store import PgTransactionStore
+
+
+@asynccontextmanager
+async def async_postgres_db() -> AsyncIterator[Database]:
+    try:
+        pg_url = os.environ["MEOW_TEST_PG_URL"]
+    except KeyError:
+        pytest.skip("Skipped Postgres tests (MEOW_TEST_PG_URL not specified)")
+        return
+    conn: asyncpg.Connection = await asyncpg.connect(pg_url)
+    schema_name = "".join(random.choices(string.ascii_lowercase, k=8))
+    schema_name = f"test_schema_{schema_name}_{int(time.time())}"
+    await conn.execute(f"CREATE SCHEMA {schema_name}")
+    db = Database.create(
+        pg_url,
+        upgrade_table=PgTransactionStore.upgrade_table,
+        db_args={"min_size": 1, "max_size": 3, "server_settings": {"search_path": schema_name}},
+    )
+    await db.start()
+    yield db
+    await db.stop()
+    await conn.execute(f"DROP SCHEMA {schema_name} CASCADE")
+    await conn.close()
+
+
+@asynccontextmanager
+async def async_sqlite_db() -> AsyncIterator[Database]:
+    db = Database.create(
+        "sqlite::memory:", upgrade_table=PgTransactionStore.upgrade_table, db_args={"min_size": 1}
+    )
+    await db.start()
+    yield db
+    await db.stop()
+
+
+@pytest.fixture(params=[async_postgres_db, async_sqlite_db])
+async def db(request) -> AsyncIterator[Database]:
+    param: Callable[[], AsyncContextManager[Database]] = request.param
+    async with param() as db:
+        yield db
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 1_000_000
+
+    def __call__(self) -> int:
+        return self.now
+
+
+async def test_mark_handled(db: Database) -> None:
+    store = PgTransactionStore(db)
+    assert not await store.is_handled("txn1")
+    await store.mark_handled("txn1")
+    assert await store.is_handled("txn1")
+    # Marking the same transaction again just refreshes it
+    await store.mark_handled("txn1")
+    assert await store.is_handled("txn1")
+    assert not await store.is_handled("txn2")
+
+
+async def test_evict_by_count(db: Database) -> None:
+    store = PgTransactionStore(db, max_transactions=3)
+    store._now = clock = FakeClock()
+    for i in range(5):
+        clock.now += 1000
+        await store.mark_handled(f"txn{i}")
+    assert [await store.is_handled(f"txn{i}") for i in range(5)] == [
+        False,
+        False,
+        True,
+        True,
+        True,
+    ]
+    assert await db.fetchval("SELECT COUNT(*) FROM mx_appservice_transaction") == 3
+
+
+async def test_evict_by_ttl(db: Database) -> None:
+    store = PgTransactionStore(db, transaction_ttl=60)
+    store._now = clock = FakeClock()
+    await store.mark_handled("old")
+    clock.now += 30 * 1000
+    await store.mark_handled("new")
+    assert await store.is_handled("old")
+
+    clock.now += 31 * 1000
+    # Expired transactions aren't reported as handled even before they're pruned
+    assert not await store.is_handled("old")
+    assert await store.is_handled("new")
+    await store.mark_handled("newer")
+    rows = await db.fetch("SELECT txn_id FROM mx_appservice_transaction ORDER BY handled_at")
+    assert [row["txn_id"] for row in rows] == ["new", "newer"]
@@ -9,18 +9,22 @@ from typing import Any
 from abc import ABC, abstractmethod
 from enum import Enum
 import asyncio
+import logging
 import sys
 
 from aiohttp import web
+import aiohttp
 
 from mautrix import __version__ as __mautrix_version__
-from mautrix.api import HTTPAPI
+from mautrix.api import HTTPAPI, RateLimiter
 from mautrix.appservice import AppService, ASStateStore
+from mautrix.appservice.transaction_store import PgTransactionStore
 from mautrix.client.state_store.asyncpg import PgStateStore as PgClientStateStore
 from mautrix.errors import MExclusive, MUnknownToken
 from mautrix.types import RoomID, UserID
 from mautrix.util.async_db import Database, DatabaseException, UpgradeTable
 from mautrix.util.bridge_state import BridgeState, BridgeStateEvent, GlobalBridgeState
+from mautrix.util.message_send_checkpoint import MessageSendCheckpointDispatcher
 from mautrix.util.program import Program
 
 from .. import bridge as br
@@ -62,6 +66,10 @@ class Bridge(Program, ABC):
     homeserver_software: HomeserverSoftware
     beeper_network_name: str | None = None
     beeper_service_name: str | None = None
+    status_connection_limit: int = 10
+    _status_http_session: aiohttp.ClientSession | None
+    _status_http_session_closed: bool
+    checkpoint_dispatcher: MessageSendCheckpointDispatcher | None
 
     def __init__(
         self,
@@ -80,6 +88,23 @@ class Bridge(Program, ABC):
         if state_store_class:
             self.state_store_class = state_store_class
         self.manhole = None
+        self._status_http_session = None
+        self._status_http_session_closed = False
+        self.checkpoint_dispatcher = None
+
+    @property
+    def status_http_session(self) -> aiohttp.ClientSession | None:
+        """
+        The HTTP session used for sending bridge states and message send checkpoints.
+        The session is created on first use and closed when the bridge is stopped. After that,
+        this is ``None`` and anything still sending should use a temporary session instead.
+        """
+        if self._status_http_session_closed:
+            return None
+        elif self._status_http_session is None or self._status_http_session.closed:
+            connector = aiohttp.TCPConnector(limit=self.status_connection_limit)
+            self._status_http_session = aiohttp.ClientSession(connector=connector)
+        return self._status_http_session
 
     def prepare_arg_parser(self) -> None:
         super().prepare_arg_parser()
@@ -158,6 +183,16 @@ class Bridge(Program, ABC):
         else:
             self.state_store = self.state_store_class()
 
+    def make_rate_limiter(self) -> RateLimiter | None:
+        rate_limits = self.config.get("homeserver.rate_limits", None)
+        if rate_limits is None:
+            return None
+        try:
+            return RateLimiter.from_config(rate_limits)
+        except ValueError as e:
+            self.log.fatal(f"Invalid value for homeserver.rate_limits in config: {e}")
+            sys.exit(11)
+
     def prepare_appservice(self) -> None:
         self.make_state_store()
         mb = 1024**2
@@ -176,9 +211,16 @@ class Bridge(Program, ABC):
             tls_key=self.config.get("appservice.tls_key", None),
             bot_localpart=self.config["appservice.bot_username"],
             ephemeral_events=self.config["appservice.ephemeral_events"],
+            room_concurrency_limit=self.config.get("appservice.room_concurrency_limit", 0),
+            transaction_store=(
+                PgTransactionStore(self.db)
+                if self.config.get("appservice.persist_transactions", False)
+                else None
+            ),
             encryption_events=self.config["bridge.encryption.appservice"],
             default_ua=HTTPAPI.default_ua,
             default_http_retry_count=default_http_retry_count,
+            rate_limiter=self.make_rate_limiter(),
             log="mau.as",
             loop=self.loop,
             state_store=self.state_store,
@@ -186,6 +228,12 @@ class Bridge(Program, ABC):
             aiohttp_params={"client_max_size": self.config["appservice.max_body_size"] * mb},
         )
         self.az.app.router.add_post("/_matrix/app/com.beeper.bridge_state", self.get_bridge_state)
+        self.checkpoint_dispatcher = MessageSendCheckpointDispatcher(
+            endpoint=self.config["homeserver.message_send_checkpoint_endpoint"],
+            as_token=self.az.as_token,
+            log=logging.getLogger("mau.checkpoints"),
+            get_session=lambda: self.status_http_session,
+        )
 
     def prepare_db(self) -> None:
         if not hasattr(self, "upgrade_table") or not self.upgrade_table:
@@ -217,6 +265,9 @@ class Bridge(Program, ABC):
                 if isinstance(self.state_store, PgClientStateStore):
                     self.state_store.upgrade_table.allow_unsupported = ignore_unsupported
                     await self.state_store.upgrade_table.upgrade(self.db)
+                if self.az.transaction_store:
+                    self.az.transaction_store.upgrade_table.allow_unsupported = ignore_unsupported
+                    await self.az.transaction_store.upgrade_table.upgrade(self.db)
                 if self.matrix.e2ee:
                     self.matrix.e2ee.crypto_db.allow_unsupported = ignore_unsupported
                     self.matrix.e2ee.crypto_db.override_pool(self.db)
@@ -259,7 +310,9 @@ class Bridge(Program, ABC):
         status_endpoint = self.config["homeserver.status_endpoint"]
         if status_endpoint and await self.count_logged_in_users() == 0:
             state = BridgeState(state_event=BridgeStateEvent.UNCONFIGURED).fill()
-            while not await state.send(status_endpoint, self.az.as_token, self.log):
+            while not await state.send(
+                status_endpoint, self.az.as_token, self.log, session=self.status_http_session
+            ):
                 await asyncio.sleep(5)
 
     async def system_exit(self) -> None:
@@ -278,6 +331,12 @@ class Bridge(Program, ABC):
         await super().stop()
         if self.matrix.e2ee:
             await self.matrix.e2ee.stop()
+        if self.checkpoint_dispatcher:
+            await self.checkpoint_dispatcher.stop()
+        self._status_http_session_closed = True
+        if self._status_http_session:
+            await self._status_http_session.close()
+            self._status_http_session = None
         await self.stop_db()
 
     async def get_bridge_state(self, req: web.Request) -> web.Response:
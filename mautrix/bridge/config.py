@@ -99,6 +99,7 @@ class BaseBridgeConfig(BaseFileConfig, BaseValidatableConfig, ABC):
         copy("homeserver.verify_ssl")
         copy("homeserver.http_retry_count")
         copy("homeserver.connection_limit")
+        copy("homeserver.rate_limits")
         copy("homeserver.status_endpoint")
         copy("homeserver.message_send_checkpoint_endpoint")
         copy("homeserver.async_media")
@@ -132,6 +133,8 @@ class BaseBridgeConfig(BaseFileConfig, BaseValidatableConfig, ABC):
         copy("appservice.hs_token")
 
         copy("appservice.ephemeral_events")
+        copy("appservice.room_concurrency_limit")
+        copy("appservice.persist_transactions")
 
         copy("bridge.management_room_text.welcome")
         copy("bridge.management_room_text.welcome_connected")
@@ -7,7 +7,9 @@ from __future__ import annotations
 
 from typing import TypeVar
 from abc import ABC, abstractmethod
+import heapq
 import time
+import warnings
 
 from attr import dataclass
 
@@ -41,6 +43,36 @@ class AbstractDisappearingMessage(ABC):
     async def get_all_scheduled(cls: type[DisappearingMessage]) -> list[DisappearingMessage]:
         pass
 
+    @classmethod
+    async def get_upcoming_scheduled(
+        cls: type[DisappearingMessage], limit: int
+    ) -> list[DisappearingMessage]:
+        """
+        Get the scheduled messages that will expire soonest, ordered by ``expiration_ts``.
+
+        This is called by the disappearing message scheduler every time it wakes up, so it
+        should only load the requested number of rows, e.g. with a query like
+        ``WHERE expiration_ts IS NOT NULL ORDER BY expiration_ts LIMIT $1``.
+
+        .. deprecated:: 0.21.2
+            The default implementation scans the output of :meth:`get_all_scheduled` on every
+            call. Subclasses should override this with a limited query.
+
+        Args:
+            limit: The maximum number of messages to return.
+        """
+        warnings.warn(
+            f"{cls.__name__} doesn't implement get_upcoming_scheduled, "
+            "falling back to scanning get_all_scheduled",
+            DeprecationWarning,
+        )
+        msgs = await cls.get_all_scheduled()
+        return heapq.nsmallest(
+            limit,
+            (msg for msg in msgs if msg.expiration_ts is not None),
+            key=lambda msg: msg.expiration_ts,
+        )
+
     @classmethod
     @abstractmethod
     async def get_unscheduled_for_room(
@@ -5,7 +5,6 @@
 # file, You can obtain one at http://mozilla.org/MPL/2.0/.
 from __future__ import annotations
 
-from collections import defaultdict
 import asyncio
 import logging
 import sys
@@ -58,6 +57,7 @@ from mautrix.types import (
     VersionsResponse,
 )
 from mautrix.util import background_task, markdown
+from mautrix.util.keyed_lock import KeyedLock
 from mautrix.util.logging import TraceLogger
 from mautrix.util.message_send_checkpoint import (
     CHECKPOINT_TYPES,
@@ -144,7 +144,7 @@ class BaseMatrixHandler:
     media_config: MediaRepoConfig
     versions: VersionsResponse
     minimum_spec_version: Version = SpecVersions.V11
-    room_locks: dict[str, asyncio.Lock]
+    room_locks: KeyedLock[RoomID]
 
     user_id_prefix: str
     user_id_suffix: str
@@ -161,7 +161,7 @@ class BaseMatrixHandler:
         self.media_config = MediaRepoConfig(upload_size=50 * 1024 * 1024)
         self.versions = VersionsResponse.deserialize({"versions": ["v1.3"]})
         self.az.matrix_event_handler(self.int_handle_event)
-        self.room_locks = defaultdict(asyncio.Lock)
+        self.room_locks = KeyedLock()
 
         self.e2ee = None
         self.require_e2ee = False
@@ -728,7 +728,7 @@ class BaseMatrixHandler:
                     message="Command execution failed",
                 )
             else:
-                await MessageSendCheckpoint(
+                checkpoint = MessageSendCheckpoint(
                     event_id=event_id,
                     room_id=room_id,
                     step=MessageSendCheckpointStep.COMMAND,
@@ -737,11 +737,8 @@ class BaseMatrixHandler:
                     reported_by=MessageSendCheckpointReportedBy.BRIDGE,
                     event_type=EventType.ROOM_MESSAGE,
                     message_type=message.msgtype,
-                ).send(
-                    self.bridge.config["homeserver.message_send_checkpoint_endpoint"],
-                    self.az.as_token,
-                    self.log,
                 )
+                self.bridge.checkpoint_dispatcher.queue(checkpoint)
                 await self._send_mss(evt, status=MessageStatus.SUCCESS)
         else:
             self.log.debug(
@@ -933,7 +930,7 @@ class BaseMatrixHandler:
             info=str(err) if err else None,
             retry_num=retry_num,
         )
-        background_task.create(checkpoint.send(endpoint, self.az.as_token, self.log))
+        self.bridge.checkpoint_dispatcher.queue(checkpoint)
 
     allowed_event_classes: tuple[type, ...] = (
         MessageEvent,
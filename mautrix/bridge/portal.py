@@ -31,6 +31,7 @@ from mautrix.types import (
     UserID,
 )
 from mautrix.util import background_task
+from mautrix.util.keyed_lock import KeyedLock
 from mautrix.util.logging import TraceLogger
 from mautrix.util.simple_lock import SimpleLock
 
@@ -62,9 +63,13 @@ class DMCreateError(RejectMatrixInvite):
 
 class BasePortal(ABC):
     log: TraceLogger = logging.getLogger("mau.portal")
-    _async_get_locks: dict[Any, asyncio.Lock] = defaultdict(lambda: asyncio.Lock())
+    _async_get_locks: KeyedLock[Any] = KeyedLock()
     disappearing_msg_class: type[br.AbstractDisappearingMessage] | None = None
+    disappearing_batch_size: int = 100
     _disappearing_lock: asyncio.Lock | None
+    _disappearing_scheduler: asyncio.Task | None = None
+    _disappearing_wakeup: asyncio.Event | None = None
+    _disappearing_next_ts: int | None = None
     az: AppService
     matrix: br.BaseMatrixHandler
     bridge: br.Bridge
@@ -396,16 +401,87 @@ class BasePortal(ABC):
         """
         Restart disappearing message timers for all messages that were already scheduled to
         disappear earlier. This should be called at bridge startup.
+
+        All scheduled messages are handled by a single background task, which only loads the
+        next :attr:`disappearing_batch_size` messages from the database at a time.
         """
         if not cls.disappearing_msg_class:
             return
-        msgs = await cls.disappearing_msg_class.get_all_scheduled()
+        upcoming_impl = cls.disappearing_msg_class.get_upcoming_scheduled.__func__
+        if upcoming_impl is br.AbstractDisappearingMessage.get_upcoming_scheduled.__func__:
+            cls.log.warning(
+                f"{cls.disappearing_msg_class.__name__} doesn't implement "
+                "get_upcoming_scheduled, all scheduled messages will be loaded from the "
+                "database every time the disappearing message scheduler wakes up"
+            )
+        cls._start_disappearing_scheduler()
+
+    @classmethod
+    def _start_disappearing_scheduler(cls) -> None:
+        if cls._disappearing_scheduler and not cls._disappearing_scheduler.done():
+            return
+        cls._disappearing_wakeup = asyncio.Event()
+        cls._disappearing_scheduler = background_task.create(
+            cls._disappearing_scheduler_loop(), name="disappearing message scheduler"
+        )
+
+    @classmethod
+    def _wake_disappearing_scheduler(cls, expiration_ts: int) -> None:
+        cls._start_disappearing_scheduler()
+        if cls._disappearing_next_ts is None or expiration_ts < cls._disappearing_next_ts:
+            cls._disappearing_wakeup.set()
+
+    @classmethod
+    async def _disappearing_scheduler_loop(cls) -> None:
+        prev_batch: set[EventID] = set()
+        while True:
+            cls._disappearing_wakeup.clear()
+            cls._disappearing_next_ts = None
+            try:
+                msgs = await cls.disappearing_msg_class.get_upcoming_scheduled(
+                    cls.disappearing_batch_size
+                )
+            except Exception:
+                cls.log.exception("Failed to get scheduled disappearing messages")
+                await asyncio.sleep(60)
+                continue
+            now = int(time.time() * 1000)
+            expired = [msg for msg in msgs if msg.expiration_ts <= now]
+            if not expired:
+                timeout = None
+                if msgs:
+                    cls._disappearing_next_ts = msgs[0].expiration_ts
+                    timeout = (cls._disappearing_next_ts - now) / 1000
+                try:
+                    await asyncio.wait_for(cls._disappearing_wakeup.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            if any(msg.event_id in prev_batch for msg in expired):
+                # Deleting the database rows failed, so the same messages came back.
+                cls.log.warning(
+                    "Some expired disappearing messages weren't removed from the database, "
+                    "retrying in 60 seconds"
+                )
+                await asyncio.sleep(60)
+            prev_batch = {msg.event_id for msg in expired}
+            try:
+                await cls._disappear_batch(expired)
+            except Exception:
+                cls.log.exception("Failed to handle batch of expired disappearing messages")
+
+    @classmethod
+    async def _disappear_batch(cls, msgs: list[br.AbstractDisappearingMessage]) -> None:
+        msgs_by_room: dict[RoomID, list[br.AbstractDisappearingMessage]] = defaultdict(list)
         for msg in msgs:
-            portal = await cls.bridge.get_portal(msg.room_id)
+            msgs_by_room[msg.room_id].append(msg)
+        for room_id, room_msgs in msgs_by_room.items():
+            portal = await cls.bridge.get_portal(room_id)
             if portal and portal.mxid:
-                background_task.create(portal._disappear_event(msg))
+                await asyncio.gather(*(portal._disappear_event(msg) for msg in room_msgs))
             else:
-                await msg.delete()
+                for msg in room_msgs:
+                    await msg.delete()
 
     async def schedule_disappearing(self) -> None:
         """
@@ -419,7 +495,8 @@ class BasePortal(ABC):
             for msg in msgs:
                 msg.start_timer()
                 await msg.update()
-                background_task.create(self._disappear_event(msg))
+            if msgs:
+                self._wake_disappearing_scheduler(min(msg.expiration_ts for msg in msgs))
 
     async def _send_message(
         self,
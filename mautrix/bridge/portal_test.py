@@ -0,0 +1,202 @@
+# Copyright (c) 2026 Tulir Asokan
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+from __future__ import annotations
+
+from typing import Any, AsyncIterator, Callable, ClassVar
+import asyncio
+import time
+
+import pytest
+
+from mautrix.types import EventID, RoomID
+
+from .disappearing_message import AbstractDisappearingMessage
+from .portal import BasePortal
+
+
+class MemoryDisappearingMessage(AbstractDisappearingMessage):
+    rows: ClassVar[dict[EventID, MemoryDisappearingMessage]] = {}
+    upcoming_calls: ClassVar[list[int]] = []
+
+    async def insert(self) -> None:
+        self.rows[self.event_id] = self
+
+    async def update(self) -> None:
+        self.rows[self.event_id] = self
+
+    async def delete(self) -> None:
+        self.rows.pop(self.event_id, None)
+
+    @classmethod
+    async def get_all_scheduled(cls) -> list[MemoryDisappearingMessage]:
+        return [msg for msg in cls.rows.values() if msg.expiration_ts is not None]
+
+    @classmethod
+    async def get_upcoming_scheduled(cls, limit: int) -> list[MemoryDisappearingMessage]:
+        cls.upcoming_calls.append(limit)
+        msgs = await cls.get_all_scheduled()
+        return sorted(msgs, key=lambda msg: msg.expiration_ts)[:limit]
+
+    @classmethod
+    async def get_unscheduled_for_room(cls, room_id: RoomID) -> list[MemoryDisappearingMessage]:
+        return [
+            msg
+            for msg in cls.rows.values()
+            if msg.room_id == room_id and msg.expiration_ts is None
+        ]
+
+
+class LegacyDisappearingMessage(MemoryDisappearingMessage):
+    get_upcoming_scheduled = AbstractDisappearingMessage.__dict__["get_upcoming_scheduled"]
+
+
+class FakeBridge:
+    portals: dict[RoomID, DummyPortal]
+    lookups: list[RoomID]
+
+    def __init__(self) -> None:
+        self.portals = {}
+        self.lookups = []
+
+    async def get_portal(self, room_id: RoomID) -> DummyPortal | None:
+        self.lookups.append(room_id)
+        return self.portals.get(room_id)
+
+
+class DummyPortal(BasePortal):
+    disappearing_msg_class = MemoryDisappearingMessage
+    disappearing_batch_size = 2
+    redacted: list[EventID]
+
+    def __init__(self, mxid: RoomID) -> None:
+        super().__init__()
+        self.mxid = mxid
+        self.redacted = []
+
+    async def _do_disappear(self, event_id: EventID) -> None:
+        self.redacted.append(event_id)
+
+    async def save(self) -> None:
+        pass
+
+    async def get_dm_puppet(self) -> None:
+        return None
+
+    async def handle_matrix_message(self, sender: Any, message: Any, event_id: EventID) -> None:
+        pass
+
+    @property
+    def bridge_info_state_key(self) -> str:
+        return "test"
+
+    @property
+    def bridge_info(self) -> dict[str, Any]:
+        return {}
+
+    async def delete(self) -> None:
+        pass
+
+
+@pytest.fixture
+async def bridge() -> AsyncIterator[FakeBridge]:
+    MemoryDisappearingMessage.rows = {}
+    MemoryDisappearingMessage.upcoming_calls = []
+    DummyPortal.bridge = FakeBridge()
+    yield DummyPortal.bridge
+    if DummyPortal._disappearing_scheduler:
+        DummyPortal._disappearing_scheduler.cancel()
+    DummyPortal._disappearing_scheduler = None
+    DummyPortal._disappearing_next_ts = None
+
+
+async def wait_until(condition: Callable[[], bool], timeout: float = 2) -> None:
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out waiting for condition"
+        await asyncio.sleep(0.01)
+
+
+async def add_message(
+    room_id: RoomID, event_id: str, expiration_ts: int | None
+) -> MemoryDisappearingMessage:
+    msg = MemoryDisappearingMessage(
+        room_id=room_id,
+        event_id=EventID(event_id),
+        expiration_seconds=0,
+        expiration_ts=expiration_ts,
+    )
+    await msg.insert()
+    return msg
+
+
+async def test_scheduler_pages_through_expired(bridge: FakeBridge) -> None:
+    room_id = RoomID("!room:example.com")
+    portal = bridge.portals[room_id] = DummyPortal(room_id)
+    now = int(time.time() * 1000)
+    for i in range(5):
+        await add_message(room_id, f"$event{i}", now - 1000 + i)
+
+    await DummyPortal.restart_scheduled_disappearing()
+    await wait_until(lambda: len(portal.redacted) == 5)
+
+    assert portal.redacted == [EventID(f"$event{i}") for i in range(5)]
+    assert not MemoryDisappearingMessage.rows
+    assert set(MemoryDisappearingMessage.upcoming_calls) == {DummyPortal.disappearing_batch_size}
+    # 5 messages with a batch size of 2 need 3 batches, plus the final empty fetch
+    assert len(MemoryDisappearingMessage.upcoming_calls) >= 4
+
+
+async def test_scheduler_redacts_batch_per_room(bridge: FakeBridge) -> None:
+    DummyPortal.disappearing_batch_size = 10
+    try:
+        room_a, room_b = RoomID("!a:example.com"), RoomID("!b:example.com")
+        no_portal = RoomID("!gone:example.com")
+        portal_a = bridge.portals[room_a] = DummyPortal(room_a)
+        portal_b = bridge.portals[room_b] = DummyPortal(room_b)
+        now = int(time.time() * 1000)
+        await add_message(room_a, "$a1", now - 30)
+        await add_message(room_b, "$b1", now - 20)
+        await add_message(room_a, "$a2", now - 10)
+        await add_message(no_portal, "$gone", now - 5)
+
+        await DummyPortal.restart_scheduled_disappearing()
+        await wait_until(lambda: not MemoryDisappearingMessage.rows)
+        await wait_until(lambda: len(portal_a.redacted) + len(portal_b.redacted) == 3)
+
+        assert sorted(portal_a.redacted) == [EventID("$a1"), EventID("$a2")]
+        assert portal_b.redacted == [EventID("$b1")]
+        # Each room's portal is only looked up once for the whole batch
+        assert sorted(bridge.lookups) == sorted([room_a, room_b, no_portal])
+    finally:
+        DummyPortal.disappearing_batch_size = 2
+
+
+async def test_scheduler_wakes_up_for_sooner_message(bridge: FakeBridge) -> None:
+    room_id = RoomID("!room:example.com")
+    portal = bridge.portals[room_id] = DummyPortal(room_id)
+    now = int(time.time() * 1000)
+    await add_message(room_id, "$later", now + 60 * 60 * 1000)
+
+    await DummyPortal.restart_scheduled_disappearing()
+    await wait_until(lambda: DummyPortal._disappearing_next_ts is not None)
+    assert DummyPortal._disappearing_next_ts == now + 60 * 60 * 1000
+
+    await add_message(room_id, "$sooner", None)
+    await portal.schedule_disappearing()
+    await wait_until(lambda: portal.redacted == [EventID("$sooner")])
+    assert EventID("$later") in MemoryDisappearingMessage.rows
+
+
+async def test_get_upcoming_scheduled_fallback(bridge: FakeBridge) -> None:
+    now = int(time.time() * 1000)
+    room_id = RoomID("!room:example.com")
+    for i in (3, 1, 2):
+        await add_message(room_id, f"$event{i}", now + i)
+    await add_message(room_id, "$unscheduled", None)
+
+    with pytest.warns(DeprecationWarning):
+        msgs = await LegacyDisappearingMessage.get_upcoming_scheduled(2)
+    assert [msg.event_id for msg in msgs] == [EventID("$event1"), EventID("$event2")]
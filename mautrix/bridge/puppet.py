@@ -7,12 +7,12 @@ from __future__ import annotations
 
 from typing import Any
 from abc import ABC, abstractmethod
-from collections import defaultdict
 import asyncio
 import logging
 
 from mautrix.appservice import AppService, IntentAPI
 from mautrix.types import UserID
+from mautrix.util.keyed_lock import KeyedLock
 from mautrix.util.logging import TraceLogger
 
 from .. import bridge as br
@@ -21,7 +21,7 @@ from .custom_puppet import CustomPuppetMixin
 
 class BasePuppet(CustomPuppetMixin, ABC):
     log: TraceLogger = logging.getLogger("mau.puppet")
-    _async_get_locks: dict[Any, asyncio.Lock] = defaultdict(lambda: asyncio.Lock())
+    _async_get_locks: KeyedLock[Any] = KeyedLock()
     az: AppService
     loop: asyncio.AbstractEventLoop
     mx: br.BaseMatrixHandler
@@ -18,6 +18,7 @@ from mautrix.errors import MNotFound
 from mautrix.types import EventID, EventType, Membership, MessageType, RoomID, UserID
 from mautrix.util import background_task
 from mautrix.util.bridge_state import BridgeState, BridgeStateEvent
+from mautrix.util.keyed_lock import KeyedLock
 from mautrix.util.logging import TraceLogger
 from mautrix.util.message_send_checkpoint import (
     MessageSendCheckpoint,
@@ -38,7 +39,7 @@ class WrappedTask(NamedTuple):
 
 class BaseUser(ABC):
     log: TraceLogger = logging.getLogger("mau.user")
-    _async_get_locks: dict[Any, asyncio.Lock] = defaultdict(lambda: asyncio.Lock())
+    _async_get_locks: KeyedLock[Any] = KeyedLock()
     az: AppService
     bridge: br.Bridge
     loop: asyncio.AbstractEventLoop
@@ -209,7 +210,9 @@ class BaseUser(ABC):
         url = self.bridge.config["homeserver.status_endpoint"]
         while self._bridge_state_queue:
             state = self._bridge_state_queue.popleft()
-            success = await state.send(url, self.az.as_token, self.log)
+            success = await state.send(
+                url, self.az.as_token, self.log, session=self.bridge.status_http_session
+            )
             if not success:
                 if state.send_attempts_ <= 10:
                     retry_seconds = state.send_attempts_**2
@@ -246,21 +249,19 @@ class BaseUser(ABC):
         if not self.bridge.config["homeserver.message_send_checkpoint_endpoint"]:
             return WrappedTask(task=None)
         task = background_task.create(
-            MessageSendCheckpoint(
-                event_id=event_id,
-                room_id=room_id,
-                step=MessageSendCheckpointStep.REMOTE,
-                timestamp=int(time.time() * 1000),
-                status=status,
-                reported_by=MessageSendCheckpointReportedBy.BRIDGE,
-                event_type=event_type,
-                message_type=message_type,
-                info=str(error) if error else None,
-                retry_num=retry_num,
-            ).send(
-                self.bridge.config["homeserver.message_send_checkpoint_endpoint"],
-                self.az.as_token,
-                self.log,
+            self.bridge.checkpoint_dispatcher.send(
+                MessageSendCheckpoint(
+                    event_id=event_id,
+                    room_id=room_id,
+                    step=MessageSendCheckpointStep.REMOTE,
+                    timestamp=int(time.time() * 1000),
+                    status=status,
+                    reported_by=MessageSendCheckpointReportedBy.BRIDGE,
+                    event_type=event_type,
+                    message_type=message_type,
+                    info=str(error) if error else None,
+                    retry_num=retry_num,
+                )
             )
         )
         return WrappedTask(task=task)
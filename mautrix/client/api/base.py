@@ -5,8 +5,6 @@
 # file, You can obtain one at http://mozilla.org/MPL/2.0/.
 from __future__ import annotations
 
-import json
-
 from aiohttp import ClientError, ClientSession, ContentTypeError
 from yarl import URL
 
@@ -20,6 +18,7 @@ from mautrix.errors import (
     WellKnownUnsupportedScheme,
 )
 from mautrix.types import DeviceID, SerializerError, UserID, VersionsResponse
+from mautrix.util import json_codec
 from mautrix.util.logging import TraceLogger
 
 
@@ -150,8 +149,8 @@ class BaseClientAPI:
             elif resp.status != 200:
                 raise WellKnownUnexpectedStatus(resp.status)
             try:
-                data = await resp.json(content_type=None)
-            except (json.JSONDecodeError, ContentTypeError) as e:
+                data = await resp.json(content_type=None, loads=json_codec.loads)
+            except (json_codec.JSONDecodeError, ContentTypeError) as e:
                 raise WellKnownNotJSON() from e
 
         try:
@@ -166,10 +165,10 @@ class BaseClientAPI:
 
         try:
             async with session.get(parsed_url / "_matrix/client/versions") as resp:
-                data = VersionsResponse.deserialize(await resp.json())
+                data = VersionsResponse.deserialize(await resp.json(loads=json_codec.loads))
                 if len(data.versions) == 0:
                     raise ValueError("no versions defined in /_matrix/client/versions response")
-        except (ClientError, json.JSONDecodeError, SerializerError, ValueError) as e:
+        except (ClientError, json_codec.JSONDecodeError, SerializerError, ValueError) as e:
             raise WellKnownInvalidVersionsResponse() from e
 
         return parsed_url
@@ -5,10 +5,11 @@
 # file, You can obtain one at http://mozilla.org/MPL/2.0/.
 from __future__ import annotations
 
-from typing import Awaitable, Literal, overload
-import json
+from typing import Awaitable, Callable, Literal, overload
 
-from mautrix.api import Method, Path
+from aiohttp import ClientResponse
+
+from mautrix.api import Method, Path, RequestPriority
 from mautrix.errors import MatrixResponseError
 from mautrix.types import (
     JSON,
@@ -44,6 +45,7 @@ from mautrix.types import (
     TextMessageEventContent,
     UserID,
 )
+from mautrix.util import json_codec
 from mautrix.util.formatter import parse_html
 
 from .base import BaseClientAPI
@@ -68,6 +70,7 @@ class EventMethods(BaseClientAPI):
         filter_id: FilterID | None = None,
         full_state: bool = False,
         set_presence: PresenceState | None = None,
+        response_handler: Callable[[ClientResponse], Awaitable[JSON]] | None = None,
     ) -> Awaitable[JSON]:
         """
         Perform a sync request. See also: `/sync API reference`_
@@ -83,6 +86,8 @@ class EventMethods(BaseClientAPI):
             full_state (bool): Return the full state for every room the user has joined
                 Defaults to false.
             set_presence (str): Should the client be marked as "online" or" offline"
+            response_handler: Optional. A function to read the response body incrementally
+                instead of parsing the whole thing as JSON at once.
 
         .. _/sync API reference:
             https://spec.matrix.org/v1.1/client-server-api/#get_matrixclientv3sync
@@ -97,7 +102,12 @@ class EventMethods(BaseClientAPI):
         if set_presence:
             request["set_presence"] = str(set_presence)
         return self.api.request(
-            Method.GET, Path.v3.sync, query_params=request, retry_count=0, metrics_method="sync"
+            Method.GET,
+            Path.v3.sync,
+            query_params=request,
+            retry_count=0,
+            metrics_method="sync",
+            response_handler=response_handler,
         )
 
     # endregion
@@ -378,7 +388,7 @@ class EventMethods(BaseClientAPI):
         if isinstance(filter_json, Serializable):
             filter_json = filter_json.json()
         elif isinstance(filter_json, dict):
-            filter_json = json.dumps(filter_json)
+            filter_json = json_codec.dumps(filter_json)
         query_params = {
             "from": from_token,
             "dir": direction.value,
@@ -483,6 +493,7 @@ class EventMethods(BaseClientAPI):
             raise ValueError("Event type not given")
         url = Path.v3.rooms[room_id].send[event_type][txn_id or self.api.get_txn_id()]
         content = content.serialize() if isinstance(content, Serializable) else content
+        kwargs.setdefault("priority", RequestPriority.HIGH)
         resp = await self.api.request(
             Method.PUT, url, content, **kwargs, metrics_method="sendMessageEvent"
         )
@@ -756,6 +767,7 @@ class EventMethods(BaseClientAPI):
         content = extra_content or {}
         if reason:
             content["reason"] = reason
+        kwargs.setdefault("priority", RequestPriority.HIGH)
         resp = await self.api.request(
             Method.PUT, url, content=content, **kwargs, metrics_method="redact"
         )
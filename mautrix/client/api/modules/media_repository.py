@@ -5,11 +5,13 @@
 # file, You can obtain one at http://mozilla.org/MPL/2.0/.
 from __future__ import annotations
 
-from typing import Any, AsyncIterable, Literal
-from contextlib import contextmanager
+from typing import Any, AsyncIterable, AsyncIterator, Literal
+from contextlib import asynccontextmanager, contextmanager
 import asyncio
+import os
 import time
 
+from aiohttp import ClientResponse
 from yarl import URL
 
 from mautrix import __optional_imports__
@@ -24,7 +26,13 @@ from mautrix.types import (
     SpecVersions,
 )
 from mautrix.util import background_task
-from mautrix.util.async_body import async_iter_bytes
+from mautrix.util.async_body import (
+    AsyncBody,
+    ProgressCallback,
+    async_iter_bytes,
+    iter_response_chunks,
+    write_response_to_file,
+)
 from mautrix.util.opt_prometheus import Histogram
 
 from ..base import BaseClientAPI
@@ -167,6 +175,34 @@ class MediaRepositoryMethods(BaseClientAPI):
             except KeyError:
                 raise MatrixResponseError("`content_uri` not in response.")
 
+    @asynccontextmanager
+    async def _download(
+        self,
+        url: ContentURI,
+        download_type: Literal["download", "thumbnail"],
+        query_params: dict[str, Any],
+    ) -> AsyncIterator[ClientResponse]:
+        authenticated = (await self.versions()).supports(SpecVersions.V111)
+        url = self.api.get_download_url(
+            url, download_type=download_type, authenticated=authenticated
+        )
+        query_params = {"allow_redirect": "true", **query_params}
+        headers: dict[str, str] = {}
+        if authenticated:
+            headers["Authorization"] = f"Bearer {self.api.token}"
+            if self.api.as_user_id:
+                query_params["user_id"] = self.api.as_user_id
+        req_id = self.api.log_download_request(url, query_params)
+        start = time.monotonic()
+        async with self.api.session.get(url, params=query_params, headers=headers) as response:
+            try:
+                response.raise_for_status()
+                yield response
+            finally:
+                self.api.log_download_request_done(
+                    url, req_id, time.monotonic() - start, response.status
+                )
+
     async def download_media(self, url: ContentURI, timeout_ms: int | None = None) -> bytes:
         """
         Download a file from the content repository.
@@ -181,26 +217,81 @@ class MediaRepositoryMethods(BaseClientAPI):
         Returns:
             The raw downloaded data.
         """
-        authenticated = (await self.versions()).supports(SpecVersions.V111)
-        url = self.api.get_download_url(url, authenticated=authenticated)
-        query_params: dict[str, Any] = {"allow_redirect": "true"}
+        query_params: dict[str, Any] = {}
         if timeout_ms is not None:
             query_params["timeout_ms"] = timeout_ms
-        headers: dict[str, str] = {}
-        if authenticated:
-            headers["Authorization"] = f"Bearer {self.api.token}"
-            if self.api.as_user_id:
-                query_params["user_id"] = self.api.as_user_id
-        req_id = self.api.log_download_request(url, query_params)
-        start = time.monotonic()
-        async with self.api.session.get(url, params=query_params, headers=headers) as response:
-            try:
-                response.raise_for_status()
-                return await response.read()
-            finally:
-                self.api.log_download_request_done(
-                    url, req_id, time.monotonic() - start, response.status
-                )
+        async with self._download(url, "download", query_params) as response:
+            return await response.read()
+
+    async def download_media_stream(
+        self,
+        url: ContentURI,
+        timeout_ms: int | None = None,
+        max_size: int | None = None,
+        progress: ProgressCallback | None = None,
+        chunk_size: int = 64 * 1024,
+    ) -> AsyncBody:
+        """
+        Download a file from the content repository without reading the whole file into memory.
+
+        The request is kept open until the returned generator is exhausted or closed, so make sure
+        to either read all of it or call ``aclose()`` on it.
+
+        Args:
+            url: The MXC URI to download.
+            timeout_ms: The maximum number of milliseconds that the client is willing to wait to
+                start receiving data. Used for asynchronous uploads.
+            max_size: The maximum file size. :class:`FileTooLargeError` is raised if the file
+                is bigger. ``None`` or ``0`` means there's no limit.
+            progress: A function to call with the number of bytes downloaded so far and the
+                total size (if known) after each chunk.
+            chunk_size: The maximum size of each chunk.
+
+        Returns:
+            An async generator that yields the downloaded data in chunks.
+        """
+        query_params: dict[str, Any] = {}
+        if timeout_ms is not None:
+            query_params["timeout_ms"] = timeout_ms
+        async with self._download(url, "download", query_params) as response:
+            async for chunk in iter_response_chunks(
+                response, max_size=max_size, progress=progress, chunk_size=chunk_size
+            ):
+                yield chunk
+
+    async def download_media_to_file(
+        self,
+        url: ContentURI,
+        path: str | os.PathLike,
+        timeout_ms: int | None = None,
+        max_size: int | None = None,
+        progress: ProgressCallback | None = None,
+    ) -> int:
+        """
+        Download a file from the content repository directly into a file on disk.
+        The data is written into a temporary ``.part`` file which is moved to the given path
+        once the download is complete. If the download fails, the temporary file is deleted.
+
+        Args:
+            url: The MXC URI to download.
+            path: The path to write the file to.
+            timeout_ms: The maximum number of milliseconds that the client is willing to wait to
+                start receiving data. Used for asynchronous uploads.
+            max_size: The maximum file size. :class:`FileTooLargeError` is raised if the file
+                is bigger. ``None`` or ``0`` means there's no limit.
+            progress: A function to call with the number of bytes downloaded so far and the
+                total size (if known) after each chunk.
+
+        Returns:
+            The size of the downloaded file.
+        """
+        query_params: dict[str, Any] = {}
+        if timeout_ms is not None:
+            query_params["timeout_ms"] = timeout_ms
+        async with self._download(url, "download", query_params) as response:
+            return await write_response_to_file(
+                response, path, max_size=max_size, progress=progress, log=self.log
+            )
 
     async def download_thumbnail(
         self,
@@ -232,11 +323,7 @@ class MediaRepositoryMethods(BaseClientAPI):
         Returns:
             The raw downloaded data.
         """
-        authenticated = (await self.versions()).supports(SpecVersions.V111)
-        url = self.api.get_download_url(
-            url, download_type="thumbnail", authenticated=authenticated
-        )
-        query_params: dict[str, Any] = {"allow_redirect": "true"}
+        query_params: dict[str, Any] = {}
         if width is not None:
             query_params["width"] = width
         if height is not None:
@@ -247,21 +334,8 @@ class MediaRepositoryMethods(BaseClientAPI):
             query_params["allow_remote"] = str(allow_remote).lower()
         if timeout_ms is not None:
             query_params["timeout_ms"] = timeout_ms
-        headers: dict[str, str] = {}
-        if authenticated:
-            headers["Authorization"] = f"Bearer {self.api.token}"
-            if self.api.as_user_id:
-                query_params["user_id"] = self.api.as_user_id
-        req_id = self.api.log_download_request(url, query_params)
-        start = time.monotonic()
-        async with self.api.session.get(url, params=query_params, headers=headers) as response:
-            try:
-                response.raise_for_status()
-                return await response.read()
-            finally:
-                self.api.log_download_request_done(
-                    url, req_id, time.monotonic() - start, response.status
-                )
+        async with self._download(url, "thumbnail", query_params) as response:
+            return await response.read()
 
     async def get_url_preview(self, url: str, timestamp: int | None = None) -> MXOpenGraph:
         """
@@ -0,0 +1,76 @@
+# Copyright (c) 2026 Tulir Asokan
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+from __future__ import annotations
+
+from typing import AsyncIterator
+import os
+
+from aiohttp import ClientSession, web
+from aiohttp.test_utils import TestServer
+import pytest
+
+from mautrix.client import ClientAPI
+from mautrix.types import ContentURI, VersionsResponse
+from mautrix.util.async_body import FileTooLargeError
+
+DATA = os.urandom(200 * 1024)
+MXC = ContentURI("mxc://example.com/media")
+
+
+async def download(req: web.Request) -> web.Response:
+    assert req.match_info["server"] == "example.com"
+    assert req.match_info["media_id"] == "media"
+    return web.Response(body=DATA)
+
+
+@pytest.fixture
+async def client() -> AsyncIterator[ClientAPI]:
+    app = web.Application()
+    app.router.add_get("/_matrix/media/v3/download/{server}/{media_id}", download)
+    async with TestServer(app) as server, ClientSession() as session:
+        client = ClientAPI(base_url=server.make_url("/"), token="token", client_session=session)
+        client.versions_cache = VersionsResponse.deserialize({"versions": ["v1.10"]})
+        yield client
+
+
+async def test_download_media_stream(client: ClientAPI) -> None:
+    progress = []
+    chunks = [
+        chunk
+        async for chunk in client.download_media_stream(
+            MXC,
+            progress=lambda read, total: progress.append((read, total)),
+            chunk_size=32 * 1024,
+        )
+    ]
+    assert b"".join(chunks) == DATA
+    assert progress[-1] == (len(DATA), len(DATA))
+    assert len(progress) == len(chunks)
+
+
+async def test_download_media_stream_too_large(client: ClientAPI) -> None:
+    with pytest.raises(FileTooLargeError):
+        async for _ in client.download_media_stream(MXC, max_size=len(DATA) - 1):
+            pass
+
+
+async def test_download_media_to_file(client: ClientAPI, tmp_path) -> None:
+    path = tmp_path / "media.bin"
+    progress = []
+    size = await client.download_media_to_file(
+        MXC, path, progress=lambda read, total: progress.append(read)
+    )
+    assert size == len(DATA)
+    assert path.read_bytes() == DATA
+    assert progress[-1] == len(DATA)
+    assert os.listdir(tmp_path) == ["media.bin"]
+
+
+async def test_download_media_to_file_too_large(client: ClientAPI, tmp_path) -> None:
+    path = tmp_path / "media.bin"
+    with pytest.raises(FileTooLargeError):
+        await client.download_media_to_file(MXC, path, max_size=len(DATA) - 1)
+    assert os.listdir(tmp_path) == []
@@ -5,7 +5,7 @@
 # file, You can obtain one at http://mozilla.org/MPL/2.0/.
 from __future__ import annotations
 
-from mautrix.api import Method, Path
+from mautrix.api import Method, Path, RequestPriority
 from mautrix.errors import MatrixResponseError
 from mautrix.types import (
     JSON,
@@ -56,7 +56,12 @@ class MiscModuleMethods(BaseClientAPI):
             content = {"typing": True, "timeout": timeout}
         else:
             content = {"typing": False}
-        await self.api.request(Method.PUT, Path.v3.rooms[room_id].typing[self.mxid], content)
+        await self.api.request(
+            Method.PUT,
+            Path.v3.rooms[room_id].typing[self.mxid],
+            content,
+            priority=RequestPriority.LOW,
+        )
 
     # endregion
     # region 13.5 Receipts
@@ -77,7 +82,11 @@ class MiscModuleMethods(BaseClientAPI):
             event_id: The last event ID to acknowledge.
             receipt_type: The type of receipt to send. Currently only ``m.read`` is supported.
         """
-        await self.api.request(Method.POST, Path.v3.rooms[room_id].receipt[receipt_type][event_id])
+        await self.api.request(
+            Method.POST,
+            Path.v3.rooms[room_id].receipt[receipt_type][event_id],
+            priority=RequestPriority.LOW,
+        )
 
     # endregion
     # region 13.6 Fully read markers
@@ -110,7 +119,12 @@ class MiscModuleMethods(BaseClientAPI):
             content["m.read"] = read_receipt
         if extra_content:
             content.update(extra_content)
-        await self.api.request(Method.POST, Path.v3.rooms[room_id].read_markers, content)
+        await self.api.request(
+            Method.POST,
+            Path.v3.rooms[room_id].read_markers,
+            content,
+            priority=RequestPriority.LOW,
+        )
 
     # endregion
     # region 13.7 Presence
@@ -134,7 +148,12 @@ class MiscModuleMethods(BaseClientAPI):
         }
         if status:
             content["status_msg"] = status
-        await self.api.request(Method.PUT, Path.v3.presence[self.mxid].status, content)
+        await self.api.request(
+            Method.PUT,
+            Path.v3.presence[self.mxid].status,
+            content,
+            priority=RequestPriority.LOW,
+        )
 
     async def get_presence(self, user_id: UserID) -> PresenceEventContent:
         """
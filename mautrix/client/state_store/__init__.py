@@ -1,10 +1,12 @@
 from .abstract import StateStore
+from .cache import CachedStateStore
 from .file import FileStateStore
 from .memory import MemoryStateStore
 from .sync import MemorySyncStore, SyncStore
 
 __all__ = [
     "StateStore",
+    "CachedStateStore",
     "FileStateStore",
     "MemoryStateStore",
     "MemorySyncStore",
@@ -5,8 +5,8 @@
 # file, You can obtain one at http://mozilla.org/MPL/2.0/.
 from __future__ import annotations
 
-from typing import Any, NamedTuple
-import json
+from typing import Any, NamedTuple, Union
+import asyncio
 
 from mautrix.types import (
     Member,
@@ -19,6 +19,7 @@ from mautrix.types import (
     StateEvent,
     UserID,
 )
+from mautrix.util import background_task, json_codec
 from mautrix.util.async_db import Database, Scheme
 
 from ..abstract import StateStore
@@ -32,15 +33,152 @@ class RoomState(NamedTuple):
     power_levels: PowerLevelStateEventContent
 
 
+# A pending write is either a full member (membership and profile) or just a membership change
+PendingMember = Union[Member, Membership]
+
+
 class PgStateStore(StateStore):
     upgrade_table = upgrade_table
 
     db: Database
+    member_write_delay: float
+    max_pending_members: int
+    _pending_members: dict[tuple[RoomID, UserID], PendingMember]
+    _flushing_members: dict[tuple[RoomID, UserID], PendingMember]
+    _member_flush_lock: asyncio.Lock
+    _member_flush_task: asyncio.Task | None
 
-    def __init__(self, db: Database) -> None:
+    _set_member_q = (
+        "INSERT INTO mx_user_profile (room_id, user_id, membership, displayname, avatar_url) "
+        "VALUES ($1, $2, $3, $4, $5)"
+        "ON CONFLICT (room_id, user_id) DO UPDATE SET membership=$3, displayname=$4,"
+        "                                             avatar_url=$5"
+    )
+    _set_membership_q = (
+        "INSERT INTO mx_user_profile (room_id, user_id, membership) VALUES ($1, $2, $3) "
+        "ON CONFLICT (room_id, user_id) DO UPDATE SET membership=$3"
+    )
+
+    def __init__(
+        self, db: Database, member_write_delay: float = 0, max_pending_members: int = 1000
+    ) -> None:
+        """
+        Args:
+            db: The database to store data in.
+            member_write_delay: If set, member updates are buffered for this many seconds and
+                then written to the database in one batch. Updates to the same member are
+                coalesced, and reads still see the buffered updates.
+            max_pending_members: The number of buffered member updates after which they're
+                written immediately without waiting for the delay.
+        """
         self.db = db
+        self.member_write_delay = member_write_delay
+        self.max_pending_members = max_pending_members
+        self._pending_members = {}
+        self._flushing_members = {}
+        self._member_flush_lock = asyncio.Lock()
+        self._member_flush_task = None
+
+    async def flush(self) -> None:
+        if self._member_flush_task:
+            self._member_flush_task.cancel()
+        await self._flush_members()
+
+    def _get_pending_member(self, room_id: RoomID, user_id: UserID) -> PendingMember | None:
+        pending = self._pending_members.get((room_id, user_id))
+        if isinstance(pending, Member):
+            return pending
+        flushing = self._flushing_members.get((room_id, user_id))
+        if pending is None:
+            return flushing
+        elif isinstance(flushing, Member):
+            return Member(
+                membership=pending,
+                displayname=flushing.displayname,
+                avatar_url=flushing.avatar_url,
+            )
+        return pending
+
+    async def _queue_member_update(
+        self, room_id: RoomID, user_id: UserID, update: PendingMember
+    ) -> None:
+        existing = self._pending_members.get((room_id, user_id))
+        if isinstance(update, Membership) and isinstance(existing, Member):
+            update = Member(
+                membership=update, displayname=existing.displayname, avatar_url=existing.avatar_url
+            )
+        self._pending_members[(room_id, user_id)] = update
+        if len(self._pending_members) >= self.max_pending_members:
+            await self._flush_members()
+        else:
+            self._schedule_member_flush()
+
+    def _schedule_member_flush(self) -> None:
+        if not self._member_flush_task:
+            self._member_flush_task = background_task.create(self._flush_members_later())
+
+    async def _flush_members_later(self) -> None:
+        try:
+            await asyncio.sleep(self.member_write_delay)
+        finally:
+            self._member_flush_task = None
+        await self._flush_members()
+
+    async def _flush_members(self) -> None:
+        async with self._member_flush_lock:
+            if not self._pending_members:
+                return
+            self._flushing_members, self._pending_members = self._pending_members, {}
+            members = []
+            memberships = []
+            for (room_id, user_id), update in self._flushing_members.items():
+                if isinstance(update, Member):
+                    members.append(
+                        (
+                            room_id,
+                            user_id,
+                            update.membership.value,
+                            update.displayname,
+                            update.avatar_url,
+                        )
+                    )
+                else:
+                    memberships.append((room_id, user_id, update.value))
+            try:
+                async with self.db.acquire() as conn, conn.transaction():
+                    if members:
+                        await conn.executemany(self._set_member_q, members)
+                    if memberships:
+                        await conn.executemany(self._set_membership_q, memberships)
+            except BaseException:
+                self._requeue_flushing_members()
+                raise
+            self._flushing_members = {}
+
+    def _requeue_flushing_members(self) -> None:
+        # Put a failed batch back in the buffer so it isn't lost, but keep any updates that
+        # were queued while the batch was being written, since those are newer.
+        for key, update in self._flushing_members.items():
+            pending = self._pending_members.get(key)
+            if pending is None:
+                self._pending_members[key] = update
+            elif isinstance(pending, Membership) and isinstance(update, Member):
+                self._pending_members[key] = Member(
+                    membership=pending,
+                    displayname=update.displayname,
+                    avatar_url=update.avatar_url,
+                )
+        self._flushing_members = {}
+        self._schedule_member_flush()
 
     async def get_member(self, room_id: RoomID, user_id: UserID) -> Member | None:
+        pending = self._get_pending_member(room_id, user_id)
+        if isinstance(pending, Member):
+            return Member(
+                membership=pending.membership,
+                displayname=pending.displayname,
+                avatar_url=pending.avatar_url,
+            )
         res = await self.db.fetchrow(
             "SELECT membership, displayname, avatar_url "
             "FROM mx_user_profile WHERE room_id=$1 AND user_id=$2",
@@ -48,9 +186,9 @@ class PgStateStore(StateStore):
             user_id,
         )
         if res is None:
-            return None
+            return Member(membership=pending) if pending else None
         return Member(
-            membership=Membership.deserialize(res["membership"]),
+            membership=pending or Membership.deserialize(res["membership"]),
             displayname=res["displayname"],
             avatar_url=res["avatar_url"],
         )
@@ -58,30 +196,37 @@ class PgStateStore(StateStore):
     async def set_member(
         self, room_id: RoomID, user_id: UserID, member: Member | MemberStateEventContent
     ) -> None:
-        q = (
-            "INSERT INTO mx_user_profile (room_id, user_id, membership, displayname, avatar_url) "
-            "VALUES ($1, $2, $3, $4, $5)"
-            "ON CONFLICT (room_id, user_id) DO UPDATE SET membership=$3, displayname=$4,"
-            "                                             avatar_url=$5"
-        )
+        if self.member_write_delay > 0:
+            member = Member(
+                membership=member.membership,
+                displayname=member.displayname,
+                avatar_url=member.avatar_url,
+            )
+            await self._queue_member_update(room_id, user_id, member)
+            return
         await self.db.execute(
-            q, room_id, user_id, member.membership.value, member.displayname, member.avatar_url
+            self._set_member_q,
+            room_id,
+            user_id,
+            member.membership.value,
+            member.displayname,
+            member.avatar_url,
         )
 
     async def set_membership(
         self, room_id: RoomID, user_id: UserID, membership: Membership
     ) -> None:
-        q = (
-            "INSERT INTO mx_user_profile (room_id, user_id, membership) VALUES ($1, $2, $3) "
-            "ON CONFLICT (room_id, user_id) DO UPDATE SET membership=$3"
-        )
-        await self.db.execute(q, room_id, user_id, membership.value)
+        if self.member_write_delay > 0:
+            await self._queue_member_update(room_id, user_id, membership)
+            return
+        await self.db.execute(self._set_membership_q, room_id, user_id, membership.value)
 
     async def get_members(
         self,
         room_id: RoomID,
         memberships: tuple[Membership, ...] = (Membership.JOIN, Membership.INVITE),
     ) -> list[UserID]:
+        await self._flush_members()
         membership_values = [membership.value for membership in memberships]
         if self.db.scheme in (Scheme.POSTGRES, Scheme.COCKROACH):
             q = "SELECT user_id FROM mx_user_profile WHERE room_id=$1 AND membership=ANY($2)"
@@ -100,6 +245,7 @@ class PgStateStore(StateStore):
         room_id: RoomID,
         memberships: tuple[Membership, ...] = (Membership.JOIN, Membership.INVITE),
     ) -> dict[UserID, Member]:
+        await self._flush_members()
         membership_values = [membership.value for membership in memberships]
         if self.db.scheme in (Scheme.POSTGRES, Scheme.COCKROACH):
             q = (
@@ -124,6 +270,7 @@ class PgStateStore(StateStore):
         not_id: str,
         memberships: tuple[Membership, ...] = (Membership.JOIN, Membership.INVITE),
     ) -> list[UserID]:
+        await self._flush_members()
         not_like = f"{not_prefix}%{not_suffix}"
         membership_values = [membership.value for membership in memberships]
         if self.db.scheme in (Scheme.POSTGRES, Scheme.COCKROACH):
@@ -149,6 +296,8 @@ class PgStateStore(StateStore):
         members: dict[UserID, Member | MemberStateEventContent],
         only_membership: Membership | None = None,
     ) -> None:
+        # Write buffered updates first so they don't overwrite the new member list later
+        await self._flush_members()
         columns = ["room_id", "user_id", "membership", "displayname", "avatar_url"]
         records = [
             (room_id, user_id, str(member.membership), member.displayname, member.avatar_url)
@@ -184,6 +333,7 @@ class PgStateStore(StateStore):
                 )
 
     async def find_shared_rooms(self, user_id: UserID) -> list[RoomID]:
+        await self._flush_members()
         q = (
             "SELECT mx_user_profile.room_id FROM mx_user_profile "
             "LEFT JOIN mx_room_state ON mx_room_state.room_id=mx_user_profile.room_id "
@@ -221,7 +371,9 @@ class PgStateStore(StateStore):
             "INSERT INTO mx_room_state (room_id, power_levels) VALUES ($1, $2) "
             "ON CONFLICT (room_id) DO UPDATE SET power_levels=$2",
             room_id,
-            json.dumps(content.serialize() if isinstance(content, Serializable) else content),
+            json_codec.dumps(
+                content.serialize() if isinstance(content, Serializable) else content
+            ),
         )
 
     async def has_create_cached(self, room_id: RoomID) -> bool:
@@ -244,7 +396,7 @@ class PgStateStore(StateStore):
             "INSERT INTO mx_room_state (room_id, create_event) VALUES ($1, $2) "
             "ON CONFLICT (room_id) DO UPDATE SET create_event=$2",
             event.room_id,
-            json.dumps(event.serialize() if isinstance(event, Serializable) else event),
+            json_codec.dumps(event.serialize() if isinstance(event, Serializable) else event),
         )
 
     async def has_encryption_info_cached(self, room_id: RoomID) -> bool:
@@ -277,5 +429,7 @@ class PgStateStore(StateStore):
         await self.db.execute(
             q,
             room_id,
-            json.dumps(content.serialize() if isinstance(content, Serializable) else content),
+            json_codec.dumps(
+                content.serialize() if isinstance(content, Serializable) else content
+            ),
         )
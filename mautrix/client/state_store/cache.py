@@ -0,0 +1,285 @@
+# Copyright (c) 2026 Tulir Asokan
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+from __future__ import annotations
+
+from typing import Any, Iterator
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from mautrix.types import (
+    Member,
+    Membership,
+    MemberStateEventContent,
+    PowerLevelStateEventContent,
+    RoomEncryptionStateEventContent,
+    RoomID,
+    StateEvent,
+    UserID,
+)
+
+from .abstract import StateStore
+
+
+class _CachedRoom:
+    __slots__ = ("members", "state", "generation")
+
+    members: OrderedDict[UserID, Member | None]
+    state: dict[str, Any]
+    generation: int
+
+    def __init__(self) -> None:
+        self.members = OrderedDict()
+        self.state = {}
+        # Incremented whenever a setter touches the room, so that reads which raced with
+        # a write don't put stale data in the cache.
+        self.generation = 0
+
+
+class CachedStateStore(StateStore):
+    """
+    A mixin that adds a read-through in-memory cache in front of another state store.
+    Memberships, power levels, create events and encryption info are cached per room,
+    and the cache is updated whenever the setters (or :meth:`update_state`) are called.
+
+    To use it, put it before the actual store in the base classes:
+
+    .. code-block:: python
+
+        class CachedPgStateStore(CachedStateStore, PgStateStore):
+            pass
+
+    Up to :attr:`cache_max_rooms` rooms and :attr:`cache_max_members` members per room are
+    kept in the cache, the least recently used ones are evicted first.
+    """
+
+    cache_max_rooms: int = 1000
+    cache_max_members: int = 1000
+
+    _room_cache: OrderedDict[RoomID, _CachedRoom]
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self._room_cache = OrderedDict()
+
+    def _get_cached_room(self, room_id: RoomID, create: bool = False) -> _CachedRoom | None:
+        try:
+            room = self._room_cache[room_id]
+        except KeyError:
+            if not create:
+                return None
+            room = self._room_cache[room_id] = _CachedRoom()
+            while len(self._room_cache) > self.cache_max_rooms:
+                self._room_cache.popitem(last=False)
+        else:
+            self._room_cache.move_to_end(room_id)
+        return room
+
+    def _start_read(self, room_id: RoomID) -> tuple[_CachedRoom, int]:
+        room = self._get_cached_room(room_id, create=True)
+        return room, room.generation
+
+    def _can_fill(self, room_id: RoomID, room: _CachedRoom, generation: int) -> bool:
+        # If the room was evicted or written to while reading, the result may be stale
+        return self._room_cache.get(room_id) is room and room.generation == generation
+
+    def _bump_generation(self, room_id: RoomID) -> None:
+        # Reads always create the room entry first, so if there's no entry, there's no read
+        # in progress that could be affected by the write.
+        room = self._room_cache.get(room_id)
+        if room is not None:
+            room.generation += 1
+
+    @contextmanager
+    def _writing(self, room_id: RoomID) -> Iterator[None]:
+        self._bump_generation(room_id)
+        try:
+            yield
+        finally:
+            self._bump_generation(room_id)
+
+    def _cache_member(self, room_id: RoomID, user_id: UserID, member: Member | None) -> None:
+        members = self._get_cached_room(room_id, create=True).members
+        members[user_id] = member
+        members.move_to_end(user_id)
+        while len(members) > self.cache_max_members:
+            members.popitem(last=False)
+
+    def _uncache_member(self, room_id: RoomID, user_id: UserID) -> None:
+        room = self._get_cached_room(room_id)
+        if room:
+            room.members.pop(user_id, None)
+
+    def _cache_state(self, room_id: RoomID, key: str, value: Any) -> None:
+        self._get_cached_room(room_id, create=True).state[key] = value
+
+    def _uncache_state(self, room_id: RoomID, *keys: str) -> None:
+        room = self._get_cached_room(room_id)
+        if room:
+            for key in keys:
+                room.state.pop(key, None)
+
+    def clear_cache(self, room_id: RoomID | None = None) -> None:
+        """
+        Drop cached data, e.g. after the underlying store was modified directly.
+
+        Args:
+            room_id: The room whose data to drop. If ``None``, the whole cache is cleared.
+        """
+        if room_id is None:
+            self._room_cache.clear()
+        else:
+            self._room_cache.pop(room_id, None)
+
+    async def get_member(self, room_id: RoomID, user_id: UserID) -> Member | None:
+        room = self._get_cached_room(room_id)
+        if room is not None and user_id in room.members:
+            room.members.move_to_end(user_id)
+            return room.members[user_id]
+        room, generation = self._start_read(room_id)
+        member = await super().get_member(room_id, user_id)
+        if self._can_fill(room_id, room, generation):
+            self._cache_member(room_id, user_id, member)
+        return member
+
+    async def set_member(
+        self, room_id: RoomID, user_id: UserID, member: Member | MemberStateEventContent
+    ) -> None:
+        with self._writing(room_id):
+            try:
+                await super().set_member(room_id, user_id, member)
+            except Exception:
+                self._uncache_member(room_id, user_id)
+                raise
+            self._cache_member(
+                room_id,
+                user_id,
+                Member(
+                    membership=member.membership,
+                    displayname=member.displayname,
+                    avatar_url=member.avatar_url,
+                ),
+            )
+
+    async def set_membership(
+        self, room_id: RoomID, user_id: UserID, membership: Membership
+    ) -> None:
+        with self._writing(room_id):
+            try:
+                await super().set_membership(room_id, user_id, membership)
+            except Exception:
+                self._uncache_member(room_id, user_id)
+                raise
+            room = self._get_cached_room(room_id)
+            cached = room.members.get(user_id) if room else None
+            if cached is not None:
+                self._cache_member(
+                    room_id,
+                    user_id,
+                    Member(
+                        membership=membership,
+                        displayname=cached.displayname,
+                        avatar_url=cached.avatar_url,
+                    ),
+                )
+            else:
+                # The profile isn't known, so let the next read fetch the whole row
+                self._uncache_member(room_id, user_id)
+
+    async def set_members(
+        self,
+        room_id: RoomID,
+        members: dict[UserID, Member | MemberStateEventContent],
+        only_membership: Membership | None = None,
+    ) -> None:
+        with self._writing(room_id):
+            room = self._get_cached_room(room_id)
+            if room:
+                room.members.clear()
+            try:
+                await super().set_members(room_id, members, only_membership)
+            finally:
+                # Clear again in case something was read while the members were being replaced
+                room = self._get_cached_room(room_id)
+                if room:
+                    room.members.clear()
+
+    async def has_power_levels_cached(self, room_id: RoomID) -> bool:
+        room = self._get_cached_room(room_id)
+        if room is not None and "power_levels" in room.state:
+            return room.state["power_levels"] is not None
+        return await super().has_power_levels_cached(room_id)
+
+    async def get_power_levels(self, room_id: RoomID) -> PowerLevelStateEventContent | None:
+        room = self._get_cached_room(room_id)
+        if room is not None and "power_levels" in room.state:
+            return room.state["power_levels"]
+        room, generation = self._start_read(room_id)
+        power_levels = await super().get_power_levels(room_id)
+        if self._can_fill(room_id, room, generation):
+            self._cache_state(room_id, "power_levels", power_levels)
+        return power_levels
+
+    async def set_power_levels(
+        self, room_id: RoomID, content: PowerLevelStateEventContent | dict[str, Any]
+    ) -> None:
+        with self._writing(room_id):
+            self._uncache_state(room_id, "power_levels")
+            await super().set_power_levels(room_id, content)
+            if isinstance(content, PowerLevelStateEventContent):
+                self._cache_state(room_id, "power_levels", content)
+
+    async def has_create_cached(self, room_id: RoomID) -> bool:
+        room = self._get_cached_room(room_id)
+        if room is not None and "create" in room.state:
+            return room.state["create"] is not None
+        return await super().has_create_cached(room_id)
+
+    async def get_create(self, room_id: RoomID) -> StateEvent | None:
+        room = self._get_cached_room(room_id)
+        if room is not None and "create" in room.state:
+            return room.state["create"]
+        room, generation = self._start_read(room_id)
+        create = await super().get_create(room_id)
+        if self._can_fill(room_id, room, generation):
+            self._cache_state(room_id, "create", create)
+        return create
+
+    async def set_create(self, event: StateEvent) -> None:
+        with self._writing(event.room_id):
+            self._uncache_state(event.room_id, "create")
+            await super().set_create(event)
+            if isinstance(event, StateEvent):
+                self._cache_state(event.room_id, "create", event)
+
+    async def is_encrypted(self, room_id: RoomID) -> bool | None:
+        room = self._get_cached_room(room_id)
+        if room is not None and "is_encrypted" in room.state:
+            return room.state["is_encrypted"]
+        room, generation = self._start_read(room_id)
+        is_encrypted = await super().is_encrypted(room_id)
+        if self._can_fill(room_id, room, generation):
+            self._cache_state(room_id, "is_encrypted", is_encrypted)
+        return is_encrypted
+
+    async def get_encryption_info(self, room_id: RoomID) -> RoomEncryptionStateEventContent | None:
+        room = self._get_cached_room(room_id)
+        if room is not None and "encryption" in room.state:
+            return room.state["encryption"]
+        room, generation = self._start_read(room_id)
+        encryption = await super().get_encryption_info(room_id)
+        if self._can_fill(room_id, room, generation):
+            self._cache_state(room_id, "encryption", encryption)
+        return encryption
+
+    async def set_encryption_info(
+        self, room_id: RoomID, content: RoomEncryptionStateEventContent | dict[str, Any]
+    ) -> None:
+        with self._writing(room_id):
+            self._uncache_state(room_id, "is_encrypted", "encryption")
+            await super().set_encryption_info(room_id, content)
+            self._cache_state(room_id, "is_encrypted", True)
+            if isinstance(content, RoomEncryptionStateEventContent):
+                self._cache_state(room_id, "encryption", content)
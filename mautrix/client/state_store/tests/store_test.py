@@ -7,6 +7,7 @@ from __future__ import annotations
 
 from typing import AsyncContextManager, AsyncIterator, Callable
 from contextlib import asynccontextmanager
+import asyncio
 import json
 import os
 import pathlib
@@ -20,7 +21,7 @@ import pytest
 from mautrix.types import EncryptionAlgorithm, Member, Membership, RoomID, StateEvent, UserID
 from mautrix.util.async_db import Database
 
-from .. import MemoryStateStore, StateStore
+from .. import CachedStateStore, MemoryStateStore, StateStore
 from ..asyncpg import PgStateStore
 
 
@@ -59,12 +60,61 @@ async def async_sqlite_store() -> AsyncIterator[PgStateStore]:
     await db.stop()
 
 
+@asynccontextmanager
+async def async_sqlite_write_behind_store() -> AsyncIterator[PgStateStore]:
+    async with async_sqlite_store() as store:
+        store.member_write_delay = 0.01
+        yield store
+        await store.close()
+
+
+class CachedPgStateStore(CachedStateStore, PgStateStore):
+    pass
+
+
+class SlowReadStateStore(MemoryStateStore):
+    def __init__(self) -> None:
+        super().__init__()
+        self.read_started = asyncio.Event()
+        self.allow_read = asyncio.Event()
+
+    async def get_member(self, room_id: RoomID, user_id: UserID) -> Member | None:
+        member = await super().get_member(room_id, user_id)
+        # Copy the member, as the memory store updates the object in-place
+        member = Member(membership=member.membership) if member else None
+        self.read_started.set()
+        await self.allow_read.wait()
+        return member
+
+
+class CachedSlowReadStateStore(CachedStateStore, SlowReadStateStore):
+    pass
+
+
+@asynccontextmanager
+async def async_sqlite_cached_store() -> AsyncIterator[CachedPgStateStore]:
+    db = Database.create(
+        "sqlite::memory:", upgrade_table=PgStateStore.upgrade_table, db_args={"min_size": 1}
+    )
+    store = CachedPgStateStore(db)
+    await db.start()
+    yield store
+    await db.stop()
+
+
 @asynccontextmanager
 async def memory_store() -> AsyncIterator[MemoryStateStore]:
     yield MemoryStateStore()
 
 
-@pytest.fixture(params=[async_postgres_store, async_sqlite_store, memory_store])
+@pytest.fixture(
+    params=[
+        async_postgres_store,
+        async_sqlite_store,
+        async_sqlite_write_behind_store,
+        memory_store,
+    ]
+)
 async def store(request) -> AsyncIterator[StateStore]:
     param: Callable[[], AsyncContextManager[StateStore]] = request.param
     async with param() as state_store:
@@ -169,3 +219,75 @@ async def test_updates(request, store: StateStore) -> None:
             not_suffix=":example.com",
         )
     ) == {"@whatsappbot:example.com"}
+
+
+async def test_write_behind() -> None:
+    room_id = RoomID("!foo:example.com")
+    user_id = UserID("@tulir:example.com")
+    async with async_sqlite_write_behind_store() as store:
+        store.member_write_delay = 60
+        await store.set_member(
+            room_id, user_id, Member(membership=Membership.INVITE, displayname="tulir")
+        )
+        await store.joined(room_id, user_id)
+        assert await store.db.fetchval("SELECT COUNT(*) FROM mx_user_profile") == 0
+        member = await store.get_member(room_id, user_id)
+        assert member.membership == Membership.JOIN and member.displayname == "tulir"
+        await store.flush()
+        row = await store.db.fetchrow("SELECT membership, displayname FROM mx_user_profile")
+        assert (row["membership"], row["displayname"]) == ("join", "tulir")
+
+
+async def test_write_behind_failed_flush() -> None:
+    room_id = RoomID("!foo:example.com")
+    user_id = UserID("@tulir:example.com")
+    async with async_sqlite_write_behind_store() as store:
+        store.member_write_delay = 60
+        await store.set_member(
+            room_id, user_id, Member(membership=Membership.INVITE, displayname="tulir")
+        )
+        await store.db.execute("ALTER TABLE mx_user_profile RENAME TO mx_user_profile_tmp")
+        with pytest.raises(Exception):
+            await store.flush()
+        await store.db.execute("ALTER TABLE mx_user_profile_tmp RENAME TO mx_user_profile")
+        assert store._member_flush_task is not None, "Failed flush is rescheduled"
+        await store.joined(room_id, user_id)
+        member = await store.get_member(room_id, user_id)
+        assert member.membership == Membership.JOIN and member.displayname == "tulir"
+        await store.flush()
+        row = await store.db.fetchrow("SELECT membership, displayname FROM mx_user_profile")
+        assert (row["membership"], row["displayname"]) == ("join", "tulir")
+
+
+async def test_cache(request) -> None:
+    room_id = RoomID("!telegram-group:example.com")
+    user_id = UserID("@tulir:example.com")
+    async with async_sqlite_cached_store() as store:
+        await store_room_state(request, store)
+        assert await store.is_joined(room_id, user_id)
+        assert await store.is_encrypted(room_id)
+        await store.db.execute("DELETE FROM mx_user_profile")
+        await store.db.execute("DELETE FROM mx_room_state")
+        assert await store.is_joined(room_id, user_id), "Cached data is used"
+        assert await store.is_encrypted(room_id)
+
+        await store.left(room_id, user_id)
+        assert not await store.is_joined(room_id, user_id), "Setters update the cache"
+        store.cache_max_rooms = 0
+        await store.get_member(RoomID("!other:example.com"), user_id)
+        assert await store.is_encrypted(room_id) is None, "Cache is bounded"
+
+
+async def test_cache_read_write_race() -> None:
+    room_id = RoomID("!foo:example.com")
+    user_id = UserID("@tulir:example.com")
+    store = CachedSlowReadStateStore()
+    await store.set_membership(room_id, user_id, Membership.INVITE)
+    store.clear_cache()
+    read = asyncio.create_task(store.get_member(room_id, user_id))
+    await store.read_started.wait()
+    await store.joined(room_id, user_id)
+    store.allow_read.set()
+    assert (await read).membership == Membership.INVITE
+    member = await store.get_member(room_id, user_id)
+    assert member.membership == Membership.JOIN, "Stale read doesn't overwrite the cache"
@@ -5,13 +5,16 @@
 # file, You can obtain one at http://mozilla.org/MPL/2.0/.
 from __future__ import annotations
 
-from typing import Any, Awaitable, Callable, NamedTuple, Optional, Type, TypeVar
+from typing import Any, AsyncIterator, Awaitable, Callable, NamedTuple, Optional, Type, TypeVar
 from abc import ABC, abstractmethod
 from enum import Enum, Flag, auto
+from functools import partial
 import asyncio
 import itertools
 import time
 
+from aiohttp import ClientResponse, StreamReader
+
 from mautrix.errors import MUnknownToken
 from mautrix.types import (
     JSON,
@@ -26,6 +29,7 @@ from mautrix.types import (
     FilterID,
     GenericEvent,
     PresenceState,
+    RoomID,
     SerializerError,
     StateEvent,
     StrippedStateEvent,
@@ -39,12 +43,46 @@ from mautrix.util.logging import TraceLogger
 from . import dispatcher
 from .state_store import MemorySyncStore, SyncStore
 
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
 EventHandler = Callable[[Event], Awaitable[None]]
 EventMiddleware = Callable[[Event], Awaitable[bool]]
 
 T = TypeVar("T", bound=Event)
 
 
+async def _iter_sync_stream(stream: StreamReader) -> AsyncIterator[tuple[tuple[str, ...], Any]]:
+    """
+    Read a /sync response from the given stream and yield the top-level fields and rooms one
+    by one. Top-level fields are yielded with a single-item path (e.g. ``("to_device",)``) and
+    rooms with ``("rooms", membership, room_id)``.
+    """
+    path: list[str] = []
+    builder: ijson.ObjectBuilder | None = None
+    depth = 0
+    async for _, event, value in ijson.parse_async(stream, use_float=True):
+        if builder:
+            builder.event(event, value)
+            if event == "start_map" or event == "start_array":
+                depth += 1
+            elif event == "end_map" or event == "end_array":
+                depth -= 1
+            if depth == 0:
+                yield tuple(path), builder.value
+                builder = None
+                path.pop()
+        elif event == "map_key":
+            path.append(value)
+            if path[0] != "rooms" or len(path) == 3:
+                builder = ijson.ObjectBuilder()
+        elif event != "start_map" and path:
+            # Either the end of rooms or a membership map, or a null where one was expected.
+            path.pop()
+
+
 class SyncStream(Flag):
     INTERNAL = auto()
 
@@ -97,6 +135,8 @@ class Syncer(ABC):
     ignore_initial_sync: bool
     ignore_first_sync: bool
     presence: PresenceState
+    sync_pipeline_size: int
+    stream_initial_sync: bool
 
     sync_store: SyncStore
 
@@ -109,6 +149,8 @@ class Syncer(ABC):
         self.ignore_initial_sync = False
         self.ignore_first_sync = False
         self.presence = PresenceState.ONLINE
+        self.sync_pipeline_size = 0
+        self.stream_initial_sync = False
 
         self.sync_store = sync_store or MemorySyncStore()
 
@@ -359,10 +401,17 @@ class Syncer(ABC):
         Args:
             data: The data from a /sync request.
         """
-        tasks = []
+        tasks = self._handle_sync_otk_count(data)
+        tasks += self._handle_sync_global(data)
+        rooms = data.get("rooms", {})
+        for membership in ("join", "invite", "leave"):
+            for room_id, room_data in rooms.get(membership, {}).items():
+                tasks += self._handle_sync_room(membership, room_id, room_data)
+        return tasks
 
+    def _handle_sync_otk_count(self, data: JSON) -> list[asyncio.Task]:
         otk_count = data.get("device_one_time_keys_count", {})
-        tasks += self.dispatch_internal_event(
+        return self.dispatch_internal_event(
             InternalEventType.DEVICE_OTK_COUNT,
             custom_type=DeviceOTKCount(
                 curve25519=otk_count.get("curve25519", 0),
@@ -370,8 +419,9 @@ class Syncer(ABC):
             ),
         )
 
+    def _handle_sync_global(self, data: JSON) -> list[asyncio.Task]:
         device_lists = data.get("device_lists", {})
-        tasks += self.dispatch_internal_event(
+        tasks = self.dispatch_internal_event(
             InternalEventType.DEVICE_LISTS,
             custom_type=DeviceLists(
                 changed=device_lists.get("changed", []),
@@ -391,9 +441,13 @@ class Syncer(ABC):
             tasks += self.dispatch_event(
                 self._try_deserialize(ToDeviceEvent, raw_event), source=SyncStream.TO_DEVICE
             )
+        return tasks
 
-        rooms = data.get("rooms", {})
-        for room_id, room_data in rooms.get("join", {}).items():
+    def _handle_sync_room(
+        self, membership: str, room_id: RoomID, room_data: JSON
+    ) -> list[asyncio.Task]:
+        tasks = []
+        if membership == "join":
             for raw_event in room_data.get("state", {}).get("events", []):
                 raw_event["room_id"] = room_id
                 tasks += self.dispatch_event(
@@ -414,7 +468,7 @@ class Syncer(ABC):
                     self._try_deserialize(EphemeralEvent, raw_event),
                     source=SyncStream.JOINED_ROOM | SyncStream.EPHEMERAL,
                 )
-        for room_id, room_data in rooms.get("invite", {}).items():
+        elif membership == "invite":
             events: list[dict[str, JSON]] = room_data.get("invite_state", {}).get("events", [])
             for raw_event in events:
                 raw_event["room_id"] = room_id
@@ -429,7 +483,7 @@ class Syncer(ABC):
                 self.log.warning(
                     f"Corrupted invite section in sync: no invite event present for {room_id}"
                 )
-                continue
+                return tasks
             # These aren't required by the spec, so make sure they're set
             raw_invite.setdefault("event_id", None)
             raw_invite.setdefault("origin_server_ts", int(time.time() * 1000))
@@ -441,7 +495,7 @@ class Syncer(ABC):
                 if raw_event != raw_invite
             ]
             tasks += self.dispatch_event(invite, source=SyncStream.INVITED_ROOM | SyncStream.STATE)
-        for room_id, room_data in rooms.get("leave", {}).items():
+        elif membership == "leave":
             for raw_event in room_data.get("timeline", {}).get("events", []):
                 if "state_key" in raw_event:
                     raw_event["room_id"] = room_id
@@ -451,6 +505,59 @@ class Syncer(ABC):
                     )
         return tasks
 
+    async def _stream_sync(
+        self,
+        resp: ClientResponse,
+        handle: bool,
+        handled_rooms: set[tuple[str, RoomID]],
+        tasks: list[asyncio.Task],
+    ) -> JSON:
+        """
+        Parse a /sync response incrementally and dispatch each room as soon as it has been read,
+        so that only one room is held in memory at a time instead of the whole response.
+
+        Top-level sections that were read before the first room (e.g. to-device events) are
+        dispatched before it, like in :meth:`handle_sync`, and the rest once the whole response
+        has been read. Handlers are only started here, the caller is expected to wait for
+        ``tasks`` after the request is done, so slow handlers don't count towards the request
+        timeout.
+
+        Args:
+            resp: The response to read.
+            handle: Whether the events should be dispatched. If false, rooms are just skipped.
+            handled_rooms: The ``(membership, room_id)`` pairs that have already been
+                dispatched. Rooms in the set are skipped and dispatched rooms are added to it,
+                so a request that fails halfway through won't dispatch rooms twice when it's
+                retried with the same set.
+            tasks: The list to add the ``wait_sync`` handler tasks to.
+
+        Returns:
+            The top-level fields of the response, without ``rooms``.
+        """
+        data = {}
+        global_handled = otk_count_handled = False
+        async for path, value in _iter_sync_stream(resp.content):
+            if path[0] != "rooms":
+                data[path[0]] = value
+                continue
+            key = (path[1], RoomID(path[2]))
+            if not handle or key in handled_rooms:
+                continue
+            if not global_handled:
+                if "device_one_time_keys_count" in data:
+                    tasks += self._handle_sync_otk_count(data)
+                    otk_count_handled = True
+                tasks += self._handle_sync_global(data)
+                global_handled = True
+            tasks += self._handle_sync_room(*key, value)
+            handled_rooms.add(key)
+        if handle:
+            if not otk_count_handled:
+                tasks += self._handle_sync_otk_count(data)
+            if not global_handled:
+                tasks += self._handle_sync_global(data)
+        return data
+
     def start(self, filter_data: FilterID | Filter | None) -> asyncio.Future:
         """
         Start syncing with the server. Can be stopped with :meth:`stop`.
@@ -484,15 +591,70 @@ class Syncer(ABC):
         await self.run_internal_event(InternalEventType.SYNC_STOPPED, error=None)
 
     async def _start(self, filter_id: FilterID | None) -> None:
-        fail_sleep = 5
-        is_first = True
-
         self.log.debug("Starting syncing")
         next_batch = await self.sync_store.get_next_batch()
         await self.run_internal_event(InternalEventType.SYNC_STARTED)
+        if self.stream_initial_sync and not ijson:
+            self.log.warning("ijson is not installed, initial sync will not be streamed")
+        responses = self._sync_responses(filter_id, next_batch)
+        if self.sync_pipeline_size > 0:
+            await self._start_pipelined(responses)
+        else:
+            async for current_batch, data in responses:
+                await self._store_next_batch(data)
+                await self._handle_sync_response(current_batch, data)
+
+    async def _start_pipelined(
+        self, responses: AsyncIterator[tuple[SyncToken | None, JSON]]
+    ) -> None:
+        queue: asyncio.Queue[tuple[SyncToken | None, JSON]] = asyncio.Queue(
+            maxsize=self.sync_pipeline_size
+        )
+
+        async def handle_queue() -> None:
+            while True:
+                current_batch, data = await queue.get()
+                await self._handle_sync_response(current_batch, data)
+                # The next batch token is only stored after the response has been handled,
+                # so restarting won't skip responses that were still in the queue.
+                await self._store_next_batch(data)
+
+        async def fetch_responses() -> None:
+            async for item in responses:
+                await queue.put(item)
+
+        handler_task = asyncio.create_task(handle_queue())
+        fetch_task = asyncio.create_task(fetch_responses())
+        try:
+            # If either side stops (e.g. the handler raised), the other one would otherwise
+            # block forever on the queue, so stop both and propagate the error.
+            await asyncio.wait((handler_task, fetch_task), return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            handler_task.cancel()
+            fetch_task.cancel()
+        for task in (handler_task, fetch_task):
+            if task.done() and not task.cancelled():
+                task.result()
+
+    async def _sync_responses(
+        self, filter_id: FilterID | None, next_batch: SyncToken | None
+    ) -> AsyncIterator[tuple[SyncToken | None, JSON]]:
+        fail_sleep = 5
+        is_first = True
         timeout = 30
+        streamed_rooms: set[tuple[str, RoomID]] = set()
         while True:
             current_batch = next_batch
+            sync_args = {}
+            stream_tasks: list[asyncio.Task] = []
+            if self.stream_initial_sync and ijson and not current_batch:
+                handle = not self.ignore_initial_sync and not (self.ignore_first_sync and is_first)
+                sync_args["response_handler"] = partial(
+                    self._stream_sync,
+                    handle=handle,
+                    handled_rooms=streamed_rooms,
+                    tasks=stream_tasks,
+                )
             start = time.monotonic()
             try:
                 data = await self.sync(
@@ -500,6 +662,7 @@ class Syncer(ABC):
                     filter_id=filter_id,
                     set_presence=self.presence,
                     timeout=timeout * 1000,
+                    **sync_args,
                 )
             except (asyncio.CancelledError, MUnknownToken):
                 raise
@@ -522,37 +685,49 @@ class Syncer(ABC):
             duration = time.monotonic() - start
             if current_batch and duration > timeout + 10:
                 self.log.warning(f"Sync request ({current_batch}) took {duration:.3f} seconds")
+            if sync_args:
+                # The rooms were dispatched while the response was being read
+                streamed_rooms.clear()
+                await asyncio.gather(*stream_tasks)
 
-            is_initial = not current_batch
             data["net.maunium.mautrix"] = {
-                "is_initial": is_initial,
+                "is_initial": not current_batch,
                 "is_first": is_first,
+                "streamed": bool(sync_args),
             }
-            next_batch = data.get("next_batch")
-            try:
-                await self.sync_store.put_next_batch(next_batch)
-            except Exception:
-                self.log.warning("Failed to store next batch", exc_info=True)
-            await self.run_internal_event(InternalEventType.SYNC_SUCCESSFUL, data=data)
-            if (self.ignore_first_sync and is_first) or (self.ignore_initial_sync and is_initial):
-                is_first = False
-                continue
             is_first = False
-            self.log.silly(f"Starting sync handling ({current_batch})")
-            start = time.monotonic()
-            try:
-                tasks = self.handle_sync(data)
-                await asyncio.gather(*tasks)
-            except Exception:
-                self.log.exception(f"Sync handling ({current_batch}) errored")
-            else:
-                self.log.silly(f"Finished sync handling ({current_batch})")
-            finally:
-                duration = time.monotonic() - start
-                if duration > 10:
-                    self.log.warning(
-                        f"Sync handling ({current_batch}) took {duration:.3f} seconds"
-                    )
+            next_batch = data.get("next_batch")
+            yield current_batch, data
+
+    async def _store_next_batch(self, data: JSON) -> None:
+        try:
+            await self.sync_store.put_next_batch(data.get("next_batch"))
+        except Exception:
+            self.log.warning("Failed to store next batch", exc_info=True)
+
+    async def _handle_sync_response(self, current_batch: SyncToken | None, data: JSON) -> None:
+        await self.run_internal_event(InternalEventType.SYNC_SUCCESSFUL, data=data)
+        meta = data["net.maunium.mautrix"]
+        if (self.ignore_first_sync and meta["is_first"]) or (
+            self.ignore_initial_sync and meta["is_initial"]
+        ):
+            return
+        elif meta["streamed"]:
+            # Streamed responses were already handled while they were being read
+            return
+        self.log.silly(f"Starting sync handling ({current_batch})")
+        start = time.monotonic()
+        try:
+            tasks = self.handle_sync(data)
+            await asyncio.gather(*tasks)
+        except Exception:
+            self.log.exception(f"Sync handling ({current_batch}) errored")
+        else:
+            self.log.silly(f"Finished sync handling ({current_batch})")
+        finally:
+            duration = time.monotonic() - start
+            if duration > 10:
+                self.log.warning(f"Sync handling ({current_batch}) took {duration:.3f} seconds")
 
     def stop(self) -> None:
         """
@@ -574,5 +749,6 @@ class Syncer(ABC):
         filter_id: FilterID = None,
         full_state: bool = False,
         set_presence: PresenceState = None,
+        response_handler: Callable[[ClientResponse], Awaitable[JSON]] | None = None,
     ) -> JSON:
         pass
@@ -0,0 +1,236 @@
+# Copyright (c) 2026 Tulir Asokan
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+from __future__ import annotations
+
+from typing import AsyncIterator
+import asyncio
+import io
+import json
+import logging
+
+import pytest
+
+from mautrix.types import EventType, MessageEvent, RoomID, SyncToken, UserID
+
+from .syncer import Syncer, _iter_sync_stream, ijson
+
+
+class AsyncBytesIO:
+    def __init__(self, data: bytes) -> None:
+        self.data = io.BytesIO(data)
+
+    async def read(self, n: int = -1) -> bytes:
+        return self.data.read(min(n, 7) if n > 0 else n)
+
+
+@pytest.mark.skipif(not ijson, reason="no ijson")
+async def test_iter_sync_stream() -> None:
+    data = {
+        "to_device": {"events": [{"type": "m.room_key", "content": {"a": 1.5}}]},
+        "rooms": {
+            "join": {
+                "!foo.bar:example.com": {"timeline": {"events": [{"type": "m.room.message"}]}},
+                "!baz:example.com": {},
+            },
+            "invite": None,
+            "leave": {"!left:example.com": {"timeline": {"events": []}}},
+        },
+        "device_one_time_keys_count": {"signed_curve25519": 50},
+        "next_batch": "s123",
+    }
+    items = [item async for item in _iter_sync_stream(AsyncBytesIO(json.dumps(data).encode()))]
+    assert items == [
+        (("to_device",), data["to_device"]),
+        (("rooms", "join", "!foo.bar:example.com"), data["rooms"]["join"]["!foo.bar:example.com"]),
+        (("rooms", "join", "!baz:example.com"), {}),
+        (("rooms", "leave", "!left:example.com"), {"timeline": {"events": []}}),
+        (("device_one_time_keys_count",), {"signed_curve25519": 50}),
+        (("next_batch",), "s123"),
+    ]
+
+
+class GatedStream:
+    """A response body that only returns the second part once the gate is opened."""
+
+    def __init__(self, head: bytes, tail: bytes) -> None:
+        self.chunks = [head, tail]
+        self.gate = asyncio.Event()
+
+    async def read(self, n: int = -1) -> bytes:
+        if not self.chunks or n == 0:
+            return b""
+        elif len(self.chunks) == 1:
+            await self.gate.wait()
+        return self.chunks.pop(0)
+
+
+class FakeResponse:
+    def __init__(self, content: AsyncBytesIO | GatedStream) -> None:
+        self.content = content
+
+
+def stream_sync_data() -> dict:
+    return {
+        "to_device": {"events": []},
+        "rooms": {
+            "join": {
+                "!foo:example.com": {
+                    "timeline": {
+                        "events": [
+                            {
+                                "type": "m.room.message",
+                                "event_id": "$foo",
+                                "sender": "@user:example.com",
+                                "origin_server_ts": 1,
+                                "content": {"msgtype": "m.text", "body": "hi"},
+                            }
+                        ]
+                    }
+                },
+                "!bar:example.com": {
+                    "timeline": {
+                        "events": [
+                            {
+                                "type": "m.room.message",
+                                "event_id": "$bar",
+                                "sender": "@user:example.com",
+                                "origin_server_ts": 2,
+                                "content": {"msgtype": "m.text", "body": "hello"},
+                            }
+                        ]
+                    }
+                },
+            },
+        },
+        "next_batch": "s123",
+    }
+
+
+@pytest.mark.skipif(not ijson, reason="no ijson")
+async def test_stream_sync_handles_rooms_while_reading() -> None:
+    syncer = DummySyncer(None)
+    handled = []
+
+    @syncer.on(EventType.ROOM_MESSAGE)
+    async def handler(evt: MessageEvent) -> None:
+        handled.append(evt.event_id)
+
+    raw = json.dumps(stream_sync_data()).encode()
+    split = raw.index(b'"!bar:example.com"')
+    stream = GatedStream(raw[:split], raw[split:])
+    handled_rooms = set()
+    tasks = []
+    stream_task = asyncio.create_task(
+        syncer._stream_sync(
+            FakeResponse(stream), handle=True, handled_rooms=handled_rooms, tasks=tasks
+        )
+    )
+    for _ in range(100):
+        if handled:
+            break
+        await asyncio.sleep(0.01)
+    # The first room was handled while the rest of the response hasn't been received yet
+    assert handled == ["$foo"]
+    assert not stream_task.done()
+
+    stream.gate.set()
+    data = await stream_task
+    await asyncio.gather(*tasks)
+    await asyncio.sleep(0)
+    assert handled == ["$foo", "$bar"]
+    assert data == {"to_device": {"events": []}, "next_batch": "s123"}
+    assert handled_rooms == {("join", "!foo:example.com"), ("join", "!bar:example.com")}
+
+
+@pytest.mark.skipif(not ijson, reason="no ijson")
+async def test_stream_sync_skips_handled_rooms() -> None:
+    syncer = DummySyncer(None)
+    handled = []
+
+    @syncer.on(EventType.ROOM_MESSAGE)
+    async def handler(evt: MessageEvent) -> None:
+        handled.append(evt.event_id)
+
+    # Rooms that were handled before a retried request failed aren't handled again
+    handled_rooms = {("join", RoomID("!foo:example.com"))}
+    tasks = []
+    resp = FakeResponse(AsyncBytesIO(json.dumps(stream_sync_data()).encode()))
+    await syncer._stream_sync(resp, handle=True, handled_rooms=handled_rooms, tasks=tasks)
+    await asyncio.gather(*tasks)
+    await asyncio.sleep(0)
+    assert handled == ["$bar"]
+
+
+class DummySyncer(Syncer):
+    log = logging.getLogger("mau.client.test")
+    mxid = UserID("@bot:example.com")
+
+    async def create_filter(self, filter_params):
+        raise NotImplementedError()
+
+    async def sync(self, *args, **kwargs):
+        raise NotImplementedError()
+
+
+class StreamingSyncer(DummySyncer):
+    def __init__(self, stream: GatedStream) -> None:
+        super().__init__(None)
+        self.stream_initial_sync = True
+        self.stream = stream
+        self.next_sync_started = asyncio.Event()
+
+    async def sync(self, since=None, response_handler=None, **kwargs):
+        if since:
+            self.next_sync_started.set()
+            await asyncio.Future()
+        return await response_handler(FakeResponse(self.stream))
+
+
+@pytest.mark.skipif(not ijson, reason="no ijson")
+async def test_stream_sync_stores_next_batch_after_stream() -> None:
+    raw = json.dumps(stream_sync_data()).encode()
+    split = raw.index(b'"!bar:example.com"')
+    syncer = StreamingSyncer(GatedStream(raw[:split], raw[split:]))
+    handled = []
+
+    @syncer.on(EventType.ROOM_MESSAGE)
+    async def handler(evt: MessageEvent) -> None:
+        handled.append(evt.event_id)
+
+    sync_task = asyncio.create_task(syncer._start(None))
+    try:
+        for _ in range(100):
+            if handled:
+                break
+            await asyncio.sleep(0.01)
+        assert handled == ["$foo"]
+        assert await syncer.sync_store.get_next_batch() is None
+
+        syncer.stream.gate.set()
+        await asyncio.wait_for(syncer.next_sync_started.wait(), 5)
+        assert handled == ["$foo", "$bar"]
+        assert await syncer.sync_store.get_next_batch() == "s123"
+    finally:
+        sync_task.cancel()
+
+
+class FailingHandlerSyncer(DummySyncer):
+    async def _handle_sync_response(self, current_batch: SyncToken | None, data) -> None:
+        raise ValueError("handler failed")
+
+
+async def test_pipelined_handler_error() -> None:
+    syncer = FailingHandlerSyncer(None)
+    syncer.sync_pipeline_size = 1
+
+    async def responses() -> AsyncIterator[tuple[SyncToken | None, dict]]:
+        i = 0
+        while True:
+            yield SyncToken(f"s{i}"), {"next_batch": f"s{i + 1}"}
+            i += 1
+
+    with pytest.raises(ValueError):
+        await asyncio.wait_for(syncer._start_pipelined(responses()), 5)
@@ -1,20 +1,26 @@
 from .async_attachments import (
+    async_decrypt_attachment,
+    async_decrypt_attachment_to_file,
     async_encrypt_attachment,
     async_generator_from_data,
     async_inplace_encrypt_attachment,
 )
 from .attachments import (
     decrypt_attachment,
+    decrypted_attachment_generator,
     encrypt_attachment,
     encrypted_attachment_generator,
     inplace_encrypt_attachment,
 )
 
 __all__ = [
+    "async_decrypt_attachment",
+    "async_decrypt_attachment_to_file",
     "async_encrypt_attachment",
     "async_generator_from_data",
     "async_inplace_encrypt_attachment",
     "decrypt_attachment",
+    "decrypted_attachment_generator",
     "encrypt_attachment",
     "encrypted_attachment_generator",
     "inplace_encrypt_attachment",
@@ -16,10 +16,19 @@ from typing import AsyncGenerator, AsyncIterable, Iterable
 from functools import partial
 import asyncio
 import io
+import os
 
 from mautrix.types import EncryptedFile
 
-from .attachments import _get_decryption_info, _prepare_encryption, inplace_encrypt_attachment
+from .attachments import (
+    SHA256,
+    _decode_hash,
+    _get_decryption_info,
+    _prepare_decryption,
+    _prepare_encryption,
+    _verify_hash,
+    inplace_encrypt_attachment,
+)
 
 
 async def async_encrypt_attachment(
@@ -64,6 +73,100 @@ async def async_encrypt_attachment(
     yield _get_decryption_info(key, iv, sha256)
 
 
+async def async_decrypt_attachment(
+    data: bytes | Iterable[bytes] | AsyncIterable[bytes] | io.BufferedIOBase,
+    key: str,
+    hash: str,
+    iv: str,
+) -> AsyncGenerator[bytes, None]:
+    """Async generator to decrypt an encrypted attachment chunk by chunk.
+
+    This is the decryption counterpart of ``async_encrypt_attachment()``. It can be used to
+    decrypt large files while they're being downloaded, e.g. by passing the generator from
+    :meth:`MediaRepositoryMethods.download_media_stream`. The hash is checked after all data has
+    been read, so the decrypted chunks must not be trusted until the generator has finished
+    without raising an error. See ``async_decrypt_attachment_to_file()`` for a version that
+    handles that automatically.
+
+    Args:
+        data: The data to decrypt.
+        key: AES_CTR JWK key object.
+        hash: Base64 encoded SHA-256 hash of the ciphertext.
+        iv: Base64 encoded 16 byte AES-CTR IV.
+
+    Yields:
+        The decrypted bytes for each chunk of data.
+
+    Raises:
+        DecryptionError: if the integrity check fails after all data has been decrypted.
+    """
+    expected_hash = _decode_hash(hash)
+    cipher = _prepare_decryption(key, iv)
+    sha256 = SHA256.new()
+
+    loop = asyncio.get_running_loop()
+
+    async for chunk in async_generator_from_data(data):
+        update_hash = partial(sha256.update, chunk)
+        await loop.run_in_executor(None, update_hash)
+
+        update_crypt = partial(cipher.decrypt, chunk)
+        yield await loop.run_in_executor(None, update_crypt)
+
+    _verify_hash(sha256, expected_hash)
+
+
+async def async_decrypt_attachment_to_file(
+    data: bytes | Iterable[bytes] | AsyncIterable[bytes] | io.BufferedIOBase,
+    path: str | os.PathLike,
+    key: str,
+    hash: str,
+    iv: str,
+) -> int:
+    """Decrypt an encrypted attachment chunk by chunk into a file.
+
+    The data is first written into a temporary file next to the target path, which is only
+    moved to the target path after the hash has been verified. If decryption fails, the
+    temporary file is deleted and the target path is left untouched. File operations are done
+    in a thread to avoid blocking the event loop.
+
+    Args:
+        data: The data to decrypt.
+        path: The path to write the decrypted file to.
+        key: AES_CTR JWK key object.
+        hash: Base64 encoded SHA-256 hash of the ciphertext.
+        iv: Base64 encoded 16 byte AES-CTR IV.
+
+    Returns:
+        The size of the decrypted file.
+
+    Raises:
+        DecryptionError: if the key, IV or hash are invalid, or if the integrity check fails.
+    """
+    # Check the key, IV and hash before creating the file
+    _decode_hash(hash)
+    _prepare_decryption(key, iv)
+    loop = asyncio.get_running_loop()
+    tmp_path = f"{os.fspath(path)}.part"
+    size = 0
+    try:
+        file = await loop.run_in_executor(None, partial(open, tmp_path, "wb"))
+        try:
+            async for chunk in async_decrypt_attachment(data, key, hash, iv):
+                await loop.run_in_executor(None, file.write, chunk)
+                size += len(chunk)
+        finally:
+            await loop.run_in_executor(None, file.close)
+        await loop.run_in_executor(None, os.replace, tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except FileNotFoundError:
+            pass
+        raise
+    return size
+
+
 async def async_inplace_encrypt_attachment(data: bytearray) -> EncryptedFile:
     loop = asyncio.get_running_loop()
     return await loop.run_in_executor(None, partial(inplace_encrypt_attachment, data))
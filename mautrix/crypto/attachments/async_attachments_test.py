@@ -7,9 +7,17 @@
 # file, You can obtain one at http://mozilla.org/MPL/2.0/.
 from __future__ import annotations
 
+import pytest
+
+from mautrix.errors import DecryptionError
 from mautrix.types import EncryptedFile
 
-from .async_attachments import async_encrypt_attachment, async_inplace_encrypt_attachment
+from .async_attachments import (
+    async_decrypt_attachment,
+    async_decrypt_attachment_to_file,
+    async_encrypt_attachment,
+    async_inplace_encrypt_attachment,
+)
 from .attachments import decrypt_attachment
 
 try:
@@ -44,3 +52,92 @@ async def test_async_inplace_encrypt():
     decrypt_attachment(data, keys.key.key, keys.hashes["sha256"], keys.iv, inplace=True)
 
     assert data == orig_data
+
+
+async def test_async_decrypt():
+    data = Random.new().read(10000)
+    cyphertext, keys = await _get_data_cypher_keys(data)
+    chunks = [cyphertext[i : i + 1000] for i in range(0, len(cyphertext), 1000)]
+
+    plaintext = b"".join(
+        [
+            chunk
+            async for chunk in async_decrypt_attachment(
+                chunks, keys.key.key, keys.hashes["sha256"], keys.iv
+            )
+        ]
+    )
+
+    assert data == plaintext
+
+
+async def test_async_decrypt_to_file(tmp_path):
+    data = Random.new().read(10000)
+    cyphertext, keys = await _get_data_cypher_keys(data)
+    path = tmp_path / "file"
+
+    size = await async_decrypt_attachment_to_file(
+        cyphertext, path, keys.key.key, keys.hashes["sha256"], keys.iv
+    )
+
+    assert size == len(data)
+    assert path.read_bytes() == data
+
+
+async def test_async_decrypt_to_file_hash_fail(tmp_path):
+    data = Random.new().read(10000)
+    cyphertext, keys = await _get_data_cypher_keys(data)
+    cyphertext = bytearray(cyphertext)
+    cyphertext[-1] ^= 1
+    path = tmp_path / "file"
+
+    with pytest.raises(DecryptionError):
+        await async_decrypt_attachment_to_file(
+            bytes(cyphertext), path, keys.key.key, keys.hashes["sha256"], keys.iv
+        )
+
+    assert list(tmp_path.iterdir()) == []
+
+
+@pytest.mark.parametrize("bad_hash", ["not base64!", "dGVzdA"])
+async def test_async_decrypt_to_file_invalid_hash(tmp_path, bad_hash: str):
+    data = Random.new().read(10000)
+    cyphertext, keys = await _get_data_cypher_keys(data)
+    path = tmp_path / "file"
+    consumed = []
+
+    async def chunks():
+        for i in range(0, len(cyphertext), 1000):
+            consumed.append(i)
+            yield cyphertext[i : i + 1000]
+
+    with pytest.raises(DecryptionError):
+        await async_decrypt_attachment_to_file(chunks(), path, keys.key.key, bad_hash, keys.iv)
+
+    # The hash is checked before reading any data or creating the file
+    assert consumed == []
+    assert list(tmp_path.iterdir()) == []
+
+
+async def test_async_decrypt_invalid_hash():
+    data = Random.new().read(10000)
+    cyphertext, keys = await _get_data_cypher_keys(data)
+
+    with pytest.raises(DecryptionError):
+        async for _ in async_decrypt_attachment(cyphertext, keys.key.key, "dGVzdA", keys.iv):
+            pytest.fail("Data was decrypted with an invalid hash")
+
+
+async def test_async_decrypt_to_file_keeps_old_file(tmp_path):
+    data = Random.new().read(10000)
+    cyphertext, keys = await _get_data_cypher_keys(data)
+    path = tmp_path / "file"
+    path.write_bytes(b"previous")
+
+    with pytest.raises(DecryptionError):
+        await async_decrypt_attachment_to_file(
+            cyphertext[:-1], path, keys.key.key, keys.hashes["sha256"], keys.iv
+        )
+
+    assert path.read_bytes() == b"previous"
+    assert list(tmp_path.iterdir()) == [path]
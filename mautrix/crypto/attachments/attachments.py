@@ -46,7 +46,7 @@ def decrypt_attachment(
     Raises:
         EncryptionError: if the integrity check fails.
     """
-    expected_hash = unpaddedbase64.decode_base64(hash)
+    expected_hash = _decode_hash(hash)
 
     h = SHA256.new()
     h.update(ciphertext)
@@ -54,6 +54,16 @@ def decrypt_attachment(
     if h.digest() != expected_hash:
         raise DecryptionError("Mismatched SHA-256 digest")
 
+    cipher = _prepare_decryption(key, iv)
+
+    if inplace:
+        cipher.decrypt(ciphertext, ciphertext)
+        return ciphertext
+    else:
+        return cipher.decrypt(ciphertext)
+
+
+def _prepare_decryption(key: str, iv: str):
     try:
         byte_key: bytes = unpaddedbase64.decode_base64(key)
     except (binascii.Error, TypeError):
@@ -73,15 +83,56 @@ def decrypt_attachment(
     ctr = Counter.new(64, prefix=prefix, initial_value=initial_value)
 
     try:
-        cipher = AES.new(byte_key, AES.MODE_CTR, counter=ctr)
+        return AES.new(byte_key, AES.MODE_CTR, counter=ctr)
     except ValueError as e:
         raise DecryptionError("Failed to create AES cipher") from e
 
-    if inplace:
-        cipher.decrypt(ciphertext, ciphertext)
-        return ciphertext
-    else:
-        return cipher.decrypt(ciphertext)
+
+def _decode_hash(hash: str) -> bytes:
+    try:
+        byte_hash: bytes = unpaddedbase64.decode_base64(hash)
+    except (binascii.Error, TypeError):
+        raise DecryptionError("Error decoding hash")
+    if len(byte_hash) != SHA256.digest_size:
+        raise DecryptionError("Invalid hash length")
+    return byte_hash
+
+
+def _verify_hash(sha256: SHA256.SHA256Hash, expected_hash: bytes) -> None:
+    if sha256.digest() != expected_hash:
+        raise DecryptionError("Mismatched SHA-256 digest")
+
+
+def decrypted_attachment_generator(
+    data: Iterable[bytes], key: str, hash: str, iv: str
+) -> Generator[bytes, None, None]:
+    """Generator to decrypt an encrypted attachment chunk by chunk.
+
+    Unlike ``decrypt_attachment()``, this function doesn't need the whole ciphertext up front.
+    However, the hash can only be checked after all data has been read, so the decrypted chunks
+    must not be trusted until the generator has finished without raising an error.
+
+    Args:
+        data: The data to decrypt.
+        key: AES_CTR JWK key object.
+        hash: Base64 encoded SHA-256 hash of the ciphertext.
+        iv: Base64 encoded 16 byte AES-CTR IV.
+
+    Yields:
+        The decrypted bytes for each chunk of data.
+
+    Raises:
+        DecryptionError: if the integrity check fails after all data has been decrypted.
+    """
+    expected_hash = _decode_hash(hash)
+    cipher = _prepare_decryption(key, iv)
+    sha256 = SHA256.new()
+
+    for chunk in data:
+        sha256.update(chunk)
+        yield cipher.decrypt(chunk)
+
+    _verify_hash(sha256, expected_hash)
 
 
 def encrypt_attachment(plaintext: bytes) -> tuple[bytes, EncryptedFile]:
@@ -9,7 +9,12 @@ import unpaddedbase64
 
 from mautrix.errors import DecryptionError
 
-from .attachments import decrypt_attachment, encrypt_attachment, inplace_encrypt_attachment
+from .attachments import (
+    decrypt_attachment,
+    decrypted_attachment_generator,
+    encrypt_attachment,
+    inplace_encrypt_attachment,
+)
 
 try:
     from Crypto import Random
@@ -49,6 +54,23 @@ def test_hash_verification():
         decrypt_attachment(cyphertext, keys.key.key, "Fake hash", keys.iv)
 
 
+def test_decrypt_generator():
+    data = Random.new().read(10000)
+    cyphertext, keys = encrypt_attachment(data)
+    chunks = [cyphertext[i : i + 1000] for i in range(0, len(cyphertext), 1000)]
+
+    plaintext = b"".join(
+        decrypted_attachment_generator(chunks, keys.key.key, keys.hashes["sha256"], keys.iv)
+    )
+    assert data == plaintext
+
+    with pytest.raises(DecryptionError):
+        for _ in decrypted_attachment_generator(
+            chunks[:-1], keys.key.key, keys.hashes["sha256"], keys.iv
+        ):
+            pass
+
+
 def test_invalid_key():
     data = b"Test bytes"
 
@@ -20,6 +20,7 @@ from mautrix.types import (
     TrustState,
     UserID,
 )
+from mautrix.util.keyed_lock import KeyedLock
 from mautrix.util.logging import TraceLogger
 
 from .. import client as cli, crypto
@@ -54,7 +55,8 @@ class BaseOlmMachine:
 
     _prev_unwedge: dict[IdentityKey, float]
     _fetch_keys_lock: asyncio.Lock
-    _megolm_decrypt_lock: asyncio.Lock
+    # Locks that ensure only one event per room is being decrypted and ratcheted at a time
+    _megolm_decrypt_locks: KeyedLock[RoomID]
     _share_keys_lock: asyncio.Lock
     _last_key_share: float
     _cs_fetch_attempted: set[UserID]
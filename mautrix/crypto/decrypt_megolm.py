@@ -3,8 +3,6 @@
 # This Source Code Form is subject to the terms of the Mozilla Public
 # License, v. 2.0. If a copy of the MPL was not distributed with this
 # file, You can obtain one at http://mozilla.org/MPL/2.0/.
-import json
-
 import olm
 
 from mautrix.errors import (
@@ -23,6 +21,7 @@ from mautrix.types import (
     SessionID,
     TrustState,
 )
+from mautrix.util import json_codec
 
 from .device_lists import DeviceListMachine
 from .sessions import InboundGroupSession
@@ -46,7 +45,9 @@ class MegolmDecryptionMachine(DeviceListMachine):
             raise DecryptionError("Unsupported event content class")
         elif evt.content.algorithm != EncryptionAlgorithm.MEGOLM_V1:
             raise DecryptionError("Unsupported event encryption algorithm")
-        async with self._megolm_decrypt_lock:
+        # Message index validation and ratcheting must not race within a session,
+        # but events in different rooms can never share sessions, so only lock per room.
+        async with self._megolm_decrypt_locks[evt.room_id]:
             session = await self.crypto_store.get_group_session(
                 evt.room_id, evt.content.session_id
             )
@@ -106,11 +107,11 @@ class MegolmDecryptionMachine(DeviceListMachine):
                     trust_level = TrustState.FORWARDED
 
         try:
-            data = json.loads(plaintext)
+            data = json_codec.loads(plaintext)
             room_id = data["room_id"]
             event_type = data["type"]
             content = data["content"]
-        except json.JSONDecodeError as e:
+        except json_codec.JSONDecodeError as e:
             raise DecryptedPayloadError("Failed to parse megolm payload") from e
         except KeyError as e:
             raise DecryptedPayloadError("Megolm payload is missing fields") from e
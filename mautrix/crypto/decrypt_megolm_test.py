@@ -0,0 +1,150 @@
+# Copyright (c) 2026 Tulir Asokan
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+from __future__ import annotations
+
+from typing import AsyncIterator
+import asyncio
+import json
+
+import pytest
+
+from mautrix.client import Client
+from mautrix.client.state_store import MemoryStateStore
+from mautrix.errors import DuplicateMessageIndex
+from mautrix.types import (
+    DeviceID,
+    EncryptedEvent,
+    EncryptedMegolmEventContent,
+    EventID,
+    EventType,
+    RoomID,
+    SessionID,
+    TrustState,
+    UserID,
+)
+
+from . import InboundGroupSession, OlmAccount, OlmMachine, OutboundGroupSession
+from .store import MemoryCryptoStore
+
+USER_ID = UserID("@user:example.com")
+DEVICE_ID = DeviceID("DEVICE")
+
+# decrypt_megolm_event reads the deprecated sender_key and device_id fields
+pytestmark = pytest.mark.filterwarnings("ignore::DeprecationWarning")
+
+
+class SlowCryptoStore(MemoryCryptoStore):
+    """A crypto store that records how many decryptions are fetching sessions at once."""
+
+    def __init__(self) -> None:
+        super().__init__(USER_ID, "pickle key")
+        self.active: dict[RoomID, int] = {}
+        self.max_active_per_room = 0
+        self.max_active_total = 0
+
+    async def get_group_session(
+        self, room_id: RoomID, session_id: SessionID
+    ) -> InboundGroupSession:
+        self.active[room_id] = self.active.get(room_id, 0) + 1
+        self.max_active_per_room = max(self.max_active_per_room, self.active[room_id])
+        self.max_active_total = max(self.max_active_total, sum(self.active.values()))
+        try:
+            await asyncio.sleep(0.01)
+            return await super().get_group_session(room_id, session_id)
+        finally:
+            self.active[room_id] -= 1
+
+
+@pytest.fixture
+async def machine() -> AsyncIterator[OlmMachine]:
+    store = SlowCryptoStore()
+    client = Client(USER_ID, DEVICE_ID, base_url="https://example.com", token="token")
+    machine = OlmMachine(client, store, MemoryStateStore())
+    machine.account = OlmAccount()
+    yield machine
+    await client.api.session.close()
+
+
+class RoomSender:
+    def __init__(self, machine: OlmMachine, room_id: RoomID) -> None:
+        self.machine = machine
+        self.room_id = room_id
+        self.outbound = OutboundGroupSession(room_id)
+        self.count = 0
+
+    async def share(self) -> None:
+        inbound = InboundGroupSession(
+            session_key=self.outbound.session_key,
+            signing_key=self.machine.account.signing_key,
+            sender_key=self.machine.account.identity_key,
+            room_id=self.room_id,
+        )
+        await self.machine.crypto_store.put_group_session(
+            self.room_id, inbound.sender_key, SessionID(inbound.id), inbound
+        )
+        self.outbound.shared = True
+
+    def encrypt(self) -> EncryptedEvent:
+        self.count += 1
+        payload = {
+            "room_id": self.room_id,
+            "type": "m.room.message",
+            "content": {"msgtype": "m.text", "body": f"message {self.count}"},
+        }
+        return EncryptedEvent(
+            room_id=self.room_id,
+            event_id=EventID(f"${self.room_id}_{self.count}"),
+            sender=USER_ID,
+            timestamp=self.count,
+            type=EventType.ROOM_ENCRYPTED,
+            content=EncryptedMegolmEventContent(
+                ciphertext=self.outbound.encrypt(json.dumps(payload)),
+                session_id=SessionID(self.outbound.id),
+                sender_key=self.machine.account.identity_key,
+                device_id=DEVICE_ID,
+            ),
+        )
+
+
+async def test_decrypt(machine: OlmMachine) -> None:
+    sender = RoomSender(machine, RoomID("!room:example.com"))
+    await sender.share()
+    evt = sender.encrypt()
+    decrypted = await machine.decrypt_megolm_event(evt)
+    assert decrypted.content.body == "message 1"
+    assert decrypted["mautrix"]["trust_state"] == TrustState.VERIFIED
+    # Decrypting the same event again is fine, but reusing the message index isn't
+    await machine.decrypt_megolm_event(evt)
+    evt.event_id = EventID("$replayed")
+    with pytest.raises(DuplicateMessageIndex):
+        await machine.decrypt_megolm_event(evt)
+
+
+async def test_rooms_decrypted_concurrently(machine: OlmMachine) -> None:
+    store: SlowCryptoStore = machine.crypto_store
+    senders = [RoomSender(machine, RoomID(f"!room{i}:example.com")) for i in range(3)]
+    for sender in senders:
+        await sender.share()
+    events = [sender.encrypt() for _ in range(4) for sender in senders]
+    results = await asyncio.gather(*(machine.decrypt_megolm_event(evt) for evt in events))
+    assert [evt.content.body for evt in results] == [f"message {i // 3 + 1}" for i in range(12)]
+    # Different rooms decrypt in parallel, but each room only decrypts one event at a time
+    assert store.max_active_total == 3
+    assert store.max_active_per_room == 1
+    assert len(machine._megolm_decrypt_locks) == 0
+
+
+async def test_same_room_serialized(machine: OlmMachine) -> None:
+    store: SlowCryptoStore = machine.crypto_store
+    sender = RoomSender(machine, RoomID("!room:example.com"))
+    await sender.share()
+    events = [sender.encrypt() for _ in range(5)]
+    await asyncio.gather(*(machine.decrypt_megolm_event(evt) for evt in events))
+    assert store.max_active_per_room == 1
+    session = await store.get_group_session(sender.room_id, SessionID(sender.outbound.id))
+    # No ratchet updates were lost, even though the events were decrypted at the same time
+    assert session.ratchet_safety.next_index == 5
+    assert session.ratchet_safety.missed_indices == []
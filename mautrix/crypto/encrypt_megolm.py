@@ -7,7 +7,6 @@ from typing import Any, Dict, List, Tuple, Union
 from collections import defaultdict
 from datetime import datetime, timedelta
 import asyncio
-import json
 import time
 
 from mautrix.errors import EncryptionError, SessionShareError
@@ -28,6 +27,8 @@ from mautrix.types import (
     TrustState,
     UserID,
 )
+from mautrix.util import json_codec
+from mautrix.util.keyed_lock import KeyedLock
 
 from .device_lists import DeviceListMachine
 from .encrypt_olm import OlmEncryptionMachine
@@ -50,14 +51,17 @@ SessionEncryptResult = Union[
     type(key_missing),  # missing device
 ]
 
+# Maximum number of devices whose trust is resolved concurrently when sharing a group session
+MAX_CONCURRENT_SHARE_CHECKS = 32
+
 
 class MegolmEncryptionMachine(OlmEncryptionMachine, DeviceListMachine):
-    _megolm_locks: Dict[RoomID, asyncio.Lock]
+    _megolm_locks: KeyedLock[RoomID]
     _sharing_group_session: Dict[RoomID, asyncio.Event]
 
     def __init__(self) -> None:
         super().__init__()
-        self._megolm_locks = defaultdict(lambda: asyncio.Lock())
+        self._megolm_locks = KeyedLock()
         self._sharing_group_session = {}
 
     async def encrypt_megolm_event(
@@ -91,7 +95,7 @@ class MegolmEncryptionMachine(OlmEncryptionMachine, DeviceListMachine):
         if not session:
             raise EncryptionError("No group session created")
         ciphertext = session.encrypt(
-            json.dumps(
+            json_codec.dumps(
                 {
                     "room_id": room_id,
                     "type": event_type.serialize(),
@@ -178,8 +182,9 @@ class MegolmEncryptionMachine(OlmEncryptionMachine, DeviceListMachine):
         missing_sessions: Dict[UserID, Dict[DeviceID, DeviceIdentity]] = defaultdict(lambda: {})
         fetch_keys = []
 
+        all_devices = await self.crypto_store.get_devices_many(users)
         for user_id in users:
-            devices = await self.crypto_store.get_devices(user_id)
+            devices = all_devices.get(user_id)
             if devices is None:
                 self.log.debug(
                     f"get_devices returned nil for {user_id}, will fetch keys and retry"
@@ -187,16 +192,19 @@ class MegolmEncryptionMachine(OlmEncryptionMachine, DeviceListMachine):
                 fetch_keys.append(user_id)
             elif len(devices) == 0:
                 self.log.debug(f"{user_id} has no devices, skipping")
-            else:
-                self.log.debug(f"Trying to encrypt group session {session.id} for {user_id}")
-                for device_id, device in devices.items():
-                    result = await self._find_olm_sessions(session, user_id, device_id, device)
-                    if isinstance(result, RoomKeyWithheldEventContent):
-                        withhold_key_msgs[user_id][device_id] = result
-                    elif result == key_missing:
-                        missing_sessions[user_id][device_id] = device
-                    elif isinstance(result, tuple):
-                        olm_sessions[user_id][device_id] = result
+                del all_devices[user_id]
+        self.log.debug(
+            f"Trying to encrypt group session {session.id} for {len(all_devices)} users"
+        )
+        results = await self._find_olm_sessions(session, all_devices)
+        for user_id, device_results in results.items():
+            for device_id, result in device_results.items():
+                if isinstance(result, RoomKeyWithheldEventContent):
+                    withhold_key_msgs[user_id][device_id] = result
+                elif result == key_missing:
+                    missing_sessions[user_id][device_id] = all_devices[user_id][device_id]
+                elif isinstance(result, tuple):
+                    olm_sessions[user_id][device_id] = result
 
         if fetch_keys:
             self.log.debug(f"Fetching missing keys for {fetch_keys}")
@@ -211,9 +219,9 @@ class MegolmEncryptionMachine(OlmEncryptionMachine, DeviceListMachine):
             except Exception:
                 self.log.exception("Failed to create missing outbound sessions")
 
-        for user_id, devices in missing_sessions.items():
-            for device_id, device in devices.items():
-                result = await self._find_olm_sessions(session, user_id, device_id, device)
+        results = await self._find_olm_sessions(session, missing_sessions)
+        for user_id, device_results in results.items():
+            for device_id, result in device_results.items():
                 if isinstance(result, RoomKeyWithheldEventContent):
                     withhold_key_msgs[user_id][device_id] = result
                 elif isinstance(result, tuple):
@@ -320,12 +328,52 @@ class MegolmEncryptionMachine(OlmEncryptionMachine, DeviceListMachine):
         )
 
     async def _find_olm_sessions(
+        self,
+        session: OutboundGroupSession,
+        devices: Dict[UserID, Dict[DeviceID, DeviceIdentity]],
+    ) -> Dict[UserID, Dict[DeviceID, SessionEncryptResult]]:
+        results: Dict[UserID, Dict[DeviceID, SessionEncryptResult]] = defaultdict(lambda: {})
+        flat_devices = [
+            (user_id, device_id, device)
+            for user_id, user_devices in devices.items()
+            for device_id, device in user_devices.items()
+        ]
+        sema = asyncio.Semaphore(MAX_CONCURRENT_SHARE_CHECKS)
+
+        async def check(user_id: UserID, device_id: DeviceID, device: DeviceIdentity):
+            async with sema:
+                return await self._check_group_session_share(session, user_id, device_id, device)
+
+        checks = await asyncio.gather(*(check(*args) for args in flat_devices))
+        allowed = []
+        for (user_id, device_id, device), result in zip(flat_devices, checks):
+            if result is None:
+                allowed.append((user_id, device_id, device))
+            else:
+                results[user_id][device_id] = result
+        if not allowed:
+            return results
+
+        device_sessions = await self.crypto_store.get_latest_sessions(
+            list({device.identity_key for _, _, device in allowed})
+        )
+        for user_id, device_id, device in allowed:
+            try:
+                device_session = device_sessions[device.identity_key]
+            except KeyError:
+                results[user_id][device_id] = key_missing
+            else:
+                session.users_shared_with.add((user_id, device_id))
+                results[user_id][device_id] = device_session, device
+        return results
+
+    async def _check_group_session_share(
         self,
         session: OutboundGroupSession,
         user_id: UserID,
         device_id: DeviceID,
         device: DeviceIdentity,
-    ) -> SessionEncryptResult:
+    ) -> Union[type(already_shared), RoomKeyWithheldEventContent, None]:
         key = (user_id, device_id)
         if key in session.users_ignored or key in session.users_shared_with:
             return already_shared
@@ -363,8 +411,4 @@ class MegolmEncryptionMachine(OlmEncryptionMachine, DeviceListMachine):
                 code=RoomKeyWithheldCode.UNVERIFIED,
                 reason="This device does not encrypt messages for unverified devices",
             )
-        device_session = await self.crypto_store.get_latest_session(device.identity_key)
-        if not device_session:
-            return key_missing
-        session.users_shared_with.add(key)
-        return device_session, device
+        return None
@@ -29,6 +29,7 @@ from mautrix.types import (
     UserID,
 )
 from mautrix.util import background_task
+from mautrix.util.keyed_lock import KeyedLock
 from mautrix.util.logging import TraceLogger
 
 from .account import OlmAccount
@@ -93,7 +94,7 @@ class OlmMachine(
         self.disable_device_change_key_rotation = False
 
         self._fetch_keys_lock = asyncio.Lock()
-        self._megolm_decrypt_lock = asyncio.Lock()
+        self._megolm_decrypt_locks = KeyedLock()
         self._share_keys_lock = asyncio.Lock()
         self._last_key_share = time.monotonic() - 60
         self._key_request_waiters = {}
@@ -147,6 +147,25 @@ class CryptoStore(ABC):
             If the store contains no sessions, ``None``.
         """
 
+    async def get_latest_sessions(self, keys: list[IdentityKey]) -> dict[IdentityKey, Session]:
+        """
+        Get the latest Olm session for multiple devices at once. The default implementation calls
+        :meth:`get_latest_session` for each key, stores should override it with a single query.
+
+        Args:
+            keys: The curve25519 identity keys of the devices whose sessions to get.
+
+        Returns:
+            A dict from identity key to the most recent session for that device.
+            Devices with no sessions are not included.
+        """
+        sessions = {}
+        for key in keys:
+            session = await self.get_latest_session(key)
+            if session is not None:
+                sessions[key] = session
+        return sessions
+
     @abstractmethod
     async def add_session(self, key: IdentityKey, session: Session) -> None:
         """
@@ -371,6 +390,28 @@ class CryptoStore(ABC):
             Otherwise, ``None``.
         """
 
+    async def get_devices_many(
+        self, user_ids: list[UserID]
+    ) -> dict[UserID, dict[DeviceID, DeviceIdentity]]:
+        """
+        Get all devices for multiple users at once. The default implementation calls
+        :meth:`get_devices` for each user, stores should override it with a single query.
+
+        Args:
+            user_ids: The IDs of the users whose devices to get.
+
+        Returns:
+            A dict from user ID to a dict from device ID to :class:`DeviceIdentity` object.
+            Users whose device lists aren't tracked (i.e. :meth:`get_devices` would return
+            ``None``) are not included.
+        """
+        devices = {}
+        for user_id in user_ids:
+            user_devices = await self.get_devices(user_id)
+            if user_devices is not None:
+                devices[user_id] = user_devices
+        return devices
+
     @abstractmethod
     async def get_device(self, user_id: UserID, device_id: DeviceID) -> DeviceIdentity | None:
         """
@@ -5,11 +5,12 @@
 # file, You can obtain one at http://mozilla.org/MPL/2.0/.
 from __future__ import annotations
 
-from collections import defaultdict
+from typing import Any, Iterable
+from collections import OrderedDict, defaultdict
 from contextlib import asynccontextmanager
 from datetime import timedelta
 
-from asyncpg import UniqueViolationError
+from asyncpg import Record, UniqueViolationError
 
 from mautrix.client.state_store import SyncStore
 from mautrix.client.state_store.asyncpg import PgStateStore
@@ -32,6 +33,7 @@ from mautrix.types import (
 )
 from mautrix.util.async_db import Database, Scheme
 from mautrix.util.logging import TraceLogger
+from mautrix.util.opt_prometheus import Counter
 
 from ... import InboundGroupSession, OlmAccount, OutboundGroupSession, RatchetSafety, Session
 from ..abstract import CryptoStore, StateStore
@@ -49,6 +51,20 @@ except ImportError:
         pass
 
 
+GROUP_SESSION_CACHE_HITS = Counter(
+    name="bridge_crypto_group_session_cache_hits",
+    documentation="The number of inbound Megolm session lookups served from the in-memory cache",
+)
+GROUP_SESSION_CACHE_MISSES = Counter(
+    name="bridge_crypto_group_session_cache_misses",
+    documentation="The number of inbound Megolm session lookups that had to query the database",
+)
+
+# Older SQLite builds have SQLITE_MAX_VARIABLE_NUMBER set to 999,
+# so long IN (...) lists are split into chunks of this size.
+SQLITE_IN_CHUNK_SIZE = 500
+
+
 class PgCryptoStateStore(PgStateStore, StateStore):
     """
     This class ensures that the PgStateStore in the client module implements the StateStore
@@ -68,8 +84,17 @@ class PgCryptoStore(CryptoStore, SyncStore):
     _device_id: DeviceID | None
     _account: OlmAccount | None
     _olm_cache: dict[IdentityKey, dict[SessionID, Session]]
+    _group_session_cache: OrderedDict[SessionID, InboundGroupSession]
+    _group_session_uncache_count: int
+    group_session_cache_size: int
 
-    def __init__(self, account_id: str, pickle_key: str, db: Database) -> None:
+    def __init__(
+        self,
+        account_id: str,
+        pickle_key: str,
+        db: Database,
+        group_session_cache_size: int = 128,
+    ) -> None:
         self.db = db
         self.account_id = account_id
         self.pickle_key = pickle_key
@@ -79,11 +104,21 @@ class PgCryptoStore(CryptoStore, SyncStore):
         self._device_id = DeviceID("")
         self._account = None
         self._olm_cache = defaultdict(lambda: {})
+        self._group_session_cache = OrderedDict()
+        # Incremented whenever sessions are redacted, so that reads which started before that
+        # don't put the old session back in the cache.
+        self._group_session_uncache_count = 0
+        self.group_session_cache_size = group_session_cache_size
 
     @asynccontextmanager
     async def transaction(self) -> None:
-        async with self.db.acquire() as conn, conn.transaction():
-            yield
+        try:
+            async with self.db.acquire() as conn, conn.transaction():
+                yield
+        except BaseException:
+            # Sessions cached inside the transaction may have been rolled back
+            self._group_session_cache.clear()
+            raise
 
     async def delete(self) -> None:
         tables = ("crypto_account", "crypto_olm_session", "crypto_megolm_outbound_session")
@@ -157,29 +192,10 @@ class PgCryptoStore(CryptoStore, SyncStore):
         rows = await self.db.fetch(q, key, self.account_id)
         sessions = []
         for row in rows:
-            try:
-                sess = self._olm_cache[key][row["session_id"]]
-            except KeyError:
-                sess = Session.from_pickle(
-                    row["session"],
-                    passphrase=self.pickle_key,
-                    creation_time=row["created_at"],
-                    last_encrypted=row["last_encrypted"],
-                    last_decrypted=row["last_decrypted"],
-                )
-                self._olm_cache[key][SessionID(sess.id)] = sess
-            sessions.append(sess)
+            sessions.append(self._session_from_row(key, row))
         return sessions
 
-    async def get_latest_session(self, key: IdentityKey) -> Session | None:
-        q = """
-        SELECT session_id, session, created_at, last_encrypted, last_decrypted
-        FROM crypto_olm_session WHERE sender_key=$1 AND account_id=$2
-        ORDER BY last_decrypted DESC LIMIT 1
-        """
-        row = await self.db.fetchrow(q, key, self.account_id)
-        if row is None:
-            return None
+    def _session_from_row(self, key: IdentityKey, row: Record) -> Session:
         try:
             return self._olm_cache[key][row["session_id"]]
         except KeyError:
@@ -193,6 +209,46 @@ class PgCryptoStore(CryptoStore, SyncStore):
             self._olm_cache[key][SessionID(sess.id)] = sess
             return sess
 
+    async def get_latest_session(self, key: IdentityKey) -> Session | None:
+        q = """
+        SELECT session_id, session, created_at, last_encrypted, last_decrypted
+        FROM crypto_olm_session WHERE sender_key=$1 AND account_id=$2
+        ORDER BY last_decrypted DESC LIMIT 1
+        """
+        row = await self.db.fetchrow(q, key, self.account_id)
+        if row is None:
+            return None
+        return self._session_from_row(key, row)
+
+    async def get_latest_sessions(self, keys: list[IdentityKey]) -> dict[IdentityKey, Session]:
+        if not keys:
+            return {}
+        if self.db.scheme in (Scheme.POSTGRES, Scheme.COCKROACH):
+            return await self._get_latest_sessions("sender_key = ANY($2)", (keys,))
+        result = {}
+        for i in range(0, len(keys), SQLITE_IN_CHUNK_SIZE):
+            chunk = keys[i : i + SQLITE_IN_CHUNK_SIZE]
+            key_filter = f"sender_key IN ({','.join(['?'] * len(chunk))})"
+            result.update(await self._get_latest_sessions(key_filter, chunk))
+        return result
+
+    async def _get_latest_sessions(
+        self, key_filter: str, args: Iterable[Any]
+    ) -> dict[IdentityKey, Session]:
+        q = f"""
+        SELECT sender_key, session_id, session, created_at, last_encrypted, last_decrypted
+        FROM (
+            SELECT sender_key, session_id, session, created_at, last_encrypted, last_decrypted,
+                   ROW_NUMBER() OVER (
+                       PARTITION BY sender_key ORDER BY last_decrypted DESC
+                   ) AS row_num
+            FROM crypto_olm_session WHERE account_id=$1 AND {key_filter}
+        ) AS latest
+        WHERE row_num=1
+        """
+        rows = await self.db.fetch(q, self.account_id, *args)
+        return {row["sender_key"]: self._session_from_row(row["sender_key"], row) for row in rows}
+
     async def add_session(self, key: IdentityKey, session: Session) -> None:
         if session.id in self._olm_cache[key]:
             self.log.warning(f"Cache already contains Olm session with ID {session.id}")
@@ -270,10 +326,37 @@ class PgCryptoStore(CryptoStore, SyncStore):
             )
         except (IntegrityError, UniqueViolationError):
             self.log.exception(f"Failed to insert megolm session {session_id}")
+            self._group_session_cache.pop(session_id, None)
+        except BaseException:
+            # The cached object may have been modified in-place (e.g. the ratchet safety info
+            # when decrypting), so drop it to make sure the next read matches the database.
+            self._group_session_cache.pop(session_id, None)
+            raise
+        else:
+            self._cache_group_session(session_id, session)
+
+    def _cache_group_session(self, session_id: SessionID, session: InboundGroupSession) -> None:
+        if self.group_session_cache_size <= 0:
+            return
+        self._group_session_cache[session_id] = session
+        self._group_session_cache.move_to_end(session_id)
+        while len(self._group_session_cache) > self.group_session_cache_size:
+            self._group_session_cache.popitem(last=False)
 
     async def get_group_session(
         self, room_id: RoomID, session_id: SessionID
     ) -> InboundGroupSession | None:
+        try:
+            cached = self._group_session_cache[session_id]
+        except KeyError:
+            pass
+        else:
+            if cached.room_id == room_id:
+                GROUP_SESSION_CACHE_HITS.inc()
+                self._group_session_cache.move_to_end(session_id)
+                return cached
+        GROUP_SESSION_CACHE_MISSES.inc()
+        uncache_count = self._group_session_uncache_count
         q = """
         SELECT
             sender_key, signing_key, session, forwarding_chains, withheld_code,
@@ -287,7 +370,7 @@ class PgCryptoStore(CryptoStore, SyncStore):
         if row["withheld_code"] is not None:
             raise GroupSessionWithheldError(session_id, row["withheld_code"])
         forwarding_chain = row["forwarding_chains"].split(",") if row["forwarding_chains"] else []
-        return InboundGroupSession.from_pickle(
+        session = InboundGroupSession.from_pickle(
             row["session"],
             passphrase=self.pickle_key,
             signing_key=row["signing_key"],
@@ -300,10 +383,14 @@ class PgCryptoStore(CryptoStore, SyncStore):
             max_messages=row["max_messages"],
             is_scheduled=row["is_scheduled"],
         )
+        if uncache_count == self._group_session_uncache_count:
+            self._cache_group_session(session_id, session)
+        return session
 
     async def redact_group_session(
         self, room_id: RoomID, session_id: SessionID, reason: str
     ) -> None:
+        self._uncache_group_sessions([session_id])
         q = """
         UPDATE crypto_megolm_inbound_session
         SET withheld_code=$1, withheld_reason=$2, session=NULL, forwarding_chains=NULL
@@ -316,6 +403,8 @@ class PgCryptoStore(CryptoStore, SyncStore):
             session_id,
             self.account_id,
         )
+        # A concurrent get_group_session may have cached the session while the update was running
+        self._uncache_group_sessions([session_id])
 
     async def redact_group_sessions(
         self, room_id: RoomID, sender_key: IdentityKey, reason: str
@@ -337,7 +426,14 @@ class PgCryptoStore(CryptoStore, SyncStore):
             sender_key,
             self.account_id,
         )
-        return [row["session_id"] for row in rows]
+        return self._uncache_group_sessions(row["session_id"] for row in rows)
+
+    def _uncache_group_sessions(self, session_ids: Iterable[SessionID]) -> list[SessionID]:
+        session_ids = list(session_ids)
+        self._group_session_uncache_count += 1
+        for session_id in session_ids:
+            self._group_session_cache.pop(session_id, None)
+        return session_ids
 
     async def redact_expired_group_sessions(self) -> list[SessionID]:
         if self.db.scheme == Scheme.SQLITE:
@@ -366,7 +462,7 @@ class PgCryptoStore(CryptoStore, SyncStore):
             f"Session redacted: expired",
             self.account_id,
         )
-        return [row["session_id"] for row in rows]
+        return self._uncache_group_sessions(row["session_id"] for row in rows)
 
     async def redact_outdated_group_sessions(self) -> list[SessionID]:
         q = """
@@ -381,7 +477,7 @@ class PgCryptoStore(CryptoStore, SyncStore):
             f"Session redacted: outdated",
             self.account_id,
         )
-        return [row["session_id"] for row in rows]
+        return self._uncache_group_sessions(row["session_id"] for row in rows)
 
     async def has_group_session(self, room_id: RoomID, session_id: SessionID) -> bool:
         q = """
@@ -547,6 +643,47 @@ class PgCryptoStore(CryptoStore, SyncStore):
             )
         return result
 
+    async def get_devices_many(
+        self, user_ids: list[UserID]
+    ) -> dict[UserID, dict[DeviceID, DeviceIdentity]]:
+        if not user_ids:
+            return {}
+        if self.db.scheme in (Scheme.POSTGRES, Scheme.COCKROACH):
+            return await self._get_devices_many("user_id = ANY($1)", (user_ids,))
+        result = {}
+        for i in range(0, len(user_ids), SQLITE_IN_CHUNK_SIZE):
+            chunk = user_ids[i : i + SQLITE_IN_CHUNK_SIZE]
+            user_filter = f"user_id IN ({','.join(['?'] * len(chunk))})"
+            result.update(await self._get_devices_many(user_filter, chunk))
+        return result
+
+    async def _get_devices_many(
+        self, user_filter: str, args: Iterable[Any]
+    ) -> dict[UserID, dict[DeviceID, DeviceIdentity]]:
+        q = f"SELECT user_id FROM crypto_tracked_user WHERE {user_filter}"
+        result = {row["user_id"]: {} for row in await self.db.fetch(q, *args)}
+        if not result:
+            return result
+        q = f"""
+        SELECT user_id, device_id, identity_key, signing_key, trust, deleted, name
+        FROM crypto_device WHERE {user_filter}
+        """
+        for row in await self.db.fetch(q, *args):
+            try:
+                user_devices = result[row["user_id"]]
+            except KeyError:
+                continue
+            user_devices[row["device_id"]] = DeviceIdentity(
+                user_id=row["user_id"],
+                device_id=row["device_id"],
+                identity_key=row["identity_key"],
+                signing_key=row["signing_key"],
+                trust=TrustState(row["trust"]),
+                deleted=row["deleted"],
+                name=row["name"],
+            )
+        return result
+
     async def get_device(self, user_id: UserID, device_id: DeviceID) -> DeviceIdentity | None:
         q = """
         SELECT identity_key, signing_key, trust, deleted, name FROM crypto_device
@@ -89,6 +89,9 @@ class MemoryCryptoStore(CryptoStore, SyncStore):
         except (KeyError, IndexError):
             return None
 
+    async def get_latest_sessions(self, keys: list[IdentityKey]) -> dict[IdentityKey, Session]:
+        return {key: self._olm_sessions[key][-1] for key in keys if self._olm_sessions.get(key)}
+
     async def add_session(self, key: IdentityKey, session: Session) -> None:
         self._olm_sessions.setdefault(key, []).append(session)
 
@@ -174,6 +177,13 @@ class MemoryCryptoStore(CryptoStore, SyncStore):
     async def get_devices(self, user_id: UserID) -> dict[DeviceID, DeviceIdentity] | None:
         return self._devices.get(user_id)
 
+    async def get_devices_many(
+        self, user_ids: list[UserID]
+    ) -> dict[UserID, dict[DeviceID, DeviceIdentity]]:
+        return {
+            user_id: self._devices[user_id] for user_id in user_ids if user_id in self._devices
+        }
+
     async def get_device(self, user_id: UserID, device_id: DeviceID) -> DeviceIdentity | None:
         return self._devices.get(user_id, {}).get(device_id)
 
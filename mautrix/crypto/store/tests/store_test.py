@@ -7,6 +7,7 @@ from __future__ import annotations
 
 from typing import AsyncContextManager, AsyncIterator, Callable
 from contextlib import asynccontextmanager
+import asyncio
 import os
 import random
 import string
@@ -17,7 +18,17 @@ import pytest
 
 from mautrix.client.state_store import SyncStore
 from mautrix.crypto import InboundGroupSession, OlmAccount, OutboundGroupSession
-from mautrix.types import DeviceID, EventID, RoomID, SessionID, SyncToken
+from mautrix.errors import GroupSessionWithheldError
+from mautrix.types import (
+    DeviceID,
+    DeviceIdentity,
+    EventID,
+    RoomID,
+    SessionID,
+    SyncToken,
+    TrustState,
+    UserID,
+)
 from mautrix.util.async_db import Database
 
 from .. import CryptoStore, MemoryCryptoStore, PgCryptoStore
@@ -128,5 +139,109 @@ async def test_validate_message_index(crypto_store: CryptoStore) -> None:
     ), "Validating the same details after fails still returns True"
 
 
+async def test_group_session_cache() -> None:
+    acc = OlmAccount()
+    room_id = RoomID("!foo:bar.com")
+    async with async_sqlite_store() as store:
+        store.group_session_cache_size = 1
+        inbound, _ = _make_group_sess(acc, room_id)
+        session_id = SessionID(inbound.id)
+        await store.put_group_session(room_id, acc.identity_key, session_id, inbound)
+        assert await store.get_group_session(room_id, session_id) is inbound
+        assert await store.get_group_session(RoomID("!baz:bar.com"), session_id) is None
+
+        other, _ = _make_group_sess(acc, room_id)
+        await store.put_group_session(room_id, acc.identity_key, SessionID(other.id), other)
+        assert session_id not in store._group_session_cache, "Cache is bounded"
+        fetched = await store.get_group_session(room_id, session_id)
+        assert fetched is not inbound and fetched.id == inbound.id
+
+        fetched.ratchet_safety.next_index = 5
+        await store.db.execute("ALTER TABLE crypto_megolm_inbound_session RENAME TO tmp")
+        with pytest.raises(Exception):
+            await store.put_group_session(room_id, acc.identity_key, session_id, fetched)
+        await store.db.execute("ALTER TABLE tmp RENAME TO crypto_megolm_inbound_session")
+        assert session_id not in store._group_session_cache, "Failed put drops cached session"
+        fetched = await store.get_group_session(room_id, session_id)
+        assert fetched.ratchet_safety.next_index == 0
+
+        await store.redact_group_session(room_id, session_id, reason="test")
+        assert session_id not in store._group_session_cache
+        with pytest.raises(GroupSessionWithheldError):
+            await store.get_group_session(room_id, session_id)
+
+
+async def test_group_session_cache_redact_race() -> None:
+    acc = OlmAccount()
+    room_id = RoomID("!foo:bar.com")
+    async with async_sqlite_store() as store:
+        inbound, _ = _make_group_sess(acc, room_id)
+        session_id = SessionID(inbound.id)
+        await store.put_group_session(room_id, acc.identity_key, session_id, inbound)
+        store._group_session_cache.clear()
+
+        # Make the read return the row from before the redaction only after it's done
+        orig_fetchrow = store.db.fetchrow
+        row_read = asyncio.Event()
+        redacted = asyncio.Event()
+
+        async def slow_fetchrow(*args):
+            row = await orig_fetchrow(*args)
+            row_read.set()
+            await redacted.wait()
+            return row
+
+        store.db.fetchrow = slow_fetchrow
+        get_task = asyncio.create_task(store.get_group_session(room_id, session_id))
+        await row_read.wait()
+        await store.redact_group_session(room_id, session_id, reason="test")
+        redacted.set()
+        await get_task
+        store.db.fetchrow = orig_fetchrow
+
+        assert session_id not in store._group_session_cache, "Stale read isn't cached"
+        with pytest.raises(GroupSessionWithheldError):
+            await store.get_group_session(room_id, session_id)
+
+
+async def test_bulk_device_and_session_lookup(crypto_store: CryptoStore) -> None:
+    alice, bob, carol = UserID("@alice:bar.com"), UserID("@bob:bar.com"), UserID("@carol:bar.com")
+    accounts = {}
+    for user_id in (alice, bob):
+        acc = accounts[user_id] = OlmAccount()
+        device = DeviceIdentity(
+            user_id=user_id,
+            device_id=DeviceID("DEVICE"),
+            identity_key=acc.identity_key,
+            signing_key=acc.signing_key,
+            trust=TrustState.UNVERIFIED,
+            deleted=False,
+            name="",
+        )
+        await crypto_store.put_devices(user_id, {device.device_id: device})
+    devices = await crypto_store.get_devices_many([alice, bob, carol])
+    assert devices.keys() == {alice, bob}
+    assert devices[alice][DeviceID("DEVICE")].identity_key == accounts[alice].identity_key
+
+    own_acc = OlmAccount()
+    bob_acc = accounts[bob]
+    bob_acc.generate_one_time_keys(2)
+    otks = list(bob_acc.one_time_keys["curve25519"].values())
+    first = own_acc.new_outbound_session(bob_acc.identity_key, otks[0])
+    await crypto_store.add_session(bob_acc.identity_key, first)
+    sessions = await crypto_store.get_latest_sessions(
+        [accounts[alice].identity_key, bob_acc.identity_key]
+    )
+    assert sessions.keys() == {bob_acc.identity_key}
+    assert sessions[bob_acc.identity_key].id == first.id
+
+    # More parameters than older SQLite builds allow in one query, with real entries at the end
+    padding = [f"@user{i}:bar.com" for i in range(1500)]
+    devices = await crypto_store.get_devices_many([*padding, alice, bob])
+    assert devices.keys() == {alice, bob}
+    sessions = await crypto_store.get_latest_sessions([*padding, bob_acc.identity_key])
+    assert sessions.keys() == {bob_acc.identity_key}
+
+
 # TODO tests for device identity storage, group session storage
 #      and cross-signing key/signature storage
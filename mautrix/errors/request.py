@@ -172,7 +172,11 @@ class MNotFound(MatrixStandardRequestError):
 
 @standard_error("M_LIMIT_EXCEEDED")
 class MLimitExceeded(MatrixStandardRequestError):
-    pass
+    retry_after_ms: int | None = None
+    """
+    How long the homeserver asked to wait before retrying, from either the ``retry_after_ms``
+    field in the response or the ``Retry-After`` header.
+    """
 
 
 @standard_error("M_UNKNOWN")
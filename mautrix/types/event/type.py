@@ -4,7 +4,8 @@
 # License, v. 2.0. If a copy of the MPL was not distributed with this
 # file, You can obtain one at http://mozilla.org/MPL/2.0/.
 from typing import Any, Optional
-import json
+
+from mautrix.util import json_codec
 
 from ..primitive import JSON
 from ..util import ExtensibleEnum, Serializable, SerializableEnum
@@ -105,11 +106,11 @@ class EventType(Serializable):
             return EventType(t, t_class=t_class or cls.Class.UNKNOWN)
 
     def json(self) -> str:
-        return json.dumps(self.serialize())
+        return json_codec.dumps(self.serialize())
 
     @classmethod
     def parse_json(cls, data: str) -> "EventType":
-        return cls.deserialize(json.loads(data))
+        return cls.deserialize(json_codec.loads(data))
 
     def __setattr__(self, *args, **kwargs) -> None:
         raise TypeError("EventTypes are frozen")
@@ -6,7 +6,8 @@
 from typing import Type, TypeVar, Union
 from abc import ABC, abstractmethod
 from enum import Enum
-import json
+
+from mautrix.util import json_codec
 
 from ..primitive import JSON
 
@@ -27,12 +28,12 @@ class Serializable:
 
     def json(self) -> str:
         """Serialize this object and dump the output as JSON."""
-        return json.dumps(self.serialize())
+        return json_codec.dumps(self.serialize())
 
     @classmethod
     def parse_json(cls: Type[SerializableSubtype], data: Union[str, bytes]) -> SerializableSubtype:
         """Parse the given string as JSON and deserialize the result into this type."""
-        return cls.deserialize(json.loads(data))
+        return cls.deserialize(json_codec.loads(data))
 
 
 class SerializerError(Exception):
@@ -3,7 +3,20 @@
 # This Source Code Form is subject to the terms of the Mozilla Public
 # License, v. 2.0. If a copy of the MPL was not distributed with this
 # file, You can obtain one at http://mozilla.org/MPL/2.0/.
-from typing import Any, Callable, Dict, Iterator, NewType, Optional, Tuple, Type, TypeVar, Union
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterator,
+    List,
+    NamedTuple,
+    NewType,
+    Optional,
+    Tuple,
+    Type,
+    TypeVar,
+    Union,
+)
 from uuid import UUID
 import copy
 import logging
@@ -121,6 +134,7 @@ def serializer(elem_type: Type[T]) -> Callable[[Serializer], Serializer]:
 
     def decorator(func: Serializer) -> Serializer:
         serializer_map[elem_type] = func
+        _serializer_cache.clear()
         return func
 
     return decorator
@@ -147,11 +161,33 @@ def deserializer(elem_type: Type[T]) -> Callable[[Deserializer], Deserializer]:
 
     def decorator(func: Deserializer) -> Deserializer:
         deserializer_map[elem_type] = func
+        # Deserializers of other types may have looked up this type, so throw them away
+        _deserializer_cache.clear()
         return func
 
     return decorator
 
 
+class _FieldInfo(NamedTuple):
+    json: str
+    name: str
+    field: attr.Attribute
+    flatten: bool
+    omit_empty: bool
+    omit_default: bool
+
+
+class _AttrsInfo(NamedTuple):
+    fields: List[_FieldInfo]
+    flatten_fields: List[_FieldInfo]
+    json_fields: Dict[str, _FieldInfo]
+
+
+_attrs_info_cache: Dict[type, _AttrsInfo] = {}
+_deserializer_cache: Dict[Any, Callable[[JSON, Any], Any]] = {}
+_serializer_cache: Dict[Any, Serializer] = {}
+
+
 def _fields(attrs_type: Type[T], only_if_flatten: bool = None) -> Iterator[Tuple[str, Type[T2]]]:
     for field in attr.fields(attrs_type):
         if field.metadata.get(META_HIDDEN, False):
@@ -160,6 +196,35 @@ def _fields(attrs_type: Type[T], only_if_flatten: bool = None) -> Iterator[Tuple
             yield field.metadata.get(META_JSON, field.name), field
 
 
+def _attrs_info(attrs_type: Type[T]) -> _AttrsInfo:
+    """
+    Get the field metadata of an attrs class in the form used by the (de)serializers.
+    The info is generated on first use and cached, as reading it from attrs is relatively slow.
+    """
+    try:
+        return _attrs_info_cache[attrs_type]
+    except KeyError:
+        pass
+    fields = [
+        _FieldInfo(
+            json=json_name,
+            name=field.name.lstrip("_"),
+            field=field,
+            flatten=field.metadata.get(META_FLATTEN, False),
+            omit_empty=field.metadata.get(META_OMIT_EMPTY, True),
+            omit_default=field.metadata.get(META_OMIT_DEFAULT, False),
+        )
+        for json_name, field in _fields(attrs_type)
+    ]
+    info = _AttrsInfo(
+        fields=fields,
+        flatten_fields=[field for field in fields if field.flatten],
+        json_fields={field.json: field for field in fields if not field.flatten},
+    )
+    _attrs_info_cache[attrs_type] = info
+    return info
+
+
 immutable = int, str, float, bool, type(None)
 
 
@@ -182,20 +247,18 @@ def _dict_to_attrs(
 ) -> T:
     data = data or {}
     unrecognized = {}
-    new_items = {
-        field_meta.name.lstrip("_"): _try_deserialize(field_meta, data)
-        for _, field_meta in _fields(attrs_type, only_if_flatten=True)
-    }
-    fields = dict(_fields(attrs_type, only_if_flatten=False))
+    info = _attrs_info(attrs_type)
+    new_items = {field.name: _try_deserialize(field.field, data) for field in info.flatten_fields}
+    fields = info.json_fields
     for key, value in data.items():
         try:
-            field_meta = fields[key]
+            field = fields[key]
         except KeyError:
             unrecognized[key] = value
             continue
-        name = field_meta.name.lstrip("_")
+        name = field.name
         try:
-            new_items[name] = _try_deserialize(field_meta, value)
+            new_items[name] = _try_deserialize(field.field, value)
         except UnknownSerializationError as e:
             raise SerializerError(
                 f"Failed to deserialize {value} into key {name} of {attrs_type.__name__}"
@@ -244,13 +307,40 @@ def _has_custom_deserializer(cls) -> bool:
 def _deserialize(cls: Type[T], value: JSON, default: Optional[T] = None) -> T:
     if value is None:
         return _safe_default(default)
+    return _get_deserializer(cls)(value, default)
+
+
+def _get_deserializer(cls: Type[T]) -> Callable[[JSON, Optional[T]], T]:
+    try:
+        return _deserializer_cache[cls]
+    except KeyError:
+        deser = _deserializer_cache[cls] = _build_deserializer(cls)
+        return deser
+    except TypeError:
+        # Unhashable type hint, just build the deserializer every time
+        return _build_deserializer(cls)
 
+
+def _deserialize_unknown(value: JSON, default: Any) -> Any:
+    if isinstance(value, list):
+        return Lst(value)
+    elif isinstance(value, dict):
+        return Obj(**value)
+    return value
+
+
+def _build_deserializer(cls: Type[T]) -> Callable[[JSON, Optional[T]], T]:
+    """
+    Resolve the deserialization function for the given type hint. This does all the type
+    checks of the deserialization process in advance, so that they don't need to be repeated for
+    every value. The result is cached in :func:`_get_deserializer`.
+    """
     try:
         deser = deserializer_map[cls]
     except KeyError:
         pass
     else:
-        return deser(value)
+        return lambda value, default: deser(value)
     supertype = getattr(cls, "__supertype__", None)
     if supertype:
         cls = supertype
@@ -259,39 +349,39 @@ def _deserialize(cls: Type[T], value: JSON, default: Optional[T] = None) -> T:
         except KeyError:
             pass
         else:
-            return deser(value)
+            return lambda value, default: deser(value)
 
     if attr.has(cls):
         if _has_custom_deserializer(cls):
-            return cls.deserialize(value)
-        return _dict_to_attrs(cls, value, default, default_if_empty=True)
+            return lambda value, default: cls.deserialize(value)
+        return lambda value, default: _dict_to_attrs(cls, value, default, default_if_empty=True)
     elif cls == Any or cls == JSON:
-        return value
+        return lambda value, default: value
     elif isinstance(cls, type) and issubclass(cls, Serializable):
-        return cls.deserialize(value)
+        return lambda value, default: cls.deserialize(value)
 
     type_class = getattr(cls, "__origin__", None)
     args = getattr(cls, "__args__", None)
     if type_class is Union:
         if len(args) == 2 and isinstance(None, args[1]):
-            return _deserialize(args[0], value, default)
+            return _get_deserializer(args[0])
     elif type_class == list:
-        (item_cls,) = args
-        return [_deserialize(item_cls, item) for item in value]
+        item_deser = _get_deserializer(args[0])
+        return lambda value, default: [
+            None if item is None else item_deser(item, None) for item in value
+        ]
     elif type_class == set:
-        (item_cls,) = args
-        return {_deserialize(item_cls, item) for item in value}
+        item_deser = _get_deserializer(args[0])
+        return lambda value, default: {
+            None if item is None else item_deser(item, None) for item in value
+        }
     elif type_class == dict:
-        key_cls, val_cls = args
-        return {
-            _deserialize(key_cls, key): _deserialize(val_cls, item) for key, item in value.items()
+        key_deser, val_deser = _get_deserializer(args[0]), _get_deserializer(args[1])
+        return lambda value, default: {
+            key_deser(key, None): None if item is None else val_deser(item, None)
+            for key, item in value.items()
         }
-
-    if isinstance(value, list):
-        return Lst(value)
-    elif isinstance(value, dict):
-        return Obj(**value)
-    return value
+    return _deserialize_unknown
 
 
 def _actual_type(cls: Type[T]) -> Type[T]:
@@ -304,35 +394,41 @@ def _actual_type(cls: Type[T]) -> Type[T]:
 
 
 def _get_serializer(cls: Type[T]) -> Serializer:
-    return serializer_map.get(_actual_type(cls), _serialize)
+    try:
+        return _serializer_cache[cls]
+    except KeyError:
+        ser = _serializer_cache[cls] = serializer_map.get(_actual_type(cls), _serialize)
+        return ser
+    except TypeError:
+        return serializer_map.get(_actual_type(cls), _serialize)
 
 
-def _serialize_attrs_field(data: T, field: T2) -> JSON:
-    field_val = getattr(data, field.name)
+def _serialize_attrs_field(data: T, field: _FieldInfo) -> JSON:
+    field_val = getattr(data, field.field.name)
     if field_val is None:
-        if not field.metadata.get(META_OMIT_EMPTY, True):
-            if field.default is not attr.NOTHING:
-                field_val = _safe_default(field.default)
+        if not field.omit_empty:
+            if field.field.default is not attr.NOTHING:
+                field_val = _safe_default(field.field.default)
         else:
             return attr.NOTHING
 
-    if field.metadata.get(META_OMIT_DEFAULT, False) and field_val == field.default:
+    if field.omit_default and field_val == field.field.default:
         return attr.NOTHING
 
-    return _get_serializer(field.type)(field_val)
+    return _get_serializer(field.field.type)(field_val)
 
 
 def _attrs_to_dict(data: T) -> JSON:
     new_dict = {}
-    for json_name, field in _fields(data.__class__):
-        if not json_name:
+    for field in _attrs_info(data.__class__).fields:
+        if not field.json:
             continue
         serialized = _serialize_attrs_field(data, field)
         if serialized is not attr.NOTHING:
-            if field.metadata.get(META_FLATTEN, False) and isinstance(serialized, dict):
+            if field.flatten and isinstance(serialized, dict):
                 new_dict.update(serialized)
             else:
-                new_dict[json_name] = serialized
+                new_dict[field.json] = serialized
     try:
         new_dict.update(data.unrecognized_)
     except (AttributeError, TypeError):
@@ -341,7 +437,9 @@ def _attrs_to_dict(data: T) -> JSON:
 
 
 def _serialize(val: Any) -> JSON:
-    if isinstance(val, Serializable):
+    if type(val) in immutable:
+        return val
+    elif isinstance(val, Serializable):
         return val.serialize()
     elif isinstance(val, (tuple, list, set)):
         return [_serialize(subval) for subval in val]
@@ -9,7 +9,14 @@ from attr import dataclass
 import pytest
 
 from ..primitive import JSON
-from .serializable_attrs import Serializable, SerializableAttrs, SerializerError, field
+from .serializable_attrs import (
+    Serializable,
+    SerializableAttrs,
+    SerializerError,
+    deserializer,
+    field,
+    serializer,
+)
 
 
 def test_simple_class():
@@ -256,3 +263,32 @@ def test_flatten_optional():
 
     assert ThingWithOptional.deserialize({}).optional is None
     assert ThingWithOptional.deserialize({"key": "hi"}).optional.key == "hi"
+
+
+def test_custom_deserializer_registered_after_use():
+    class Point:
+        def __init__(self, x: int, y: int) -> None:
+            self.x = x
+            self.y = y
+
+    @dataclass
+    class Shape(SerializableAttrs):
+        points: List[Point]
+        center: Optional[Point] = None
+
+    assert Shape.deserialize({"points": [[1, 2]]}).points == [[1, 2]]
+
+    @deserializer(Point)
+    def deserialize_point(data: JSON) -> Point:
+        return Point(*data)
+
+    @serializer(Point)
+    def serialize_point(point: Point) -> JSON:
+        return [point.x, point.y]
+
+    shape = Shape.deserialize({"points": [[1, 2], None], "center": [3, 4]})
+    assert shape.points[0].x == 1 and shape.points[0].y == 2
+    assert shape.points[1] is None
+    assert shape.center.x == 3 and shape.center.y == 4
+    shape.points = []
+    assert shape.serialize() == {"points": [], "center": [3, 4]}
@@ -14,6 +14,9 @@ __all__ = [
     "ffmpeg",
     "file_store",
     "format_duration",
+    "json_codec",
+    "keyed_lock",
+    "lru",
     "magic",
     "manhole",
     "markdown",
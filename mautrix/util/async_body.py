@@ -5,12 +5,16 @@
 # file, You can obtain one at http://mozilla.org/MPL/2.0/.
 from __future__ import annotations
 
-from typing import AsyncGenerator, Union
+from typing import AsyncGenerator, Callable, Optional, Union
+from functools import partial
+import asyncio
 import logging
+import os
 
 import aiohttp
 
 AsyncBody = AsyncGenerator[Union[bytes, bytearray, memoryview], None]
+ProgressCallback = Callable[[int, Optional[int]], None]
 
 
 async def async_iter_bytes(data: bytearray | bytes, chunk_size: int = 1024**2) -> AsyncBody:
@@ -39,7 +43,7 @@ _default_dl_log = logging.getLogger("mau.util.download")
 
 
 async def read_response_chunks(
-    resp: aiohttp.ClientResponse, max_size: int, log: logging.Logger = _default_dl_log
+    resp: aiohttp.ClientResponse, max_size: int | None, log: logging.Logger = _default_dl_log
 ) -> bytearray:
     """
     Read the body from an aiohttp response in chunks into a mutable bytearray.
@@ -47,7 +51,8 @@ async def read_response_chunks(
     Args:
         resp: The aiohttp response object to read the body from.
         max_size: The maximum size to read. FileTooLargeError will be raised if the Content-Length
-            is higher than this, or if the body exceeds this size during reading.
+            is higher than this, or if the body exceeds this size during reading. ``None`` or
+            ``0`` means there's no limit.
         log: A logger for logging download status.
 
     Returns:
@@ -56,6 +61,7 @@ async def read_response_chunks(
     Raises:
         FileTooLargeError: if the body is larger than the provided max_size.
     """
+    max_size = max_size or 0
     content_length = int(resp.headers.get("Content-Length", "0"))
     if 0 < max_size < content_length:
         raise FileTooLargeError(max_size)
@@ -64,13 +70,11 @@ async def read_response_chunks(
     data = bytearray(content_length)
     mv = memoryview(data) if content_length > 0 else None
     read_size = 0
-    max_size += 1
     while True:
         block = await resp.content.readany()
         if not block:
             break
-        max_size -= len(block)
-        if max_size <= 0:
+        if 0 < max_size < read_size + len(block):
             raise FileTooLargeError(max_size)
         if len(data) >= read_size + len(block):
             mv[read_size : read_size + len(block)] = block
@@ -92,4 +96,101 @@ async def read_response_chunks(
     return data
 
 
-__all__ = ["AsyncBody", "FileTooLargeError", "async_iter_bytes", "async_read_bytes"]
+async def iter_response_chunks(
+    resp: aiohttp.ClientResponse,
+    max_size: int | None = None,
+    progress: ProgressCallback | None = None,
+    chunk_size: int = 64 * 1024,
+) -> AsyncBody:
+    """
+    Read the body from an aiohttp response chunk by chunk without storing the whole thing in
+    memory.
+
+    Args:
+        resp: The aiohttp response object to read the body from.
+        max_size: The maximum size to read. FileTooLargeError will be raised if the Content-Length
+            is higher than this, or if the body exceeds this size during reading. ``None`` or
+            ``0`` means there's no limit.
+        progress: A function that is called after each chunk with the number of bytes read so far
+            and the total size from the Content-Length header (or ``None`` if it's not known).
+        chunk_size: The maximum size of each chunk.
+
+    Returns:
+        An async generator that yields the body in chunks.
+
+    Raises:
+        FileTooLargeError: if the body is larger than the provided max_size.
+    """
+    max_size = max_size or 0
+    content_length = resp.content_length
+    if content_length is not None and 0 < max_size < content_length:
+        raise FileTooLargeError(max_size)
+    read_size = 0
+    async for chunk in resp.content.iter_chunked(chunk_size):
+        read_size += len(chunk)
+        if 0 < max_size < read_size:
+            raise FileTooLargeError(max_size)
+        if progress:
+            progress(read_size, content_length)
+        yield chunk
+
+
+async def write_response_to_file(
+    resp: aiohttp.ClientResponse,
+    path: str | os.PathLike,
+    max_size: int | None = None,
+    progress: ProgressCallback | None = None,
+    log: logging.Logger = _default_dl_log,
+) -> int:
+    """
+    Write the body from an aiohttp response into a file chunk by chunk.
+
+    The data is first written into a temporary ``.part`` file next to the target path, which is
+    only moved to the target path after the whole body has been read. If reading the body fails,
+    the temporary file is deleted and the target path is left untouched. File operations are
+    done in a thread to avoid blocking the event loop.
+
+    Args:
+        resp: The aiohttp response object to read the body from.
+        path: The path of the file to write.
+        max_size: The maximum size to read, see :func:`iter_response_chunks`.
+        progress: A progress callback, see :func:`iter_response_chunks`.
+        log: A logger for logging download status.
+
+    Returns:
+        The number of bytes written.
+
+    Raises:
+        FileTooLargeError: if the body is larger than the provided max_size.
+    """
+    loop = asyncio.get_running_loop()
+    tmp_path = f"{os.fspath(path)}.part"
+    size = 0
+    try:
+        file = await loop.run_in_executor(None, partial(open, tmp_path, "wb"))
+        try:
+            async for chunk in iter_response_chunks(resp, max_size=max_size, progress=progress):
+                await loop.run_in_executor(None, file.write, chunk)
+                size += len(chunk)
+        finally:
+            await loop.run_in_executor(None, file.close)
+        await loop.run_in_executor(None, os.replace, tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except FileNotFoundError:
+            pass
+        raise
+    log.info(f"Successfully wrote {size} bytes of file download response to {path}")
+    return size
+
+
+__all__ = [
+    "AsyncBody",
+    "FileTooLargeError",
+    "ProgressCallback",
+    "async_iter_bytes",
+    "iter_response_chunks",
+    "read_response_chunks",
+    "write_response_to_file",
+]
@@ -0,0 +1,111 @@
+# Copyright (c) 2026 Tulir Asokan
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+from __future__ import annotations
+
+from typing import AsyncIterator
+import os
+
+from aiohttp import web
+from aiohttp.test_utils import TestClient, TestServer
+import pytest
+
+from .async_body import (
+    FileTooLargeError,
+    iter_response_chunks,
+    read_response_chunks,
+    write_response_to_file,
+)
+
+DATA = os.urandom(300 * 1024)
+
+
+async def fixed_length(_: web.Request) -> web.Response:
+    return web.Response(body=DATA)
+
+
+async def chunked(req: web.Request) -> web.StreamResponse:
+    # Chunked responses don't have a Content-Length, so the limit is only enforced while reading
+    resp = web.StreamResponse()
+    resp.enable_chunked_encoding()
+    await resp.prepare(req)
+    for i in range(0, len(DATA), 100 * 1024):
+        await resp.write(DATA[i : i + 100 * 1024])
+    await resp.write_eof()
+    return resp
+
+
+@pytest.fixture
+async def client() -> AsyncIterator[TestClient]:
+    app = web.Application()
+    app.router.add_get("/fixed", fixed_length)
+    app.router.add_get("/chunked", chunked)
+    async with TestClient(TestServer(app)) as client:
+        yield client
+
+
+@pytest.mark.parametrize("path", ["/fixed", "/chunked"])
+@pytest.mark.parametrize("max_size", [None, 0, len(DATA)])
+async def test_iter_response_chunks(client: TestClient, path: str, max_size: int | None) -> None:
+    progress = []
+    resp = await client.get(path)
+    chunks = [
+        chunk
+        async for chunk in iter_response_chunks(
+            resp,
+            max_size=max_size,
+            progress=lambda read, total: progress.append((read, total)),
+            chunk_size=64 * 1024,
+        )
+    ]
+    assert b"".join(chunks) == DATA
+    assert all(len(chunk) <= 64 * 1024 for chunk in chunks)
+    assert [read for read, _ in progress] == [
+        sum(len(chunk) for chunk in chunks[: i + 1]) for i in range(len(chunks))
+    ]
+    expected_total = len(DATA) if path == "/fixed" else None
+    assert all(total == expected_total for _, total in progress)
+
+
+@pytest.mark.parametrize("path", ["/fixed", "/chunked"])
+async def test_iter_response_chunks_too_large(client: TestClient, path: str) -> None:
+    resp = await client.get(path)
+    with pytest.raises(FileTooLargeError):
+        async for _ in iter_response_chunks(resp, max_size=len(DATA) - 1):
+            pass
+
+
+@pytest.mark.parametrize("path", ["/fixed", "/chunked"])
+@pytest.mark.parametrize("max_size", [None, 0, len(DATA)])
+async def test_read_response_chunks(client: TestClient, path: str, max_size: int | None) -> None:
+    resp = await client.get(path)
+    assert await read_response_chunks(resp, max_size) == DATA
+
+
+@pytest.mark.parametrize("path", ["/fixed", "/chunked"])
+async def test_read_response_chunks_too_large(client: TestClient, path: str) -> None:
+    resp = await client.get(path)
+    with pytest.raises(FileTooLargeError):
+        await read_response_chunks(resp, len(DATA) - 1)
+
+
+async def test_write_response_to_file(client: TestClient, tmp_path) -> None:
+    path = tmp_path / "file.bin"
+    resp = await client.get("/chunked")
+    assert await write_response_to_file(resp, path) == len(DATA)
+    assert path.read_bytes() == DATA
+    assert os.listdir(tmp_path) == ["file.bin"]
+
+
+async def test_write_response_to_file_keeps_old_file_on_error(
+    client: TestClient, tmp_path
+) -> None:
+    path = tmp_path / "file.bin"
+    path.write_bytes(b"previous")
+    resp = await client.get("/chunked")
+    with pytest.raises(FileTooLargeError):
+        await write_response_to_file(resp, path, max_size=len(DATA) // 2)
+    assert path.read_bytes() == b"previous"
+    assert os.listdir(tmp_path) == ["file.bin"]
@@ -9,6 +9,7 @@ from typing import Any, AsyncContextManager
 from contextlib import asynccontextmanager
 from contextvars import ContextVar
 import asyncio
+import functools
 import logging
 import os
 import re
@@ -18,13 +19,19 @@ from yarl import URL
 import aiosqlite
 
 from .connection import LoggingConnection
-from .database import Database
+from .database import Database, conn_var
 from .scheme import Scheme
 from .upgrade import UpgradeTable
 
 POSITIONAL_PARAM_PATTERN = re.compile(r"\$(\d+)")
 
 
+@functools.lru_cache(maxsize=1024)
+def translate_query(query: str) -> str:
+    """Convert Postgres-style ``$1`` placeholders into SQLite-style ``?1`` placeholders."""
+    return POSITIONAL_PARAM_PATTERN.sub(r"?\1", query)
+
+
 in_transaction = ContextVar("in_transaction", default=False)
 
 
@@ -55,8 +62,7 @@ class TxnConnection(aiosqlite.Connection):
             in_transaction.reset(token)
 
     def __execute(self, query: str, *args: Any):
-        query = POSITIONAL_PARAM_PATTERN.sub(r"?\1", query)
-        return super().execute(query, args)
+        return super().execute(translate_query(query), args)
 
     async def execute(
         self, query: str, *args: Any, timeout: float | None = None
@@ -66,14 +72,14 @@ class TxnConnection(aiosqlite.Connection):
     async def executemany(
         self, query: str, *args: Any, timeout: float | None = None
     ) -> aiosqlite.Cursor:
-        query = POSITIONAL_PARAM_PATTERN.sub(r"?\1", query)
-        return await super().executemany(query, *args)
+        return await super().executemany(translate_query(query), *args)
 
     async def fetch(
         self, query: str, *args: Any, timeout: float | None = None
     ) -> list[sqlite3.Row]:
-        async with self.__execute(query, *args) as cursor:
-            return list(await cursor.fetchall())
+        # execute_fetchall runs the query and reads the rows in a single call to the worker
+        # thread, instead of separate calls for executing, fetching and closing the cursor.
+        return await self.execute_fetchall(translate_query(query), args)
 
     async def fetchrow(
         self, query: str, *args: Any, timeout: float | None = None
@@ -94,8 +100,10 @@ class SQLiteDatabase(Database):
     scheme = Scheme.SQLITE
     _parent: SQLiteDatabase | None
     _pool: asyncio.Queue[TxnConnection]
+    _read_pool: asyncio.Queue[TxnConnection] | None
     _stopped: bool
     _conns: int
+    _read_conns: int
     _init_commands: list[str]
 
     def __init__(
@@ -117,11 +125,27 @@ class SQLiteDatabase(Database):
         )
         self._parent = None
         self._path = url.path
-        self._pool = asyncio.Queue(self._db_args.pop("min_size", 1))
+        pool_size = self._db_args.pop("min_size", 1)
         self._db_args.pop("max_size", None)
+        # If read connections are enabled, all writes go through a single connection and
+        # fetches outside transactions are spread across the read-only connections.
+        read_conns = self._db_args.pop("read_connections", 0)
+        if read_conns > 0 and self._path == ":memory:":
+            self.log.warning("Read connections are not supported with in-memory databases")
+            read_conns = 0
+        if read_conns > 0:
+            pool_size = 1
+            self._read_pool = asyncio.Queue(read_conns)
+        else:
+            self._read_pool = None
+        self._pool = asyncio.Queue(pool_size)
         self._stopped = False
         self._conns = 0
+        self._read_conns = 0
         self._init_commands = self._add_missing_pragmas(self._db_args.pop("init_commands", []))
+        # sqlite3 caches prepared statements per connection, the default size of 128 is a bit
+        # small for bridges that use the crypto and state stores on the same database.
+        self._db_args.setdefault("cached_statements", 256)
 
     @staticmethod
     def _add_missing_pragmas(init_commands: list[str]) -> list[str]:
@@ -170,18 +194,26 @@ class SQLiteDatabase(Database):
         elif not os.access(os.path.dirname(os.path.abspath(self._path)), os.W_OK):
             self.log.warning("Database file doesn't exist and directory doesn't seem writable")
         for _ in range(self._pool.maxsize):
-            conn = await TxnConnection(self._path, **self._db_args)
-            if self._init_commands:
-                cur = await conn.cursor()
-                for command in self._init_commands:
-                    self.log.trace("Executing init command: %s", command)
-                    await cur.execute(command)
-                await conn.commit()
-            conn.row_factory = sqlite3.Row
-            self._pool.put_nowait(conn)
+            self._pool.put_nowait(await self._connect(self._init_commands))
             self._conns += 1
+        if self._read_pool:
+            read_init_commands = [*self._init_commands, "PRAGMA query_only = ON"]
+            for _ in range(self._read_pool.maxsize):
+                self._read_pool.put_nowait(await self._connect(read_init_commands))
+                self._read_conns += 1
         await super().start()
 
+    async def _connect(self, init_commands: list[str]) -> TxnConnection:
+        conn = await TxnConnection(self._path, **self._db_args)
+        if init_commands:
+            cur = await conn.cursor()
+            for command in init_commands:
+                self.log.trace("Executing init command: %s", command)
+                await cur.execute(command)
+            await conn.commit()
+        conn.row_factory = sqlite3.Row
+        return conn
+
     async def stop(self) -> None:
         if self._parent:
             return
@@ -190,6 +222,10 @@ class SQLiteDatabase(Database):
             conn = await self._pool.get()
             self._conns -= 1
             await conn.close()
+        while self._read_conns > 0:
+            conn = await self._read_pool.get()
+            self._read_conns -= 1
+            await conn.close()
 
     def acquire_direct(self) -> AsyncContextManager[LoggingConnection]:
         if self._parent:
@@ -206,6 +242,24 @@ class SQLiteDatabase(Database):
         finally:
             self._pool.put_nowait(conn)
 
+    def acquire_read(self) -> AsyncContextManager[LoggingConnection]:
+        if self._parent:
+            return self._parent.acquire_read()
+        elif not self._read_pool or conn_var.get(None) is not None:
+            # Queries inside transactions must stay on the same connection
+            return self.acquire()
+        return self._acquire_read()
+
+    @asynccontextmanager
+    async def _acquire_read(self) -> LoggingConnection:
+        if self._stopped:
+            raise RuntimeError("database pool has been stopped")
+        conn = await self._read_pool.get()
+        try:
+            yield LoggingConnection(self.scheme, conn, self.log)
+        finally:
+            self._read_pool.put_nowait(conn)
+
 
 Database.schemes["sqlite"] = SQLiteDatabase
 Database.schemes["sqlite3"] = SQLiteDatabase
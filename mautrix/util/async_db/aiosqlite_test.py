@@ -0,0 +1,78 @@
+# Copyright (c) 2026 Tulir Asokan
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+from __future__ import annotations
+
+from typing import AsyncIterator
+import pathlib
+
+import pytest
+
+from .aiosqlite import translate_query
+from .database import Database
+
+
+@pytest.fixture
+async def db(tmp_path: pathlib.Path) -> AsyncIterator[Database]:
+    db = Database.create(f"sqlite:{tmp_path / 'test.db'}")
+    await db.start()
+    await db.execute("CREATE TABLE test (key TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+    await db.executemany(
+        "INSERT INTO test (key, value) VALUES ($1, $2)", [(f"key{i}", i) for i in range(100)]
+    )
+    yield db
+    await db.stop()
+
+
+def test_translate_query() -> None:
+    assert translate_query("SELECT 1") == "SELECT 1"
+    assert (
+        translate_query("SELECT value FROM test WHERE key=$1 OR value=$12 OR key=$1")
+        == "SELECT value FROM test WHERE key=?1 OR value=?12 OR key=?1"
+    )
+
+
+def test_translate_query_cached() -> None:
+    translate_query.cache_clear()
+    query = "SELECT value FROM test WHERE key=$1"
+    first = translate_query(query)
+    assert translate_query(query) is first
+    info = translate_query.cache_info()
+    assert (info.hits, info.misses) == (1, 1)
+
+
+async def test_fetch(db: Database) -> None:
+    rows = await db.fetch("SELECT key, value FROM test WHERE value>=$1 ORDER BY value", 95)
+    assert [(row["key"], row["value"]) for row in rows] == [(f"key{i}", i) for i in range(95, 100)]
+    assert await db.fetch("SELECT key FROM test WHERE value<$1", 0) == []
+
+
+async def test_fetchrow(db: Database) -> None:
+    row = await db.fetchrow("SELECT key, value FROM test WHERE key=$1", "key5")
+    assert (row["key"], row["value"]) == ("key5", 5)
+    # Only the first row is returned even if there are more
+    row = await db.fetchrow("SELECT key FROM test ORDER BY value DESC")
+    assert row["key"] == "key99"
+    assert await db.fetchrow("SELECT key FROM test WHERE key=$1", "missing") is None
+
+
+async def test_fetchval(db: Database) -> None:
+    assert await db.fetchval("SELECT value FROM test WHERE key=$1", "key7") == 7
+    assert await db.fetchval("SELECT key, value FROM test WHERE key=$1", "key7", column=1) == 7
+    assert await db.fetchval("SELECT value FROM test WHERE key=$1", "missing") is None
+
+
+async def test_fetch_reused_param(db: Database) -> None:
+    rows = await db.fetch("SELECT key FROM test WHERE value=$1 OR value=$1+$2", 1, 10)
+    assert sorted(row["key"] for row in rows) == ["key1", "key11"]
+
+
+async def test_fetch_in_transaction(db: Database) -> None:
+    async with db.acquire() as conn, conn.transaction():
+        await conn.execute("UPDATE test SET value=$1 WHERE key=$2", -1, "key0")
+        assert await conn.fetchval("SELECT value FROM test WHERE key=$1", "key0") == -1
+        rows = await conn.fetch("SELECT key FROM test WHERE value<$1", 0)
+        assert [row["key"] for row in rows] == ["key0"]
+    assert await db.fetchval("SELECT value FROM test WHERE key=$1", "key0") == -1
@@ -28,6 +28,13 @@ if __optional_imports__:
 conn_var: ContextVar[LoggingConnection | None] = ContextVar("db_connection", default=None)
 
 
+def _is_plain_select(query: str) -> bool:
+    # Only plain SELECTs are safe to run on read-only connections. Anything else, including
+    # INSERT/UPDATE/DELETE ... RETURNING fetched through fetch*, must go to the writer.
+    query = query.lstrip().lower()
+    return query.startswith("select") and "returning" not in query
+
+
 class Database(ABC):
     schemes: dict[str, Type[Database]] = {}
     log: TraceLogger
@@ -150,6 +157,19 @@ class Database(ABC):
             finally:
                 conn_var.reset(token)
 
+    def acquire_read(self) -> AsyncContextManager[LoggingConnection]:
+        """
+        Acquire a connection for read-only queries. By default, this is the same as
+        :meth:`acquire`, but implementations may route reads to separate connections.
+
+        The generic ``fetch*`` methods only use this for plain ``SELECT`` queries, so that
+        writes which fetch ``RETURNING`` rows stay on the writer connection.
+        """
+        return self.acquire()
+
+    def _acquire_for(self, query: str) -> AsyncContextManager[LoggingConnection]:
+        return self.acquire_read() if _is_plain_select(query) else self.acquire()
+
     async def execute(self, query: str, *args: Any, timeout: float | None = None) -> str | Cursor:
         async with self.acquire() as conn:
             return await conn.execute(query, *args, timeout=timeout)
@@ -161,21 +181,21 @@ class Database(ABC):
             return await conn.executemany(query, *args, timeout=timeout)
 
     async def fetch(self, query: str, *args: Any, timeout: float | None = None) -> list[Record]:
-        async with self.acquire() as conn:
+        async with self._acquire_for(query) as conn:
             return await conn.fetch(query, *args, timeout=timeout)
 
     async def fetchval(
         self, query: str, *args: Any, column: int = 0, timeout: float | None = None
     ) -> Any:
-        async with self.acquire() as conn:
+        async with self._acquire_for(query) as conn:
             return await conn.fetchval(query, *args, column=column, timeout=timeout)
 
     async def fetchrow(
         self, query: str, *args: Any, timeout: float | None = None
     ) -> Record | None:
-        async with self.acquire() as conn:
+        async with self._acquire_for(query) as conn:
             return await conn.fetchrow(query, *args, timeout=timeout)
 
     async def table_exists(self, name: str) -> bool:
-        async with self.acquire() as conn:
+        async with self.acquire_read() as conn:
             return await conn.table_exists(name)
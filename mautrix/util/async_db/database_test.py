@@ -0,0 +1,47 @@
+# Copyright (c) 2022 Tulir Asokan
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+from __future__ import annotations
+
+from typing import AsyncIterator
+import pathlib
+
+import pytest
+
+from .database import Database, _is_plain_select
+
+
+@pytest.fixture
+async def read_pool_db(tmp_path: pathlib.Path) -> AsyncIterator[Database]:
+    db = Database.create(f"sqlite:{tmp_path / 'test.db'}", db_args={"read_connections": 2})
+    await db.start()
+    await db.execute("CREATE TABLE test (key TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+    yield db
+    await db.stop()
+
+
+def test_is_plain_select() -> None:
+    assert _is_plain_select("SELECT 1")
+    assert _is_plain_select("\n    select value FROM test WHERE key=$1")
+    assert not _is_plain_select("INSERT INTO test (key, value) VALUES ($1, $2) RETURNING value")
+    assert not _is_plain_select("UPDATE test SET value=1 RETURNING key")
+    assert not _is_plain_select("WITH x AS (SELECT 1) DELETE FROM test RETURNING key")
+
+
+async def test_returning_with_read_connections(read_pool_db: Database) -> None:
+    value = await read_pool_db.fetchval(
+        "INSERT INTO test (key, value) VALUES ($1, $2) "
+        "ON CONFLICT (key) DO UPDATE SET value=excluded.value RETURNING value",
+        "a",
+        1,
+    )
+    assert value == 1
+    row = await read_pool_db.fetchrow(
+        "UPDATE test SET value=value+1 WHERE key=$1 RETURNING value", "a"
+    )
+    assert row["value"] == 2
+    rows = await read_pool_db.fetch("DELETE FROM test WHERE key=$1 RETURNING key", "a")
+    assert [r["key"] for r in rows] == ["a"]
+    assert await read_pool_db.fetchval("SELECT COUNT(*) FROM test") == 0
@@ -22,7 +22,7 @@ def async_getter_lock(fn: Func) -> Func:
     A utility decorator for locking async getters that have caches
     (preventing race conditions between cache check and e.g. async database actions).
 
-    The class must have an ```_async_get_locks`` defaultdict that contains :class:`asyncio.Lock`s
+    The class must have an ``_async_get_locks`` :class:`mautrix.util.keyed_lock.KeyedLock`
     (see example for exact definition). Non-cache-affecting arguments should be only passed as
     keyword args.
 
@@ -33,10 +33,9 @@ def async_getter_lock(fn: Func) -> Func:
         The decorated function.
 
     Examples:
-        >>> import asyncio
-        >>> from collections import defaultdict
+        >>> from mautrix.util.keyed_lock import KeyedLock
         >>> class User:
-        ...   _async_get_locks: dict[Any, asyncio.Lock] = defaultdict(lambda: asyncio.Lock())
+        ...   _async_get_locks: KeyedLock[Any] = KeyedLock()
         ...   db: Any
         ...   cache: dict[str, User]
         ...   @classmethod
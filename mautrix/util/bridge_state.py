@@ -4,6 +4,7 @@
 # License, v. 2.0. If a copy of the MPL was not distributed with this
 # file, You can obtain one at http://mozilla.org/MPL/2.0/.
 from typing import Any, ClassVar, Dict, Optional
+from contextlib import nullcontext
 import logging
 import time
 
@@ -109,14 +110,21 @@ class BridgeState(SerializableAttrs):
         # If the previous state is recent, drop this one
         return prev_state.timestamp + prev_state.ttl > self.timestamp
 
-    async def send(self, url: str, token: str, log: logging.Logger, log_sent: bool = True) -> bool:
+    async def send(
+        self,
+        url: str,
+        token: str,
+        log: logging.Logger,
+        log_sent: bool = True,
+        session: Optional[aiohttp.ClientSession] = None,
+    ) -> bool:
         if not url:
             return True
         self.send_attempts_ += 1
         headers = {"Authorization": f"Bearer {token}", "User-Agent": HTTPAPI.default_ua}
         try:
             async with (
-                aiohttp.ClientSession() as sess,
+                aiohttp.ClientSession() if session is None else nullcontext(session) as sess,
                 sess.post(url, json=self.serialize(), headers=headers) as resp,
             ):
                 if not 200 <= resp.status < 300:
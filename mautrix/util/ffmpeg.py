@@ -6,6 +6,7 @@
 from __future__ import annotations
 
 from typing import Any, Iterable
+from collections import deque
 from pathlib import Path
 import asyncio
 import json
@@ -50,6 +51,127 @@ ffprobe_default_params = (
     "-show_streams",
 )
 
+# Container formats that ffmpeg can fully write to a non-seekable output, keyed by extension.
+# Anything else is written to a file, because ffmpeg seeks back at the end to write things like
+# the mp4 moov atom, the matroska duration and cues, or the mp3 Xing/LAME header.
+pipe_output_formats = {
+    ".ogg": "ogg",
+    ".oga": "ogg",
+    ".opus": "opus",
+    ".gif": "gif",
+}
+# Input mime types that can't be reliably read from a pipe, because the index may be at the end.
+unpipeable_input_mimes = {
+    "application/mp4",
+    "audio/3gpp",
+    "audio/mp4",
+    "audio/x-m4a",
+    "video/3gpp",
+    "video/mp4",
+    "video/quicktime",
+    "video/x-m4v",
+}
+
+
+class _ProcessLimiter:
+    """
+    A semaphore whose limit can be changed while it's in use. Lowering the limit doesn't affect
+    processes that are already running, but new ones will wait until enough of them have finished
+    that the number of running processes is below the new limit.
+    """
+
+    limit: int
+    active: int
+    _waiters: deque[asyncio.Future]
+
+    def __init__(self, limit: int) -> None:
+        self.limit = limit
+        self.active = 0
+        self._waiters = deque()
+
+    def set_limit(self, limit: int) -> None:
+        self.limit = limit
+        self._wake_waiters()
+
+    def _wake_waiters(self) -> None:
+        free = self.limit - self.active
+        while free > 0 and self._waiters:
+            fut = self._waiters.popleft()
+            if not fut.done():
+                fut.set_result(None)
+                free -= 1
+
+    async def __aenter__(self) -> None:
+        while self.active >= self.limit:
+            fut = asyncio.get_running_loop().create_future()
+            self._waiters.append(fut)
+            try:
+                await fut
+            except asyncio.CancelledError:
+                if fut.done() and not fut.cancelled():
+                    # We were woken up but won't take the slot, so pass it on
+                    self._wake_waiters()
+                raise
+        self.active += 1
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb) -> None:
+        self.active -= 1
+        self._wake_waiters()
+
+
+_process_limiter = _ProcessLimiter(os.cpu_count() or 4)
+
+
+def set_max_processes(limit: int) -> None:
+    """
+    Change the maximum number of ffmpeg and ffprobe processes that can run at the same time.
+    Conversions over the limit will wait for a previous one to finish.
+    The default limit is the number of CPUs.
+
+    If the limit is lowered while more processes than the new limit are running, the running
+    processes are allowed to finish, but new ones won't be started until there's room for them.
+
+    Args:
+        limit: The maximum number of concurrent processes.
+    """
+    if limit < 1:
+        raise ValueError("limit must be at least 1")
+    _process_limiter.set_limit(limit)
+
+
+async def _run(
+    name: str,
+    path: str,
+    args: Iterable[str],
+    input_data: bytes | None = None,
+    logger: logging.Logger | None = None,
+) -> bytes:
+    async with _process_limiter:
+        proc = await asyncio.create_subprocess_exec(
+            path,
+            *args,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            stdin=(
+                asyncio.subprocess.PIPE if input_data is not None else asyncio.subprocess.DEVNULL
+            ),
+        )
+        stdout, stderr = await proc.communicate(input_data)
+    if proc.returncode != 0:
+        err_text = stderr.decode("utf-8") if stderr else f"unknown ({proc.returncode})"
+        raise ConverterError(f"{name} error: {err_text}")
+    elif stderr and logger:
+        logger.warning(f"{name} warning: {stderr.decode('utf-8')}")
+    return stdout
+
+
+def _guess_mime(data: bytes, input_mime: str | None) -> str:
+    if input_mime is None:
+        if magic is None:
+            raise ValueError("input_mime was not specified and magic is not installed")
+        input_mime = magic.mimetype(data)
+    return input_mime
+
 
 async def probe_path(
     input_file: os.PathLike[str] | str,
@@ -70,21 +192,9 @@ async def probe_path(
     if ffprobe_path is None:
         raise NotInstalledError()
 
-    input_file = Path(input_file)
-    proc = await asyncio.create_subprocess_exec(
-        ffprobe_path,
-        *ffprobe_default_params,
-        str(input_file),
-        stdout=asyncio.subprocess.PIPE,
-        stderr=asyncio.subprocess.PIPE,
-        stdin=asyncio.subprocess.PIPE,
+    stdout = await _run(
+        "ffprobe", ffprobe_path, (*ffprobe_default_params, str(input_file)), logger=logger
     )
-    stdout, stderr = await proc.communicate()
-    if proc.returncode != 0:
-        err_text = stderr.decode("utf-8") if stderr else f"unknown ({proc.returncode})"
-        raise ConverterError(f"ffprobe error: {err_text}")
-    elif stderr and logger:
-        logger.warning(f"ffprobe warning: {stderr.decode('utf-8')}")
     return json.loads(stdout)
 
 
@@ -92,6 +202,7 @@ async def probe_bytes(
     data: bytes,
     input_mime: str | None = None,
     logger: logging.Logger | None = None,
+    use_pipes: bool = False,
 ) -> Any:
     """
     Probe media file data using ffprobe.
@@ -99,6 +210,10 @@ async def probe_bytes(
     Args:
         data: The bytes of the file to probe.
         input_mime: The mime type of the input data. If not specified, will be guessed using magic.
+        use_pipes: Whether the data should be passed to ffprobe through stdin instead of a
+                   temporary file. ffprobe can't seek in a pipe, so durations of some formats
+                   (e.g. ogg and mp3) will be missing or inaccurate when this is enabled.
+                   Formats in :data:`unpipeable_input_mimes` always use a file.
 
     Returns:
         A Python object containing the parsed JSON response from ffprobe
@@ -109,10 +224,16 @@ async def probe_bytes(
     if ffprobe_path is None:
         raise NotInstalledError()
 
-    if input_mime is None:
-        if magic is None:
-            raise ValueError("input_mime was not specified and magic is not installed")
-        input_mime = magic.mimetype(data)
+    input_mime = _guess_mime(data, input_mime)
+    if use_pipes and input_mime not in unpipeable_input_mimes:
+        stdout = await _run(
+            "ffprobe",
+            ffprobe_path,
+            (*ffprobe_default_params, "pipe:0"),
+            input_data=data,
+            logger=logger,
+        )
+        return json.loads(stdout)
     input_extension = mimetypes.guess_extension(input_mime)
     with tempfile.TemporaryDirectory(prefix="mautrix_ffmpeg_") as tmpdir:
         input_file = Path(tmpdir) / f"data{input_extension}"
@@ -165,24 +286,19 @@ async def convert_path(
         output_file = Path(output_file)
         output_file = output_file.parent / f"{output_file.stem}-new{output_extension}"
 
-    proc = await asyncio.create_subprocess_exec(
+    stdout = await _run(
+        "ffmpeg",
         ffmpeg_path,
-        *ffmpeg_default_params,
-        *(input_args or ()),
-        "-i",
-        str(input_file),
-        *(output_args or ()),
-        str(output_file),
-        stdout=asyncio.subprocess.PIPE,
-        stderr=asyncio.subprocess.PIPE,
-        stdin=asyncio.subprocess.PIPE,
+        (
+            *ffmpeg_default_params,
+            *(input_args or ()),
+            "-i",
+            str(input_file),
+            *(output_args or ()),
+            str(output_file),
+        ),
+        logger=logger,
     )
-    stdout, stderr = await proc.communicate()
-    if proc.returncode != 0:
-        err_text = stderr.decode("utf-8") if stderr else f"unknown ({proc.returncode})"
-        raise ConverterError(f"ffmpeg error: {err_text}")
-    elif stderr and logger:
-        logger.warning(f"ffmpeg warning: {stderr.decode('utf-8')}")
     if remove_input and isinstance(input_file, Path):
         input_file.unlink(missing_ok=True)
     return stdout if output_file == "-" else output_file
@@ -195,6 +311,7 @@ async def convert_bytes(
     output_args: Iterable[str] | None = None,
     input_mime: str | None = None,
     logger: logging.Logger | None = None,
+    use_pipes: bool = True,
 ) -> bytes:
     """
     Convert media file data using ffmpeg.
@@ -205,6 +322,10 @@ async def convert_bytes(
         input_args: Arguments to tell ffmpeg how to parse the input file.
         output_args: Arguments to tell ffmpeg how to convert the file to reach the wanted output.
         input_mime: The mime type of the input data. If not specified, will be guessed using magic.
+        use_pipes: Whether the data should be passed through ffmpeg's stdin and stdout instead of
+                   temporary files. Temporary files are still used for the input if the mime type
+                   is in :data:`unpipeable_input_mimes`, and for the output if the extension is
+                   not in :data:`pipe_output_formats`.
 
     Returns:
         The converted file as bytes.
@@ -215,22 +336,56 @@ async def convert_bytes(
     if ffmpeg_path is None:
         raise NotInstalledError()
 
-    if input_mime is None:
-        if magic is None:
-            raise ValueError("input_mime was not specified and magic is not installed")
-        input_mime = magic.mimetype(data)
-    input_extension = mimetypes.guess_extension(input_mime)
+    input_mime = _guess_mime(data, input_mime)
+    pipe_input = use_pipes and input_mime not in unpipeable_input_mimes
+    output_format = pipe_output_formats.get(output_extension) if use_pipes else None
+    if pipe_input and output_format:
+        return await _run(
+            "ffmpeg",
+            ffmpeg_path,
+            (
+                *ffmpeg_default_params,
+                *(input_args or ()),
+                "-i",
+                "pipe:0",
+                "-f",
+                output_format,
+                *(output_args or ()),
+                "pipe:1",
+            ),
+            input_data=data,
+            logger=logger,
+        )
+
     with tempfile.TemporaryDirectory(prefix="mautrix_ffmpeg_") as tmpdir:
-        input_file = Path(tmpdir) / f"data{input_extension}"
-        with open(input_file, "wb") as file:
-            file.write(data)
-        output_file = await convert_path(
-            input_file=input_file,
-            output_extension=output_extension,
-            input_args=input_args,
-            output_args=output_args,
+        input_file = Path(tmpdir) / f"data{mimetypes.guess_extension(input_mime)}"
+        if pipe_input:
+            input_file, input_data = "pipe:0", data
+        else:
+            with open(input_file, "wb") as file:
+                file.write(data)
+            input_data = None
+        if output_format:
+            output_file = "pipe:1"
+            output_args = ("-f", output_format, *(output_args or ()))
+        else:
+            output_file = Path(tmpdir) / f"output{output_extension}"
+        stdout = await _run(
+            "ffmpeg",
+            ffmpeg_path,
+            (
+                *ffmpeg_default_params,
+                *(input_args or ()),
+                "-i",
+                str(input_file),
+                *(output_args or ()),
+                str(output_file),
+            ),
+            input_data=input_data,
             logger=logger,
         )
+        if output_format:
+            return stdout
         with open(output_file, "rb") as file:
             return file.read()
 
@@ -240,6 +395,9 @@ __all__ = [
     "ffmpeg_default_params",
     "ConverterError",
     "NotInstalledError",
+    "pipe_output_formats",
+    "unpipeable_input_mimes",
+    "set_max_processes",
     "convert_bytes",
     "convert_path",
     "probe_bytes",
@@ -0,0 +1,160 @@
+# Copyright (c) 2026 Tulir Asokan
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+from __future__ import annotations
+
+from typing import Any
+import asyncio
+import json
+import os
+
+import pytest
+
+from . import ffmpeg
+
+
+class FakeRun:
+    def __init__(self) -> None:
+        self.calls: list[dict[str, Any]] = []
+
+    async def __call__(
+        self, name: str, path: str, args: tuple[str, ...], input_data: bytes | None = None, **_
+    ) -> bytes:
+        input_path = args[-1]
+        self.calls.append(
+            {
+                "input": input_path,
+                "input_data": input_data,
+                "file_data": None if input_path == "pipe:0" else open(input_path, "rb").read(),
+            }
+        )
+        return json.dumps({"format": {"duration": "1.0"}}).encode("utf-8")
+
+
+@pytest.fixture
+def fake_run(monkeypatch) -> FakeRun:
+    fake = FakeRun()
+    monkeypatch.setattr(ffmpeg, "ffprobe_path", "/usr/bin/ffprobe")
+    monkeypatch.setattr(ffmpeg, "_run", fake)
+    return fake
+
+
+async def test_probe_bytes_uses_file_by_default(fake_run: FakeRun) -> None:
+    data = b"OggS fake audio"
+    assert await ffmpeg.probe_bytes(data, "audio/ogg") == {"format": {"duration": "1.0"}}
+    [call] = fake_run.calls
+    assert call["input"].endswith(".oga") or call["input"].endswith(".ogg")
+    assert call["input_data"] is None
+    assert call["file_data"] == data
+    # The temporary file is deleted after probing
+    assert not os.path.exists(call["input"])
+
+
+async def test_probe_bytes_pipes_when_requested(fake_run: FakeRun) -> None:
+    data = b"OggS fake audio"
+    await ffmpeg.probe_bytes(data, "audio/ogg", use_pipes=True)
+    [call] = fake_run.calls
+    assert call["input"] == "pipe:0"
+    assert call["input_data"] == data
+
+
+async def test_probe_bytes_never_pipes_unpipeable(fake_run: FakeRun) -> None:
+    await ffmpeg.probe_bytes(b"fake mp4", "video/mp4", use_pipes=True)
+    [call] = fake_run.calls
+    assert call["input"].endswith(".mp4")
+    assert call["input_data"] is None
+
+
+async def test_process_limiter() -> None:
+    limiter = ffmpeg._ProcessLimiter(2)
+    running = 0
+    max_running = 0
+
+    async def process() -> None:
+        nonlocal running, max_running
+        async with limiter:
+            running += 1
+            max_running = max(max_running, running)
+            await asyncio.sleep(0.01)
+            running -= 1
+
+    await asyncio.gather(*(process() for _ in range(10)))
+    assert max_running == 2
+    assert limiter.active == 0
+
+
+async def test_process_limiter_lowered_while_running() -> None:
+    limiter = ffmpeg._ProcessLimiter(3)
+    release = asyncio.Event()
+    started = []
+
+    async def process(i: int) -> None:
+        async with limiter:
+            started.append(i)
+            await release.wait()
+
+    tasks = [asyncio.create_task(process(i)) for i in range(3)]
+    await asyncio.sleep(0.01)
+    assert started == [0, 1, 2]
+
+    limiter.set_limit(1)
+    tasks.append(asyncio.create_task(process(3)))
+    await asyncio.sleep(0.01)
+    # The running processes are over the new limit, so the new one has to wait
+    assert started == [0, 1, 2]
+    assert limiter.active == 3
+
+    release.set()
+    await asyncio.wait_for(asyncio.gather(*tasks), 5)
+    assert started == [0, 1, 2, 3]
+    assert limiter.active == 0
+
+
+async def test_process_limiter_raised_wakes_waiters() -> None:
+    limiter = ffmpeg._ProcessLimiter(1)
+    release = asyncio.Event()
+    started = []
+
+    async def process(i: int) -> None:
+        async with limiter:
+            started.append(i)
+            await release.wait()
+
+    tasks = [asyncio.create_task(process(i)) for i in range(3)]
+    await asyncio.sleep(0.01)
+    assert started == [0]
+    limiter.set_limit(3)
+    await asyncio.sleep(0.01)
+    assert started == [0, 1, 2]
+    release.set()
+    await asyncio.wait_for(asyncio.gather(*tasks), 5)
+
+
+async def test_process_limiter_cancelled_waiter() -> None:
+    limiter = ffmpeg._ProcessLimiter(1)
+    release = asyncio.Event()
+    started = []
+
+    async def process(i: int) -> None:
+        async with limiter:
+            started.append(i)
+            await release.wait()
+
+    first = asyncio.create_task(process(0))
+    await asyncio.sleep(0.01)
+    cancelled = asyncio.create_task(process(1))
+    last = asyncio.create_task(process(2))
+    await asyncio.sleep(0.01)
+    cancelled.cancel()
+    release.set()
+    await asyncio.wait_for(asyncio.gather(first, last), 5)
+    assert cancelled.cancelled()
+    assert started == [0, 2]
+    assert limiter.active == 0
+
+
+def test_set_max_processes_rejects_zero() -> None:
+    with pytest.raises(ValueError):
+        ffmpeg.set_max_processes(0)
@@ -0,0 +1,99 @@
+# Copyright (c) 2026 Tulir Asokan
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+"""
+The JSON codec used for encoding and decoding Matrix API requests, appservice transactions,
+stored state and :class:`mautrix.types.Serializable` objects.
+
+By default, the standard library ``json`` module is used. Faster codecs (``orjson`` or
+``ujson``) can be enabled with :func:`set_codec`. They are stricter than the stdlib in some
+cases (e.g. orjson rejects lone surrogates), so decoding falls back to the stdlib when the
+fast codec raises an error, which means one odd event can't fail a whole sync response or
+appservice transaction.
+"""
+
+from __future__ import annotations
+
+from typing import Any, Callable, Literal
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+CodecName = Literal["orjson", "ujson", "json"]
+
+JSONDecodeError = json.JSONDecodeError
+
+codec: CodecName = "json"
+dumps: Callable[[Any], str] = json.dumps
+loads: Callable[[str | bytes], Any] = json.loads
+
+
+def _orjson_dumps(obj: Any) -> str:
+    try:
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS).decode("utf-8")
+    except orjson.JSONEncodeError:
+        # orjson doesn't support some things the stdlib does, like integers over 64 bits
+        return json.dumps(obj)
+
+
+def _orjson_loads(data: str | bytes) -> Any:
+    try:
+        return orjson.loads(data)
+    except orjson.JSONDecodeError:
+        return json.loads(data)
+
+
+def _ujson_dumps(obj: Any) -> str:
+    return ujson.dumps(obj, ensure_ascii=False, escape_forward_slashes=False)
+
+
+def _ujson_loads(data: str | bytes) -> Any:
+    try:
+        return ujson.loads(data)
+    except ujson.JSONDecodeError:
+        # The stdlib either accepts the input or raises the error type callers expect
+        return json.loads(data)
+
+
+def set_codec(name: CodecName | Literal["auto"] = "auto") -> None:
+    """
+    Change the JSON codec used throughout mautrix.
+
+    Note that orjson decodes integers that don't fit in 64 bits as floats rather than failing,
+    so only enable it if such values don't matter to you.
+
+    Args:
+        name: The name of the codec to use, or ``auto`` to use the fastest installed one.
+
+    Raises:
+        ValueError: If the given codec is unknown or not installed.
+    """
+    global codec, dumps, loads
+    if name == "auto":
+        name = "orjson" if orjson else "ujson" if ujson else "json"
+    if name == "orjson":
+        if not orjson:
+            raise ValueError("orjson is not installed")
+        dumps, loads = _orjson_dumps, _orjson_loads
+    elif name == "ujson":
+        if not ujson:
+            raise ValueError("ujson is not installed")
+        dumps, loads = _ujson_dumps, _ujson_loads
+    elif name == "json":
+        dumps, loads = json.dumps, json.loads
+    else:
+        raise ValueError(f"Unknown JSON codec {name}")
+    codec = name
+
+
+__all__ = ["codec", "dumps", "loads", "set_codec", "JSONDecodeError"]
@@ -0,0 +1,53 @@
+# Copyright (c) 2026 Tulir Asokan
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+import pytest
+
+from . import json_codec
+
+codecs = [
+    "json",
+    pytest.param("orjson", marks=pytest.mark.skipif(not json_codec.orjson, reason="no orjson")),
+    pytest.param("ujson", marks=pytest.mark.skipif(not json_codec.ujson, reason="no ujson")),
+]
+
+
+@pytest.fixture(params=codecs)
+def codec(request) -> str:
+    json_codec.set_codec(request.param)
+    yield request.param
+    json_codec.set_codec("json")
+
+
+def test_default_codec() -> None:
+    assert json_codec.codec == "json"
+    assert json_codec.loads is json_codec.json.loads
+
+
+def test_round_trip(codec: str) -> None:
+    data = {"body": "hellö/wörld", "num": 2**70, "nested": [{"a": None, "b": True}]}
+    assert json_codec.codec == codec
+    assert json_codec.loads(json_codec.dumps(data)) == data
+    assert json_codec.loads(json_codec.dumps({1: "int key"})) == {"1": "int key"}
+
+
+def test_decode_error(codec: str) -> None:
+    with pytest.raises(json_codec.JSONDecodeError):
+        json_codec.loads("{not json")
+    with pytest.raises(json_codec.JSONDecodeError):
+        json_codec.loads(b"[1, 2")
+
+
+def test_lone_surrogate(codec: str) -> None:
+    assert json_codec.loads('{"body": "\\ud800"}') == {"body": "\ud800"}
+    assert json_codec.loads(b'["\\udc00"]') == ["\udc00"]
+
+
+def test_big_int(codec: str) -> None:
+    if codec == "orjson":
+        pytest.skip("orjson decodes integers over 64 bits as floats")
+    assert json_codec.loads('{"num": 123456789012345678901234567890}') == {
+        "num": 123456789012345678901234567890
+    }
@@ -0,0 +1,119 @@
+# Copyright (c) 2026 Tulir Asokan
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+from __future__ import annotations
+
+from typing import Generic, Hashable, TypeVar
+import asyncio
+
+KT = TypeVar("KT", bound=Hashable)
+
+
+class _Entry:
+    __slots__ = ("lock", "refs")
+
+    lock: asyncio.Lock
+    refs: int
+
+    def __init__(self) -> None:
+        self.lock = asyncio.Lock()
+        self.refs = 0
+
+
+class _KeyedLockContext(Generic[KT]):
+    __slots__ = ("_table", "_key")
+
+    def __init__(self, table: KeyedLock[KT], key: KT) -> None:
+        self._table = table
+        self._key = key
+
+    async def __aenter__(self) -> None:
+        await self._table.acquire(self._key)
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb) -> None:
+        self._table.release(self._key)
+
+    def locked(self) -> bool:
+        return self._table.locked(self._key)
+
+
+class KeyedLock(Generic[KT]):
+    """
+    A table of :class:`asyncio.Lock`s keyed by arbitrary hashable values.
+
+    Unlike a ``defaultdict(asyncio.Lock)``, locks are reference counted and removed from the
+    table as soon as nobody is holding or waiting for them, so the table only grows with the
+    number of keys that are locked at the same time rather than every key ever locked.
+
+    Examples:
+        >>> locks = KeyedLock()
+        >>> async def handle(room_id: str) -> None:
+        ...     async with locks[room_id]:
+        ...         ...
+    """
+
+    _entries: dict[KT, _Entry]
+
+    def __init__(self) -> None:
+        self._entries = {}
+
+    def __getitem__(self, key: KT) -> _KeyedLockContext[KT]:
+        return _KeyedLockContext(self, key)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: KT) -> bool:
+        return key in self._entries
+
+    def locked(self, key: KT) -> bool:
+        """Check if the lock for the given key is currently held."""
+        try:
+            return self._entries[key].lock.locked()
+        except KeyError:
+            return False
+
+    async def acquire(self, key: KT) -> None:
+        """
+        Acquire the lock for the given key. Prefer using ``async with locks[key]`` instead.
+
+        Args:
+            key: The key to lock.
+        """
+        try:
+            entry = self._entries[key]
+        except KeyError:
+            entry = self._entries[key] = _Entry()
+        entry.refs += 1
+        try:
+            await entry.lock.acquire()
+        except BaseException:
+            self._unref(key, entry)
+            raise
+
+    def release(self, key: KT) -> None:
+        """
+        Release the lock for the given key.
+
+        Args:
+            key: The key to unlock.
+
+        Raises:
+            RuntimeError: If the lock isn't held.
+        """
+        try:
+            entry = self._entries[key]
+        except KeyError:
+            raise RuntimeError("Lock is not acquired") from None
+        entry.lock.release()
+        self._unref(key, entry)
+
+    def _unref(self, key: KT, entry: _Entry) -> None:
+        entry.refs -= 1
+        if entry.refs <= 0:
+            del self._entries[key]
+
+
+__all__ = ["KeyedLock"]
@@ -0,0 +1,54 @@
+# Copyright (c) 2026 Tulir Asokan
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+import asyncio
+
+import pytest
+
+from .keyed_lock import KeyedLock
+
+
+async def test_mutual_exclusion() -> None:
+    locks = KeyedLock()
+    running = 0
+    max_running = 0
+
+    async def worker() -> None:
+        nonlocal running, max_running
+        async with locks["a"]:
+            running += 1
+            max_running = max(max_running, running)
+            await asyncio.sleep(0)
+            running -= 1
+
+    await asyncio.gather(*(worker() for _ in range(5)))
+    assert max_running == 1
+    assert len(locks) == 0
+
+
+async def test_entries_removed() -> None:
+    locks = KeyedLock()
+    async with locks["a"]:
+        assert "a" in locks
+        assert locks.locked("a")
+        async with locks["b"]:
+            assert len(locks) == 2
+        assert "b" not in locks
+    assert len(locks) == 0
+    assert not locks.locked("a")
+
+
+async def test_cancelled_waiter() -> None:
+    locks = KeyedLock()
+    await locks.acquire("a")
+    waiter = asyncio.create_task(locks.acquire("a"))
+    await asyncio.sleep(0)
+    waiter.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await waiter
+    locks.release("a")
+    assert len(locks) == 0
+    with pytest.raises(RuntimeError):
+        locks.release("a")
@@ -0,0 +1,62 @@
+# Copyright (c) 2026 Tulir Asokan
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+from __future__ import annotations
+
+from typing import Any, Generic, TypeVar
+from collections import OrderedDict
+
+KT = TypeVar("KT")
+VT = TypeVar("VT")
+
+_missing = object()
+
+
+class LRUCache(OrderedDict, Generic[KT, VT]):
+    """
+    A dict that holds at most ``max_size`` items. Reading or writing an item marks it as recently
+    used, and the least recently used items are evicted when the cache is full.
+
+    Because reading moves items, the cache must not be indexed while iterating over it.
+
+    Examples:
+        >>> cache = LRUCache(max_size=2)
+        >>> cache["a"] = 1
+        >>> cache["b"] = 2
+        >>> cache["a"]
+        1
+        >>> cache["c"] = 3
+        >>> list(cache.keys())
+        ['a', 'c']
+    """
+
+    max_size: int | None
+    """The maximum number of items to keep. If ``None``, the cache is unbounded."""
+
+    def __init__(self, max_size: int | None = None) -> None:
+        super().__init__()
+        self.max_size = max_size
+
+    def __getitem__(self, key: KT) -> VT:
+        value = super().__getitem__(key)
+        self.move_to_end(key)
+        return value
+
+    def get(self, key: KT, default: Any = None) -> VT | Any:
+        value = super().get(key, _missing)
+        if value is _missing:
+            return default
+        self.move_to_end(key)
+        return value
+
+    def __setitem__(self, key: KT, value: VT) -> None:
+        super().__setitem__(key, value)
+        self.move_to_end(key)
+        if self.max_size is not None:
+            while len(self) > self.max_size:
+                self.popitem(last=False)
+
+
+__all__ = ["LRUCache"]
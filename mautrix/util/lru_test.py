@@ -0,0 +1,27 @@
+# Copyright (c) 2026 Tulir Asokan
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+from .lru import LRUCache
+
+
+def test_evict_least_recently_used() -> None:
+    cache = LRUCache(max_size=3)
+    for key in "abc":
+        cache[key] = key.upper()
+    assert cache["a"] == "A"
+    assert cache.get("b") == "B"
+    cache["d"] = "D"
+    assert list(cache.keys()) == ["a", "b", "d"]
+    assert cache.get("c") is None
+    cache["a"] = "A2"
+    cache["e"] = "E"
+    assert list(cache.items()) == [("d", "D"), ("a", "A2"), ("e", "E")]
+
+
+def test_unbounded() -> None:
+    cache = LRUCache()
+    for i in range(1000):
+        cache[i] = i
+    assert len(cache) == 1000
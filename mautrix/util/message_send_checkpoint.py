@@ -3,7 +3,10 @@
 # This Source Code Form is subject to the terms of the Mozilla Public
 # License, v. 2.0. If a copy of the MPL was not distributed with this
 # file, You can obtain one at http://mozilla.org/MPL/2.0/.
-from typing import Optional
+from typing import Callable, Deque, List, Optional, Set, Tuple
+from collections import deque
+from contextlib import nullcontext
+import asyncio
 import logging
 
 from aiohttp.client import ClientTimeout
@@ -52,13 +55,19 @@ class MessageSendCheckpoint(SerializableAttrs):
     client_type: Optional[str] = None
     client_version: Optional[str] = None
 
-    async def send(self, endpoint: str, as_token: str, log: logging.Logger) -> None:
+    async def send(
+        self,
+        endpoint: str,
+        as_token: str,
+        log: logging.Logger,
+        session: Optional[aiohttp.ClientSession] = None,
+    ) -> None:
         if not endpoint:
             return
         try:
             headers = {"Authorization": f"Bearer {as_token}", "User-Agent": HTTPAPI.default_ua}
             async with (
-                aiohttp.ClientSession() as sess,
+                aiohttp.ClientSession() if session is None else nullcontext(session) as sess,
                 sess.post(
                     endpoint,
                     json={"checkpoints": [self.serialize()]},
@@ -85,6 +94,208 @@ class MessageSendCheckpoint(SerializableAttrs):
             )
 
 
+class MessageSendCheckpointDispatcher:
+    """
+    MessageSendCheckpointDispatcher collects message send checkpoints and sends them to the
+    checkpoint endpoint in batches, instead of making one HTTP request per checkpoint.
+
+    A batch is sent when it reaches ``max_batch_size`` checkpoints or when the oldest queued
+    checkpoint has waited for ``max_delay`` seconds. Failed batches are retried with exponential
+    backoff in the background, so they don't hold up new batches. At most
+    ``max_in_flight_batches`` batches are sent (or retried) at a time, and at most
+    ``max_retrying_batches`` of them can be retries. While all slots are in use, checkpoints wait
+    in the queue, which holds at most ``max_queue_size`` checkpoints: older ones are dropped
+    (and counted in :attr:`dropped_checkpoints`) if the endpoint can't keep up.
+    """
+
+    endpoint: str
+    as_token: str
+    log: logging.Logger
+    max_delay: float
+    max_batch_size: int
+    max_queue_size: int
+    max_retries: int
+    max_retrying_batches: int
+    max_in_flight_batches: int
+    retry_delay: float
+    dropped_checkpoints: int
+
+    _get_session: Optional[Callable[[], Optional[aiohttp.ClientSession]]]
+    _queue: Deque[Tuple[MessageSendCheckpoint, asyncio.Future]]
+    _batch_full: asyncio.Event
+    _send_loop_task: Optional[asyncio.Task]
+    _batch_tasks: Set[asyncio.Task]
+    _retrying_batches: int
+    _stopping: bool
+    _stop_event: asyncio.Event
+
+    def __init__(
+        self,
+        endpoint: str,
+        as_token: str,
+        log: logging.Logger,
+        get_session: Optional[Callable[[], Optional[aiohttp.ClientSession]]] = None,
+        max_delay: float = 0.2,
+        max_batch_size: int = 100,
+        max_queue_size: int = 10000,
+        max_retries: int = 5,
+        max_retrying_batches: int = 10,
+        max_in_flight_batches: int = 20,
+        retry_delay: float = 2,
+    ) -> None:
+        self.endpoint = endpoint
+        self.as_token = as_token
+        self.log = log
+        self.max_delay = max_delay
+        self.max_batch_size = max_batch_size
+        self.max_queue_size = max_queue_size
+        self.max_retries = max_retries
+        self.max_retrying_batches = max_retrying_batches
+        self.max_in_flight_batches = max_in_flight_batches
+        self.retry_delay = retry_delay
+        self.dropped_checkpoints = 0
+        self._get_session = get_session
+        self._queue = deque()
+        self._batch_full = asyncio.Event()
+        self._send_loop_task = None
+        self._batch_tasks = set()
+        self._retrying_batches = 0
+        self._stopping = False
+        self._stop_event = asyncio.Event()
+
+    def queue(self, checkpoint: MessageSendCheckpoint) -> asyncio.Future:
+        """
+        Queue a checkpoint to be sent in the next batch.
+
+        Args:
+            checkpoint: The checkpoint to send.
+
+        Returns:
+            A future that is resolved after the batch containing the checkpoint has been sent
+            (or when sending it has failed permanently).
+        """
+        fut = asyncio.get_running_loop().create_future()
+        if not self.endpoint:
+            fut.set_result(None)
+            return fut
+        self._queue.append((checkpoint, fut))
+        if len(self._queue) > self.max_queue_size:
+            dropped, dropped_fut = self._queue.popleft()
+            dropped_fut.set_result(None)
+            self.dropped_checkpoints += 1
+            self.log.warning(
+                f"Checkpoint queue is full, dropping checkpoint for {dropped.event_id} "
+                f"({dropped.step}/{dropped.status})"
+            )
+        if len(self._queue) >= self.max_batch_size:
+            self._batch_full.set()
+        if not self._send_loop_task:
+            self._send_loop_task = asyncio.create_task(self._send_loop())
+        return fut
+
+    async def send(self, checkpoint: MessageSendCheckpoint) -> None:
+        """Queue a checkpoint and wait until it has been sent."""
+        await self.queue(checkpoint)
+
+    async def stop(self) -> None:
+        """Send all queued checkpoints immediately and wait for them to be sent."""
+        self._stopping = True
+        self._stop_event.set()
+        self._batch_full.set()
+        if self._send_loop_task:
+            await self._send_loop_task
+        if self._batch_tasks:
+            await asyncio.gather(*self._batch_tasks)
+
+    async def _send_loop(self) -> None:
+        try:
+            while self._queue:
+                if not self._stopping and len(self._queue) < self.max_batch_size:
+                    try:
+                        await asyncio.wait_for(self._batch_full.wait(), self.max_delay)
+                    except asyncio.TimeoutError:
+                        pass
+                while len(self._batch_tasks) >= self.max_in_flight_batches:
+                    # Checkpoints keep piling up in the (bounded) queue while waiting for a slot
+                    await asyncio.wait(self._batch_tasks, return_when=asyncio.FIRST_COMPLETED)
+                self._batch_full.clear()
+                batch_size = min(len(self._queue), self.max_batch_size)
+                batch = [self._queue.popleft() for _ in range(batch_size)]
+                # Send the batch in the background, so that retries of a failed batch don't
+                # block the batches queued after it.
+                task = asyncio.create_task(self._send_and_resolve(batch))
+                self._batch_tasks.add(task)
+                task.add_done_callback(self._batch_tasks.discard)
+        finally:
+            self._send_loop_task = None
+
+    async def _send_and_resolve(
+        self, batch: List[Tuple[MessageSendCheckpoint, asyncio.Future]]
+    ) -> None:
+        try:
+            await self._send_batch([checkpoint for checkpoint, _ in batch])
+        finally:
+            for _, fut in batch:
+                if not fut.done():
+                    fut.set_result(None)
+
+    async def _post_batch(self, data: dict) -> Optional[str]:
+        headers = {"Authorization": f"Bearer {self.as_token}", "User-Agent": HTTPAPI.default_ua}
+        session = self._get_session() if self._get_session else None
+        try:
+            async with (
+                aiohttp.ClientSession() if session is None else nullcontext(session) as sess,
+                sess.post(
+                    self.endpoint, json=data, headers=headers, timeout=ClientTimeout(30)
+                ) as resp,
+            ):
+                if 200 <= resp.status < 300:
+                    return None
+                text = await resp.text()
+                text = text.replace("\n", "\\n")
+                return f"unexpected status code {resp.status}: {text}"
+        except Exception as e:
+            return f"{type(e).__name__}: {e}"
+
+    async def _send_batch(self, checkpoints: List[MessageSendCheckpoint]) -> None:
+        data = {"checkpoints": [checkpoint.serialize() for checkpoint in checkpoints]}
+        error = await self._post_batch(data)
+        if error is None:
+            self.log.debug(f"Successfully sent {len(checkpoints)} checkpoints")
+            return
+        elif self._retrying_batches >= self.max_retrying_batches:
+            self.log.warning(
+                f"Failed to send {len(checkpoints)} checkpoints ({error}), "
+                "not retrying as too many batches are already being retried"
+            )
+            return
+        self._retrying_batches += 1
+        try:
+            attempt = 1
+            while error is not None:
+                if attempt > self.max_retries or self._stopping:
+                    self.log.warning(
+                        f"Failed to send {len(checkpoints)} checkpoints after {attempt} "
+                        f"attempts ({error}), giving up"
+                    )
+                    return
+                retry_in = self.retry_delay * 2 ** (attempt - 1)
+                self.log.warning(
+                    f"Failed to send {len(checkpoints)} checkpoints ({error}), "
+                    f"retrying in {retry_in} seconds"
+                )
+                try:
+                    # Stopping the dispatcher cuts the wait short for one last attempt
+                    await asyncio.wait_for(self._stop_event.wait(), retry_in)
+                except asyncio.TimeoutError:
+                    pass
+                attempt += 1
+                error = await self._post_batch(data)
+            self.log.debug(f"Successfully sent {len(checkpoints)} checkpoints")
+        finally:
+            self._retrying_batches -= 1
+
+
 CHECKPOINT_TYPES = {
     EventType.ROOM_REDACTION,
     EventType.ROOM_MESSAGE,
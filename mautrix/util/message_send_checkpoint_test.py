@@ -0,0 +1,153 @@
+# Copyright (c) 2026 Tulir Asokan
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+from __future__ import annotations
+
+import asyncio
+import logging
+
+from mautrix.types import EventType
+
+from .message_send_checkpoint import (
+    MessageSendCheckpoint,
+    MessageSendCheckpointDispatcher,
+    MessageSendCheckpointReportedBy,
+    MessageSendCheckpointStatus,
+    MessageSendCheckpointStep,
+)
+
+
+class FakeDispatcher(MessageSendCheckpointDispatcher):
+    def __init__(self, **kwargs) -> None:
+        super().__init__(
+            endpoint="https://example.com/checkpoints",
+            as_token="as_token",
+            log=logging.getLogger("mau.checkpoints.test"),
+            **kwargs,
+        )
+        self.posted: list[list[str]] = []
+        self.errors: list[str | None] = []
+        self.in_flight = 0
+        self.max_seen_in_flight = 0
+        self.unblock = asyncio.Event()
+        self.unblock.set()
+
+    async def _post_batch(self, data: dict) -> str | None:
+        self.in_flight += 1
+        self.max_seen_in_flight = max(self.max_seen_in_flight, self.in_flight)
+        try:
+            await self.unblock.wait()
+            self.posted.append([checkpoint["event_id"] for checkpoint in data["checkpoints"]])
+            return self.errors.pop(0) if self.errors else None
+        finally:
+            self.in_flight -= 1
+
+
+def make_checkpoint(i: int) -> MessageSendCheckpoint:
+    return MessageSendCheckpoint(
+        event_id=f"$event{i}",
+        room_id="!room:example.com",
+        step=MessageSendCheckpointStep.BRIDGE,
+        timestamp=i,
+        status=MessageSendCheckpointStatus.SUCCESS,
+        event_type=EventType.ROOM_MESSAGE,
+        reported_by=MessageSendCheckpointReportedBy.BRIDGE,
+    )
+
+
+async def test_coalesce_into_batches() -> None:
+    dispatcher = FakeDispatcher(max_delay=0.05, max_batch_size=3)
+    futures = [dispatcher.queue(make_checkpoint(i)) for i in range(7)]
+    await asyncio.wait_for(asyncio.gather(*futures), 5)
+    assert dispatcher.posted == [
+        ["$event0", "$event1", "$event2"],
+        ["$event3", "$event4", "$event5"],
+        ["$event6"],
+    ]
+
+
+async def test_in_flight_batches_bounded() -> None:
+    dispatcher = FakeDispatcher(
+        max_delay=0, max_batch_size=1, max_in_flight_batches=2, max_queue_size=3
+    )
+    dispatcher.unblock.clear()
+    futures = [dispatcher.queue(make_checkpoint(i)) for i in range(3)]
+    await asyncio.sleep(0.05)
+    # Two batches are in flight and the third one waits in the queue
+    assert dispatcher.in_flight == 2
+    assert len(dispatcher._batch_tasks) == 2
+    assert len(dispatcher._queue) == 1
+
+    futures += [dispatcher.queue(make_checkpoint(i)) for i in range(3, 6)]
+    # The queue only holds 3 checkpoints, so the oldest queued ones were dropped
+    assert dispatcher.dropped_checkpoints == 1
+    assert len(dispatcher._queue) == 3
+
+    dispatcher.unblock.set()
+    await asyncio.wait_for(asyncio.gather(*futures), 5)
+    assert dispatcher.max_seen_in_flight == 2
+    assert sorted(dispatcher.posted) == [
+        ["$event0"],
+        ["$event1"],
+        ["$event3"],
+        ["$event4"],
+        ["$event5"],
+    ]
+
+
+async def test_retry_with_backoff() -> None:
+    dispatcher = FakeDispatcher(max_delay=0, retry_delay=0.01, max_retries=3)
+    dispatcher.errors = ["HTTP 500", "HTTP 502", None]
+    start = asyncio.get_running_loop().time()
+    await asyncio.wait_for(dispatcher.send(make_checkpoint(1)), 5)
+    # Two retries, waiting 0.01 and 0.02 seconds
+    assert asyncio.get_running_loop().time() - start >= 0.03
+    assert dispatcher.posted == [["$event1"]] * 3
+    assert dispatcher._retrying_batches == 0
+
+
+async def test_retry_gives_up() -> None:
+    dispatcher = FakeDispatcher(max_delay=0, retry_delay=0.01, max_retries=2)
+    dispatcher.errors = ["HTTP 500"] * 10
+    await asyncio.wait_for(dispatcher.send(make_checkpoint(1)), 5)
+    assert len(dispatcher.posted) == 3
+    assert dispatcher._retrying_batches == 0
+
+
+async def test_retrying_batches_bounded() -> None:
+    dispatcher = FakeDispatcher(max_delay=0, max_batch_size=1, max_retrying_batches=1)
+    dispatcher.retry_delay = 60
+    dispatcher.errors = ["HTTP 500", "HTTP 500"]
+    first = dispatcher.queue(make_checkpoint(1))
+    await asyncio.sleep(0.05)
+    assert dispatcher._retrying_batches == 1
+    # The second batch fails too, but it's dropped since one batch is already retrying
+    await asyncio.wait_for(dispatcher.send(make_checkpoint(2)), 5)
+    assert not first.done()
+    await asyncio.wait_for(dispatcher.stop(), 5)
+    assert first.done()
+    assert dispatcher.posted == [["$event1"], ["$event2"], ["$event1"]]
+
+
+async def test_stop_flushes_queue() -> None:
+    dispatcher = FakeDispatcher(max_delay=60, max_batch_size=100)
+    futures = [dispatcher.queue(make_checkpoint(i)) for i in range(3)]
+    await asyncio.sleep(0.01)
+    assert not dispatcher.posted
+    await asyncio.wait_for(dispatcher.stop(), 5)
+    assert all(fut.done() for fut in futures)
+    assert dispatcher.posted == [["$event0", "$event1", "$event2"]]
+
+
+async def test_stop_cuts_retry_wait_short() -> None:
+    dispatcher = FakeDispatcher(max_delay=0, retry_delay=60, max_retries=5)
+    dispatcher.errors = ["HTTP 500"]
+    fut = dispatcher.queue(make_checkpoint(1))
+    await asyncio.sleep(0.05)
+    assert not fut.done()
+    # Stopping makes the retrying batch do one last attempt right away
+    await asyncio.wait_for(dispatcher.stop(), 5)
+    assert fut.done()
+    assert dispatcher.posted == [["$event1"], ["$event1"]]